@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ProjectsManagerConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "projects_manager"
+
+    def ready(self):
+        """Connect signal handlers."""
+        from projects_manager import signals  # noqa: F401
@@ -0,0 +1,289 @@
+"""
+Helpers to write and read the change log used by clients to sync.
+The change log is on the default database. Events of a change on another shard are
+inserted once the shard has committed (see sharding.on_shard_commit): if the process
+stops in between, the events are lost, but there is never an event for a change that
+was rolled back. reconcile() records the lost events again.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import chain
+
+from django.db.models import Max, Q
+
+from projects_manager import events, sharding
+from projects_manager.models import Project, Contributor, Issue, Comment, ChangeEvent
+
+# Events of the current batch() block
+current_batch = ContextVar("current_batch", default=None)
+
+
+class Batch:
+    """Events waiting for the end of a batch() block, by shard."""
+
+    def __init__(self):
+        self.events = {}
+        # Projects of the issues being deleted, for their comments
+        self.issue_projects = {}
+
+
+@contextmanager
+def batch():
+    """
+    Record the events of the block with one INSERT per shard at its end, e.g. for the
+    rows deleted in cascade with a project (see ChangeLogQuerySet). Nothing is
+    recorded if the block raises.
+    """
+    if current_batch.get() is not None:
+        yield
+        return
+    pending = Batch()
+    token = current_batch.set(pending)
+    try:
+        yield
+    finally:
+        current_batch.reset(token)
+    for shard, change_events in pending.events.items():
+        save_events(shard, change_events)
+
+
+def remember_issue(issue):
+    """Keep the project of an issue being deleted in a batch, for its comments."""
+    pending = current_batch.get()
+    if pending is not None:
+        pending.issue_projects[issue.id] = issue.project_id
+
+
+def get_project_id(instance):
+    """Return the id of the project an instance belongs to."""
+    if isinstance(instance, Project):
+        return instance.id
+    if isinstance(instance, (Contributor, Issue)):
+        return instance.project_id
+    # Comment: avoid a query if the issue is already loaded or being deleted
+    if Comment.issue.is_cached(instance):
+        return instance.issue.project_id
+    pending = current_batch.get()
+    if pending is not None and instance.issue_id in pending.issue_projects:
+        return pending.issue_projects[instance.issue_id]
+    return (
+        Issue.objects.using(sharding.shard_for_id(instance.issue_id))
+        .filter(id=instance.issue_id)
+        .values_list("project_id", flat=True)
+        .first()
+    )
+
+
+def snapshot(instance):
+    """Return the concrete fields of an instance as a dict (no m2m, no query)."""
+    return {
+        field.attname: field.value_from_object(instance)
+        for field in instance._meta.concrete_fields
+    }
+
+
+def build_event(instance, action):
+    """Return an unsaved ChangeEvent describing the action done on the instance."""
+    model = instance._meta.model_name
+    if isinstance(instance, Contributor):
+        return ChangeEvent(
+            action=action,
+            model=model,
+            object_id=instance.user_id,
+            project_id=instance.project_id,
+            user_id=instance.user_id,
+        )
+    return ChangeEvent(
+        action=action,
+        model=model,
+        object_id=instance.id,
+        project_id=get_project_id(instance),
+        # Deletions keep the author, who may see the object without being a
+        # contributor (e.g. in the event streams)
+        data=(
+            {"author_id": instance.author_id}
+            if action == "delete"
+            else snapshot(instance)
+        ),
+    )
+
+
+def save_events(shard, change_events):
+    """
+    Insert events with a single INSERT and publish them, once the shard of the
+    change has committed (or at the end of the current batch).
+    """
+    pending = current_batch.get()
+    if pending is not None:
+        pending.events.setdefault(shard, []).extend(change_events)
+        return
+
+    def insert():
+        events.publish_on_commit(ChangeEvent.objects.bulk_create(change_events))
+
+    if change_events:
+        sharding.on_shard_commit(shard, insert)
+
+
+def record(instance, action):
+    """Record a change on a single instance."""
+    event = build_event(instance, action)
+    save_events(instance._state.db, [event])
+    return event
+
+
+def record_many(instances, action):
+    """Record the same change on several instances (of the same shard) at once."""
+    instances = list(instances)
+    if instances:
+        save_events(
+            instances[0]._state.db,
+            [build_event(instance, action) for instance in instances],
+        )
+
+
+def record_contributors(project_id, user_ids, action):
+    """Record contributor changes for several users of a project at once."""
+    save_events(
+        sharding.shard_for_id(project_id),
+        [
+            ChangeEvent(
+                action=action,
+                model="contributor",
+                object_id=user_id,
+                project_id=project_id,
+                user_id=user_id,
+            )
+            for user_id in user_ids
+        ],
+    )
+
+
+def visible_events(user):
+    """
+    Events on projects where the user is author or contributor. Contributor events
+    about the user are always visible, so he knows when he loses access to a project.
+    Superusers and staff members can see all events.
+    """
+    if user.is_superuser or user.is_staff:
+        return ChangeEvent.objects.all()
+    return own_events(user)
+
+
+def own_events(user):
+    """
+    Events on projects where the user is author or contributor and contributor events
+    about the user, whether he is an admin or not.
+    """
+    projects = Project.objects.filter(Q(author=user) | Q(contributors=user)).values(
+        "id"
+    )
+    if sharding.is_enabled():
+        # The change log is on the default database, not next to the projects
+        projects = list(
+            chain.from_iterable(sharding.fan_out(projects.values_list("id", flat=True)))
+        )
+    return ChangeEvent.objects.filter(
+        Q(project_id__in=projects) | Q(model="contributor", user_id=user.id)
+    )
+
+
+def get_latest_events(model, object_ids):
+    """Return {object id: latest event} for objects of a model."""
+    latest_ids = (
+        ChangeEvent.objects.filter(
+            model=model._meta.model_name, object_id__in=object_ids
+        )
+        .values("object_id")
+        .annotate(latest=Max("id"))
+        .values("latest")
+    )
+    return {
+        event.object_id: event
+        for event in ChangeEvent.objects.filter(id__in=latest_ids)
+    }
+
+
+def reconcile(chunk_size=1000):
+    """
+    Record the events lost between the commit of a shard and their insertion:
+    creations and updates of projects, issues and comments whose latest event is
+    missing or has an older version, and deletions of those that no longer exist.
+    Objects created before the change log have no events and are skipped, and
+    contributors (without version) are not reconciled. An event being inserted
+    meanwhile may be recorded twice, clients handle it like any other update.
+    Return the number of events recorded.
+    """
+    start = ChangeEvent.objects.order_by("id").values_list("created_time").first()
+    if start is None:
+        return 0
+    recorded = 0
+    for model in (Project, Issue, Comment):
+        recorded += reconcile_objects(model, start[0], chunk_size)
+        recorded += reconcile_deletions(model, chunk_size)
+    return recorded
+
+
+def reconcile_objects(model, start, chunk_size):
+    """Record the lost creations and updates of a model, shard by shard."""
+    recorded = 0
+    for shard in sharding.get_shards():
+        objects = model.objects.using(shard).order_by("id")
+        if model is Comment:
+            objects = objects.select_related("issue")
+        last_id = 0
+        while chunk := list(objects.filter(id__gt=last_id)[:chunk_size]):
+            last_id = chunk[-1].id
+            latest = get_latest_events(model, [instance.id for instance in chunk])
+            created, updated = [], []
+            for instance in chunk:
+                event = latest.get(instance.id)
+                if event is None:
+                    if instance.created_time >= start:
+                        created.append(instance)
+                elif event.action != "delete":
+                    # Events recorded before versions were added can't be compared
+                    version = event.data.get("version")
+                    if version is not None and version < instance.version:
+                        updated.append(instance)
+            record_many(created, "create")
+            record_many(updated, "update")
+            recorded += len(created) + len(updated)
+    return recorded
+
+
+def reconcile_deletions(model, chunk_size):
+    """Record the lost deletions of a model."""
+    recorded = 0
+    object_ids = (
+        ChangeEvent.objects.filter(model=model._meta.model_name)
+        .values_list("object_id", flat=True)
+        .distinct()
+        .order_by("object_id")
+    )
+    last_id = 0
+    while chunk := list(object_ids.filter(object_id__gt=last_id)[:chunk_size]):
+        last_id = chunk[-1]
+        existing = set()
+        for shard, ids in sharding.group_by_shard(model, chunk).items():
+            if shard is not None:
+                existing.update(
+                    model.objects.using(shard)
+                    .filter(id__in=ids)
+                    .values_list("id", flat=True)
+                )
+        missing = set(chunk) - existing
+        deleted = [
+            ChangeEvent(
+                action="delete",
+                model=event.model,
+                object_id=event.object_id,
+                project_id=event.project_id,
+                data={"author_id": (event.data or {}).get("author_id")},
+            )
+            for event in get_latest_events(model, missing).values()
+            if event.action != "delete"
+        ]
+        save_events(None, deleted)
+        recorded += len(deleted)
+    return recorded
@@ -0,0 +1,135 @@
+"""
+Cloning of projects (e.g. templates): the contributors, issues and assignees of a
+project are copied with one INSERT ... SELECT statement each, on the shard of the
+source project, whatever the number of issues. The new issues are authored by the
+user cloning the project and keep their order in the backlog (rank). Issue names
+are unique in a project: if the source has several issues with the same name, only
+the oldest one is copied, and the copies of the assignees are matched to the new
+issues by name.
+No signal is sent for the copied rows, so the counters, change log, workload and
+inbox are updated here.
+"""
+from django.db import connections, transaction
+from django.utils import timezone
+
+from projects_manager import changes, counters, inbox, workload
+from projects_manager.models import Project, Contributor, Issue
+
+Assignment = Issue.assignees.through
+
+
+def get_tables(connection):
+    """Return the tables of the models copied, quoted."""
+    return {
+        name: connection.ops.quote_name(model._meta.db_table)
+        for name, model in [
+            ("contributor", Contributor),
+            ("issue", Issue),
+            ("assignment", Assignment),
+            ("user", Contributor.user.field.related_model),
+        ]
+    }
+
+
+def copy_contributors(cursor, tables, source, project, now):
+    """Copy the active contributors of the source, return their ids."""
+    cursor.execute(
+        f"""
+        INSERT INTO {tables["contributor"]} (user_id, project_id, created_time)
+        SELECT c.user_id, %s, %s
+        FROM {tables["contributor"]} c
+        JOIN {tables["user"]} u ON u.id = c.user_id
+        WHERE c.project_id = %s AND u.is_active = %s AND c.user_id <> %s
+        """,
+        [project.id, now, source.id, True, project.author_id],
+    )
+    return list(
+        Contributor.objects.using(project._state.db)
+        .filter(project=project)
+        .exclude(user_id=project.author_id)
+        .values_list("user_id", flat=True)
+    )
+
+
+def copy_issues(cursor, tables, source, project, now):
+    """Copy the issues of the source (one by name), return how many were copied."""
+    cursor.execute(
+        f"""
+        INSERT INTO {tables["issue"]} (
+            name, description, type, priority, status, project_id, author_id,
+            created_time, comments_count, last_activity_time, version, rank
+        )
+        SELECT name, description, type, priority, status, %s, %s, %s, 0, %s, 1, rank
+        FROM {tables["issue"]}
+        WHERE id IN (
+            SELECT MIN(id) FROM {tables["issue"]} WHERE project_id = %s GROUP BY name
+        )
+        """,
+        [project.id, project.author_id, now, now, source.id],
+    )
+    return cursor.rowcount
+
+
+def copy_assignees(cursor, tables, source, project):
+    """Copy the assignees of the issues who are contributors of the new project."""
+    cursor.execute(
+        f"""
+        INSERT INTO {tables["assignment"]} (issue_id, user_id)
+        SELECT new.id, a.user_id
+        FROM {tables["assignment"]} a
+        JOIN {tables["issue"]} old ON old.id = a.issue_id
+        JOIN {tables["issue"]} new ON new.project_id = %s AND new.name = old.name
+        JOIN {tables["contributor"]} c ON c.project_id = %s AND c.user_id = a.user_id
+        WHERE old.id IN (
+            SELECT MIN(id) FROM {tables["issue"]} WHERE project_id = %s GROUP BY name
+        )
+        """,
+        [project.id, project.id, source.id],
+    )
+    return cursor.rowcount
+
+
+def clone_project(source, user, name, description=None, type=None, **options):
+    """
+    Create a copy of the source project authored by the user, on the same shard.
+    Options (booleans): contributors (default True), issues (default True),
+    assignees (default False, needs contributors and issues) and is_template.
+    Return the new project and the number of issues copied.
+    """
+    shard = source._state.db
+    with_contributors = options.get("contributors", True)
+    with_issues = options.get("issues", True)
+    with_assignees = options.get("assignees", False)
+    connection = connections[shard]
+    with transaction.atomic(using=shard), transaction.atomic():
+        project = Project.objects.using(shard).create(
+            name=name,
+            description=source.description if description is None else description,
+            type=source.type if type is None else type,
+            author=user,
+            is_template=options.get("is_template", False),
+        )
+        project.contributors.add(user.id)
+
+        # With USE_TZ, datetimes are stored as the database expects them
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        tables = get_tables(connection)
+        issues_copied = 0
+        with connection.cursor() as cursor:
+            if with_contributors:
+                user_ids = copy_contributors(cursor, tables, source, project, now)
+                counters.add_contributors(project.id, len(user_ids))
+                changes.record_contributors(project.id, user_ids, "create")
+            if with_issues:
+                issues_copied = copy_issues(cursor, tables, source, project, now)
+                counters.add_issues(project.id, issues_copied)
+            if with_contributors and with_issues and with_assignees:
+                copy_assignees(cursor, tables, source, project)
+
+        if issues_copied:
+            issues = Issue.objects.using(shard).filter(project=project)
+            changes.record_many(issues, "create")
+            inbox.schedule_issues(shard, issues.values_list("id", flat=True))
+            workload.schedule_assignments(shard, issue__project=project)
+        project.refresh_from_db(fields=Project.COUNTER_FIELDS)
+    return project, issues_copied
@@ -0,0 +1,94 @@
+"""
+Denormalized counters on projects and issues. They are updated atomically in the
+database with F() expressions, so concurrent requests don't lose increments. The
+counters can be rebuilt with the reconcile_counters management command.
+"""
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from projects_manager import sharding
+from projects_manager.models import Project, Contributor, Issue, Comment
+
+
+def add_issues(project_id, count=1):
+    """Add count (can be negative) to the issues count of a project."""
+    _add(_get(Project, project_id), "issues_count", count)
+
+
+def add_contributors(project_id, count=1):
+    """Add count (can be negative) to the contributors count of a project."""
+    _add(_get(Project, project_id), "contributors_count", count)
+
+
+def add_comments(issue_id, count=1):
+    """Add count (can be negative) to the comments count of an issue."""
+    _add(
+        _get(Issue, issue_id),
+        "comments_count",
+        count,
+        last_activity_time=timezone.now(),
+    )
+
+
+def _get(model, pk):
+    """Queryset of the object with the given pk, on its shard."""
+    return model.objects.using(sharding.shard_for_id(pk)).filter(id=pk)
+
+
+def _add(queryset, field, count, **extra):
+    """Update the counter with a single UPDATE, never going below 0."""
+    if count < 0:
+        queryset = queryset.filter(**{f"{field}__gte": -count})
+    queryset.update(**{field: F(field) + count}, **extra)
+
+
+def _count(model, field):
+    """Subquery counting the rows of model related to the outer row by field."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def reconcile():
+    """
+    Recompute the counters from the actual rows and fix the ones that drifted, on
+    every shard. Return the number of projects and issues fixed.
+    """
+    projects_fixed = issues_fixed = 0
+    for shard in sharding.get_shards():
+        with sharding.use_shard(shard):
+            projects, issues = reconcile_shard()
+        projects_fixed += projects
+        issues_fixed += issues
+    return projects_fixed, issues_fixed
+
+
+def reconcile_shard():
+    """Reconcile the counters of the current shard."""
+    projects = Project.objects.annotate(
+        actual_issues=_count(Issue, "project"),
+        actual_contributors=_count(Contributor, "project"),
+    ).filter(
+        ~Q(issues_count=F("actual_issues"))
+        | ~Q(contributors_count=F("actual_contributors"))
+    )
+    projects_fixed = Project.objects.filter(id__in=projects.values("id")).update(
+        issues_count=_count(Issue, "project"),
+        contributors_count=_count(Contributor, "project"),
+    )
+
+    issues = Issue.objects.annotate(actual_comments=_count(Comment, "issue")).filter(
+        ~Q(comments_count=F("actual_comments"))
+    )
+    issues_fixed = Issue.objects.filter(id__in=issues.values("id")).update(
+        comments_count=_count(Comment, "issue")
+    )
+    return projects_fixed, issues_fixed
@@ -0,0 +1,212 @@
+"""
+Live events of a project (server-sent events, served under ASGI). The change log
+events on issues, comments and contributors are published after commit to an
+in-process broker, which pushes them to the event loop of each subscriber. Queues
+are bounded: a subscriber too slow to keep up is sent an `overflow` event and
+disconnected instead of slowing down the requests publishing the events, the
+client then syncs with /api/changes/ and reconnects.
+"""
+import asyncio
+import threading
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from rest_framework.renderers import JSONRenderer
+
+from projects_manager import sharding
+from projects_manager.models import Project, Contributor, ChangeEvent
+from projects_manager.serializers import ChangeEventSerializer
+
+DEFAULTS = {
+    "QUEUE_SIZE": 100,  # events waiting to be sent to a subscriber
+    "HEARTBEAT": 15,  # seconds between keep-alive comments
+    "MAX_DURATION": 300,  # seconds before the client has to reconnect
+    "REPLAY_LIMIT": 500,  # events sent again to a client reconnecting
+}
+
+STREAMED_MODELS = ["issue", "comment", "contributor"]
+
+# Put in the queue of a subscriber that can't keep up
+OVERFLOW = object()
+
+
+def get_setting(name):
+    """Return an EVENT_STREAMS setting."""
+    return getattr(settings, "EVENT_STREAMS", {}).get(name, DEFAULTS[name])
+
+
+class Subscription:
+    """A client listening to the events of a project, in an event loop."""
+
+    def __init__(self, project_id, user, contributor):
+        self.project_id = project_id
+        self.user_id = user.id
+        self.staff = user.is_superuser or user.is_staff
+        self.contributor = contributor
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=get_setting("QUEUE_SIZE"))
+        self.overflowed = False
+
+    def push(self, event):
+        """Add an event to the queue, called in the event loop of the subscriber."""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            # The client has to sync anyway, make room for the overflow marker
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+    def accept(self, event):
+        """
+        Return True if the user can see the event, with the visibility rules of the
+        issues and comments endpoints. Contributor events keep track of his access,
+        and are sent to him like in the change feed.
+        """
+        if event["model"] == "contributor" and event["user_id"] == self.user_id:
+            self.contributor = event["action"] != "delete"
+            return True
+        return self.staff or self.contributor or event["author_id"] == self.user_id
+
+
+class Broker:
+    """In-process publish/subscribe of events by project."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}  # project id -> set of subscriptions
+
+    def subscribe(self, project_id, user, contributor):
+        subscription = Subscription(project_id, user, contributor)
+        with self.lock:
+            self.subscriptions.setdefault(project_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.project_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscriptions.pop(subscription.project_id, None)
+
+    def has_subscribers(self, project_id):
+        return project_id in self.subscriptions
+
+    def publish(self, project_id, event):
+        """Push an event to the subscribers of a project, from any thread."""
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(project_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.push, event)
+            except RuntimeError:  # the event loop is closed
+                self.unsubscribe(subscription)
+
+
+broker = Broker()
+
+
+def to_event(change):
+    """Return the event sent to subscribers for a ChangeEvent."""
+    data = change.data or {}
+    return {
+        "id": change.id,
+        "name": f"{change.model}.{change.action}",
+        "model": change.model,
+        "action": change.action,
+        "user_id": change.user_id,
+        "author_id": data.get("author_id"),
+        "text": JSONRenderer().render(ChangeEventSerializer(change).data).decode(),
+    }
+
+
+def publish_on_commit(changes):
+    """Publish the ChangeEvents of projects with subscribers after commit."""
+    changes = [
+        change
+        for change in changes
+        if change.model in STREAMED_MODELS and broker.has_subscribers(change.project_id)
+    ]
+    if changes:
+        transaction.on_commit(partial(publish, changes))
+
+
+def publish(changes):
+    """Publish ChangeEvents to the subscribers of their project."""
+    for change in changes:
+        broker.publish(change.project_id, to_event(change))
+
+
+def get_access(user, project_id):
+    """
+    Return None if the user can't see the project, else whether he is a contributor
+    (he can see all its issues and comments).
+    """
+    shard = sharding.shard_for_id(project_id)
+    projects = Project.objects.using(shard).filter(id=project_id)
+    if not (user.is_superuser or user.is_staff):
+        projects = projects.filter(Q(author=user) | Q(contributors=user))
+    if not projects.exists():
+        return None
+    return (
+        Contributor.objects.using(shard)
+        .filter(project_id=project_id, user=user)
+        .exists()
+    )
+
+
+def get_replay(project_id, last_event_id):
+    """
+    Return the events after last_event_id, and whether there were too many to be
+    sent again (the client has to sync with the change feed instead).
+    """
+    limit = get_setting("REPLAY_LIMIT")
+    changes = list(
+        ChangeEvent.objects.filter(
+            project_id=project_id, id__gt=last_event_id, model__in=STREAMED_MODELS
+        ).order_by("id")[: limit + 1]
+    )
+    return [to_event(change) for change in changes[:limit]], len(changes) > limit
+
+
+def format_event(event):
+    """Return an event in the text/event-stream format."""
+    return f"id: {event['id']}\nevent: {event['name']}\ndata: {event['text']}\n\n"
+
+
+async def stream(subscription, replay=(), overflowed=False):
+    """Yield the events of a subscription, until it overflows or expires."""
+    loop = asyncio.get_running_loop()
+    end = loop.time() + get_setting("MAX_DURATION")
+    replayed_id = 0
+    try:
+        yield "retry: 3000\n\n"
+        for event in replay:
+            replayed_id = event["id"]
+            if subscription.accept(event):
+                yield format_event(event)
+        if overflowed:
+            yield "event: overflow\ndata: {}\n\n"
+            return
+        while loop.time() < end:
+            try:
+                event = await asyncio.wait_for(
+                    subscription.queue.get(),
+                    min(get_setting("HEARTBEAT"), end - loop.time()),
+                )
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if event is OVERFLOW:
+                yield "event: overflow\ndata: {}\n\n"
+                return
+            # Events published while the replay was read are already sent
+            if event["id"] > replayed_id and subscription.accept(event):
+                yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
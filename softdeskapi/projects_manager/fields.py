@@ -0,0 +1,71 @@
+"""Related fields fetching their objects through the request loader."""
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+from projects_manager.loaders import get_loader, to_pk
+
+
+class LoaderManyRelatedField(serializers.ManyRelatedField):
+    """Fetch all the related objects of the list at once."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, "__iter__"):
+            self.fail("not_a_list", input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail("empty")
+        return self.child_relation.to_internal_value_many(list(data))
+
+
+class LoaderPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField using the request loader."""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        """Same as RelatedField.many_init, but with a LoaderManyRelatedField."""
+        list_kwargs = {"child_relation": cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return LoaderManyRelatedField(**list_kwargs)
+
+    def to_internal_value(self, data):
+        return self.to_internal_value_many([data])[0]
+
+    def to_internal_value_many(self, data):
+        """Return the objects of the list of pks, loaded with one query at most."""
+        if "request" not in self.context:
+            return [
+                super(LoaderPrimaryKeyRelatedField, self).to_internal_value(pk)
+                for pk in data
+            ]
+        if self.pk_field is not None:
+            data = [self.pk_field.to_internal_value(pk) for pk in data]
+        for pk in data:
+            if isinstance(pk, bool):
+                self.fail("incorrect_type", data_type=type(pk).__name__)
+        queryset = self.get_queryset()
+        model = queryset.model
+        loader = get_loader(self.context["request"])
+        try:
+            found = loader.get_many(model, data, queryset)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data[0]).__name__)
+        instances = []
+        for pk in data:
+            instance = found.get(to_pk(model, pk))
+            if instance is None:
+                self.fail("does_not_exist", pk_value=pk)
+            instances.append(instance)
+        return instances
+
+
+class LoaderHyperlinkedRelatedField(serializers.HyperlinkedRelatedField):
+    """HyperlinkedRelatedField using the request loader when looking up by pk."""
+
+    def get_object(self, view_name, view_args, view_kwargs):
+        if self.lookup_field != "pk" or "request" not in self.context:
+            return super().get_object(view_name, view_args, view_kwargs)
+        queryset = self.get_queryset()
+        return get_loader(self.context["request"]).get(
+            queryset.model, view_kwargs[self.lookup_url_kwarg], queryset
+        )
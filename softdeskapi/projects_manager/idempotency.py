@@ -0,0 +1,134 @@
+"""
+Idempotency-Key header on the create endpoints. Clients retrying a POST (after a
+timeout for instance) send the same key: the response of the first request is
+returned again, without running the validation and the writes a second time.
+Keys are scoped to the user, stored with a fingerprint of the request and expire
+after the TTL of the IDEMPOTENCY setting (see the purge_idempotency_keys command).
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from projects_manager.models import IdempotencyKey
+
+DEFAULTS = {
+    "TTL": 24 * 3600,  # seconds
+}
+
+HEADER = "Idempotency-Key"
+
+
+def get_setting(name):
+    """Return an IDEMPOTENCY setting."""
+    return getattr(settings, "IDEMPOTENCY", {}).get(name, DEFAULTS[name])
+
+
+def get_expiry():
+    """Return the creation time before which keys are expired."""
+    return timezone.now() - timedelta(seconds=get_setting("TTL"))
+
+
+def get_fingerprint(request):
+    """Return a hash of the method, path and body of a request."""
+    data = request.data
+    if hasattr(data, "lists"):  # form data, keep every value
+        data = dict(data.lists())
+    body = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(
+        f"{request.method} {request.path}\n{body}".encode()
+    ).hexdigest()
+
+
+def claim(user, key, fingerprint):
+    """
+    Store the key as in progress and return it, None if it is already used (by this
+    request being sent again, or by another one).
+    """
+    IdempotencyKey.objects.filter(
+        user=user, key=key, created_time__lt=get_expiry()
+    ).delete()
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                user=user, key=key, fingerprint=fingerprint
+            )
+    except IntegrityError:
+        return None
+
+
+def get_replay(user, key, fingerprint):
+    """Return the response to send for a key already used."""
+    entry = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if entry is None or entry.status_code is None:
+        # in progress, or just rolled back: the client can retry later
+        return Response(
+            {"detail": f"A request with this {HEADER} is in progress."},
+            status=status.HTTP_409_CONFLICT,
+        )
+    if entry.fingerprint != fingerprint:
+        return Response(
+            {"detail": f"This {HEADER} was used for a different request."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(
+        entry.response,
+        status=entry.status_code,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def idempotent(create):
+    """
+    Decorator of the create() method of viewsets, to honor the Idempotency-Key
+    header. Only successful responses are stored: after an error, the client can
+    send the request again with the same key.
+    """
+
+    @wraps(create)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None or not request.user.is_authenticated:
+            return create(view, request, *args, **kwargs)
+        if not key or len(key) > IdempotencyKey._meta.get_field("key").max_length:
+            return Response(
+                {"detail": f"{HEADER} must be 1 to 255 characters long."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        fingerprint = get_fingerprint(request)
+        entry = claim(request.user, key, fingerprint)
+        if entry is None:
+            response = get_replay(request.user, key, fingerprint)
+            if status.is_success(response.status_code):
+                for name, value in view.get_success_headers(response.data).items():
+                    response[name] = value
+            return response
+        try:
+            response = create(view, request, *args, **kwargs)
+        except Exception:
+            # In a transaction (ATOMIC_REQUESTS), the key is rolled back with the rest
+            if not transaction.get_connection().in_atomic_block:
+                entry.delete()
+            raise
+        if not status.is_success(response.status_code):
+            entry.delete()
+            return response
+        entry.status_code = response.status_code
+        entry.response = response.data
+        entry.save(update_fields=["status_code", "response"])
+        return response
+
+    return wrapper
+
+
+def purge_expired():
+    """Delete the expired keys, return how many were deleted."""
+    deleted, _ = IdempotencyKey.objects.filter(created_time__lt=get_expiry()).delete()
+    return deleted
@@ -0,0 +1,116 @@
+"""
+Inbox of users: the open issues each user is assigned to or is the author of, by
+priority (highest first) then age (oldest first). InboxEntry rows are stored on the
+shard of their issue and refreshed for the issues affected by a change once the
+transaction is committed, so the inbox endpoint reads one range of an index per
+shard instead of filtering issues on their assignees and author.
+"""
+import base64
+import heapq
+import json
+from datetime import datetime
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Q
+
+from projects_manager import sharding
+from projects_manager.models import InboxEntry, Issue
+
+# Rank of the priorities in the inbox, highest priority first
+PRIORITY_RANKS = {"high": 0, "medium": 1, "low": 2}
+
+INBOX_FIELDS = ["project", "name", "priority", "priority_rank", "status"]
+
+
+def schedule_issues(shard, issue_ids):
+    """Refresh the inbox entries of issues after commit."""
+    issue_ids = set(issue_ids)
+    if issue_ids:
+        transaction.on_commit(partial(refresh, shard, issue_ids), using=shard)
+
+
+def get_entries(issue):
+    """Return the inbox entries an issue should have."""
+    if issue.status == "finished":
+        return []
+    assignee_ids = {user.id for user in issue.assignees.all()}
+    user_ids = assignee_ids | ({issue.author_id} if issue.author_id else set())
+    return [
+        InboxEntry(
+            user_id=user_id,
+            issue_id=issue.id,
+            project_id=issue.project_id,
+            name=issue.name,
+            priority=issue.priority,
+            priority_rank=PRIORITY_RANKS[issue.priority],
+            status=issue.status,
+            issue_created_time=issue.created_time,
+            assigned=user_id in assignee_ids,
+            authored=user_id == issue.author_id,
+        )
+        for user_id in user_ids
+    ]
+
+
+def refresh(shard, issue_ids):
+    """Recompute the inbox entries of issues (deleted issues have none left)."""
+    issues = Issue.objects.using(shard).filter(id__in=issue_ids)
+    entries = [
+        entry
+        for issue in issues.prefetch_related("assignees")
+        for entry in get_entries(issue)
+    ]
+    with transaction.atomic(using=shard):
+        InboxEntry.objects.using(shard).filter(issue_id__in=issue_ids).delete()
+        InboxEntry.objects.using(shard).bulk_create(
+            entries,
+            update_conflicts=True,
+            unique_fields=["user", "issue"],
+            update_fields=[*INBOX_FIELDS, "assigned", "authored"],
+        )
+
+
+def get_key(entry):
+    """Return the position of an entry in the inbox order."""
+    return (entry.priority_rank, entry.issue_created_time, entry.issue_id)
+
+
+def encode_cursor(entry):
+    """Return an opaque cursor to the entries after an entry."""
+    key = [entry.priority_rank, entry.issue_created_time.isoformat(), entry.issue_id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the key of a cursor, ValueError if it is not valid."""
+    try:
+        rank, created_time, issue_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return int(rank), datetime.fromisoformat(created_time), int(issue_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as error:
+        raise ValueError("invalid cursor") from error
+
+
+def get_page(user, after=None, limit=50):
+    """
+    Return the inbox entries of a user after the `after` key, at most limit + 1 (the
+    last one only tells if there are more). Each shard returns its first entries in
+    the inbox order, from the index on (user, priority_rank, issue_created_time,
+    issue), and they are merged.
+    """
+    entries = InboxEntry.objects.filter(user_id=user.id)
+    if after is not None:
+        rank, created_time, issue_id = after
+        entries = entries.filter(
+            Q(priority_rank__gt=rank)
+            | Q(priority_rank=rank, issue_created_time__gt=created_time)
+            | Q(
+                priority_rank=rank,
+                issue_created_time=created_time,
+                issue_id__gt=issue_id,
+            )
+        )
+    entries = entries.order_by("priority_rank", "issue_created_time", "issue_id")[
+        : limit + 1
+    ]
+    return list(heapq.merge(*sharding.fan_out(entries), key=get_key))[: limit + 1]
@@ -0,0 +1,120 @@
+"""
+Request-scoped identity map. Views, permissions and serializers of a same request
+often need the same project, issue or users: the loader attached to the request
+fetches each of them at most once, and fetches several missing ones with one query.
+"""
+from django.core.exceptions import ValidationError
+
+from projects_manager import sharding
+from projects_manager.models import Contributor, Issue
+
+
+def to_pk(model, value):
+    """Convert a value to a pk of model, raise ValueError if it's not valid."""
+    try:
+        return model._meta.pk.to_python(value)
+    except ValidationError as error:
+        raise ValueError(error.messages[0]) from error
+
+
+class RequestLoader:
+    """Identity map of the objects loaded during a request."""
+
+    def __init__(self):
+        # (model, scope, pk) -> instance, or None if it doesn't exist (in the scope)
+        self.objects = {}
+        self.contributors = {}  # project id -> set of contributors ids
+        self.assignees = {}  # issue id -> set of assignees ids
+        # Debug counters: queries run and lookups answered without a query
+        self.queries = 0
+        self.hits = 0
+
+    def prime(self, *instances):
+        """Add already loaded instances to the identity map."""
+        for instance in instances:
+            self.objects[(instance._meta.model, None, instance.pk)] = instance
+
+    def get_scope(self, model, queryset):
+        """
+        Return the key of the rows queryset can return: its SQL, or None for all the
+        rows of the model. An instance loaded without restriction isn't returned for a
+        restricted queryset (e.g. filtered by permissions), it is loaded again.
+        """
+        if queryset is None:
+            return None
+        scope = str(queryset.query)
+        return None if scope == str(model._default_manager.all().query) else scope
+
+    def get_many(self, model, pks, queryset=None):
+        """
+        Return a dict {pk: instance} of the instances found, loading the missing ones
+        from queryset (default manager if not provided) with a single query per shard.
+        """
+        pks = [to_pk(model, pk) for pk in pks]
+        if queryset is not None and queryset.query.is_empty():
+            return {}
+        scope = self.get_scope(model, queryset)
+        missing = {pk for pk in pks if (model, scope, pk) not in self.objects}
+        self.hits += len(pks) - len(missing)
+        if missing:
+            if queryset is None:
+                queryset = model._default_manager.all()
+            found = {}
+            for shard, shard_pks in sharding.group_by_shard(model, missing).items():
+                found.update(queryset.using(shard).in_bulk(shard_pks))
+                self.queries += 1
+            for pk in missing:
+                self.objects[(model, scope, pk)] = found.get(pk)
+            # Rows found in a restricted scope exist, without restriction too
+            self.prime(*found.values())
+        instances = {pk: self.objects[(model, scope, pk)] for pk in pks}
+        return {pk: instance for pk, instance in instances.items() if instance}
+
+    def get(self, model, pk, queryset=None):
+        """Return the instance with the given pk, or raise model.DoesNotExist."""
+        pk = to_pk(model, pk)
+        instance = self.get_many(model, [pk], queryset).get(pk)
+        if instance is None:
+            raise model.DoesNotExist(f"{model.__name__} {pk} not found")
+        return instance
+
+    def contributor_ids(self, project_id):
+        """Return the ids of the contributors of a project."""
+        if project_id in self.contributors:
+            self.hits += 1
+        else:
+            self.contributors[project_id] = set(
+                Contributor.objects.using(sharding.shard_for_id(project_id))
+                .filter(project_id=project_id)
+                .values_list("user_id", flat=True)
+            )
+            self.queries += 1
+        return self.contributors[project_id]
+
+    def assignee_ids(self, issue_id):
+        """Return the ids of the assignees of an issue."""
+        if issue_id in self.assignees:
+            self.hits += 1
+        else:
+            self.assignees[issue_id] = set(
+                Issue.assignees.through.objects.using(sharding.shard_for_id(issue_id))
+                .filter(issue_id=issue_id)
+                .values_list("user_id", flat=True)
+            )
+            self.queries += 1
+        return self.assignees[issue_id]
+
+
+def get_loader(request):
+    """
+    Return the loader of a request (Django or DRF request). It is normally attached by
+    RequestLoaderMiddleware, but is created here if missing (e.g. in tests).
+    """
+    http_request = getattr(request, "_request", request)
+    loader = getattr(http_request, "loader", None)
+    if loader is None:
+        loader = http_request.loader = RequestLoader()
+    # The authenticated user of a DRF request is already loaded
+    if request is not http_request and request.user.is_authenticated:
+        loader.prime(request.user)
+    return loader
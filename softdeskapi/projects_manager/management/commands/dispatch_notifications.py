@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from projects_manager.notifications import dispatch_pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver the pending notifications of the outbox. Use it to resume deliveries "
+        "after a restart, notifications are otherwise dispatched in the background."
+    )
+
+    def handle(self, *args, **options):
+        delivered, failed = dispatch_pending()
+        self.stdout.write(f"{delivered} notification(s) delivered, {failed} failed")
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from projects_manager import sharding
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Prepare the shards of the PROJECT_SHARDS setting: migrate them, start the "
+        "ids of each shard in its own range and copy the users to the shards. Can be "
+        "run again after adding a shard at the end of the list."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--skip-migrate", action="store_true", help="Don't migrate the shards"
+        )
+
+    def handle(self, *args, **options):
+        span = sharding.get_id_span()
+        for index, shard in enumerate(sharding.get_shards()):
+            if not options["skip_migrate"]:
+                # Data migrations without using() are routed to the current shard
+                with sharding.use_shard(shard):
+                    call_command("migrate", database=shard, verbosity=0)
+            if index:
+                sharding.init_sequences(shard, index * span)
+            self.stdout.write(f"{shard}: ids from {index * span + 1}")
+
+        users = list(User.objects.all())
+        sharding.mirror_users(users)
+        self.stdout.write(f"{len(users)} user(s) copied to the shards")
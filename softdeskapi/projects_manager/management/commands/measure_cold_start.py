@@ -0,0 +1,87 @@
+import json
+import os
+import subprocess
+import sys
+from statistics import median
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Run in a fresh interpreter: load the WSGI application and time the first request
+PROBE = """
+import io, json, sys, time
+start = time.perf_counter()
+from wsgiref.util import setup_testing_defaults
+from softdeskapi.wsgi import application
+loaded = time.perf_counter()
+environ = {
+    "PATH_INFO": sys.argv[1],
+    "REQUEST_METHOD": "GET",
+    "wsgi.input": io.BytesIO(),
+}
+if sys.argv[2]:
+    environ["HTTP_AUTHORIZATION"] = "Bearer " + sys.argv[2]
+setup_testing_defaults(environ)
+statuses = []
+first = None
+for i in range(2):
+    request_start = time.perf_counter()
+    response = application(environ, lambda status, headers: statuses.append(status))
+    b"".join(response)
+    response.close()
+    if first is None:
+        first = time.perf_counter() - request_start
+        first_response = time.perf_counter() - start
+second = time.perf_counter() - request_start
+print(json.dumps({
+    "boot": loaded - start,
+    "first_request": first,
+    "second_request": second,
+    "to_first_response": first_response,
+    "status": statuses[0],
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the cold start of a worker: time to load the application and to "
+        "serve the first response, with and without the warm-up at boot."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="/api/projects/")
+        parser.add_argument("--token", default="", help="JWT access token to use")
+        parser.add_argument("--runs", type=int, default=5)
+
+    def probe(self, path, token, warmup):
+        """Start a new interpreter and return its measures."""
+        env = {**os.environ, "SOFTDESK_WARMUP": "1" if warmup else "0"}
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE, path, token],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        for warmup in (False, True):
+            runs = [
+                self.probe(options["path"], options["token"], warmup)
+                for _ in range(options["runs"])
+            ]
+            self.stdout.write(
+                f"warm-up {'on ' if warmup else 'off'} ({runs[0]['status']}): "
+                + ", ".join(
+                    f"{measure} {median(run[measure] for run in runs) * 1000:.1f}ms"
+                    for measure in (
+                        "boot",
+                        "first_request",
+                        "second_request",
+                        "to_first_response",
+                    )
+                )
+            )
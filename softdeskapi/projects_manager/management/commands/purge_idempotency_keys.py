@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from projects_manager.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the expired Idempotency-Key responses. Expired keys are otherwise only "
+        "replaced when they are used again, run it periodically (e.g. with cron)."
+    )
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(f"{deleted} expired idempotency key(s) deleted")
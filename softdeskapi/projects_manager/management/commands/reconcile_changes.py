@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from projects_manager.changes import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Record the change events lost when a process stopped between the commit of "
+        "a shard and the insertion of its events in the change log."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        recorded = reconcile(chunk_size=options["chunk_size"])
+        self.stdout.write(f"{recorded} event(s) recorded")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from projects_manager.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the issues, contributors and comments counters of projects and "
+        "issues from the actual rows, and fix the ones that drifted."
+    )
+
+    def handle(self, *args, **options):
+        projects_fixed, issues_fixed = reconcile()
+        self.stdout.write(
+            f"{projects_fixed} project(s) and {issues_fixed} issue(s) fixed"
+        )
@@ -0,0 +1,69 @@
+import math
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand
+
+from softdeskapi.slow_queries import read_entries
+
+
+def percentile(durations, rank):
+    """Return the nearest-rank percentile of sorted durations."""
+    return durations[max(0, math.ceil(rank / 100 * len(durations)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Show the slow queries of the log, grouped by fingerprint (same normalized "
+        "SQL), with their count, total duration and percentiles, in milliseconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sort", choices=["count", "total", "p95", "max"], default="total"
+        )
+        parser.add_argument("--limit", type=int, default=10)
+
+    def handle(self, *args, **options):
+        groups = defaultdict(list)
+        for entry in read_entries():
+            groups[entry["fingerprint"]].append(entry)
+        if not groups:
+            self.stdout.write("No slow queries logged")
+            return
+
+        stats = []
+        for fingerprint, entries in groups.items():
+            durations = sorted(entry["duration_ms"] for entry in entries)
+            stats.append(
+                {
+                    "fingerprint": fingerprint,
+                    "count": len(durations),
+                    "total": sum(durations),
+                    "p50": percentile(durations, 50),
+                    "p95": percentile(durations, 95),
+                    "max": durations[-1],
+                    "views": Counter(entry["view"] for entry in entries),
+                    "origins": Counter(entry["origin"] for entry in entries),
+                    # the last entry has the most recent plan
+                    "last": entries[-1],
+                }
+            )
+        stats.sort(key=lambda stat: stat[options["sort"]], reverse=True)
+
+        for stat in stats[: options["limit"]]:
+            self.stdout.write(
+                f"[{stat['fingerprint']}] {stat['count']} queries, "
+                f"total {stat['total']:.0f}, p50 {stat['p50']:.0f}, "
+                f"p95 {stat['p95']:.0f}, max {stat['max']:.0f}"
+            )
+            self.stdout.write(f"  SQL: {stat['last']['sql']}")
+            self.stdout.write(f"  Last params: {stat['last']['params']}")
+            for view, count in stat["views"].most_common(3):
+                self.stdout.write(f"  View: {view} ({count})")
+            for origin, count in stat["origins"].most_common(3):
+                self.stdout.write(f"  From: {origin} ({count})")
+            if stat["last"]["plan"]:
+                self.stdout.write("  Plan:")
+                for line in stat["last"]["plan"].splitlines():
+                    self.stdout.write(f"    {line}")
+            self.stdout.write("")
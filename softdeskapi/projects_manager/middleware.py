@@ -0,0 +1,31 @@
+import logging
+
+from django.conf import settings
+
+from projects_manager.loaders import RequestLoader
+
+logger = logging.getLogger("projects_manager.loaders")
+
+
+class RequestLoaderMiddleware:
+    """
+    Attach a RequestLoader to each request. In DEBUG mode, the number of lookups
+    answered by the loader without a query is logged and returned in a header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        loader = request.loader = RequestLoader()
+        response = self.get_response(request)
+        if settings.DEBUG:
+            logger.debug(
+                "%s %s: %d loader queries, %d duplicates avoided",
+                request.method,
+                request.path,
+                loader.queries,
+                loader.hits,
+            )
+            response["X-Loader-Duplicates-Avoided"] = str(loader.hits)
+        return response
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:26
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("projects_manager", "0004_comment"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChangeEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[
+                            ("create", "Create"),
+                            ("update", "Update"),
+                            ("delete", "Delete"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "model",
+                    models.CharField(
+                        choices=[
+                            ("project", "Project"),
+                            ("contributor", "Contributor"),
+                            ("issue", "Issue"),
+                            ("comment", "Comment"),
+                        ],
+                        max_length=15,
+                    ),
+                ),
+                ("object_id", models.BigIntegerField()),
+                ("project_id", models.BigIntegerField()),
+                ("user_id", models.BigIntegerField(blank=True, null=True)),
+                (
+                    "data",
+                    models.JSONField(
+                        blank=True,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                        null=True,
+                    ),
+                ),
+                ("created_time", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["project_id", "id"],
+                        name="projects_ma_project_5de765_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:28
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.utils.timezone
+
+
+def count(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def init_counters(apps, schema_editor):
+    """Compute the counters of existing projects and issues."""
+    Project = apps.get_model("projects_manager", "Project")
+    Contributor = apps.get_model("projects_manager", "Contributor")
+    Issue = apps.get_model("projects_manager", "Issue")
+    Comment = apps.get_model("projects_manager", "Comment")
+    Project.objects.update(
+        issues_count=count(Issue, "project"),
+        contributors_count=count(Contributor, "project"),
+    )
+    Issue.objects.update(
+        comments_count=count(Comment, "issue"),
+        last_activity_time=models.F("created_time"),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("projects_manager", "0006_notification"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="issue",
+            name="comments_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="issue",
+            name="last_activity_time",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+        migrations.AddField(
+            model_name="project",
+            name="contributors_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="project",
+            name="issues_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(init_counters, migrations.RunPython.noop),
+    ]
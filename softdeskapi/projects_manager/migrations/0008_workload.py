@@ -0,0 +1,111 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:45
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Q
+import django.db.models.deletion
+
+
+def init_workload(apps, schema_editor):
+    """Compute the workload of the users assigned to open issues."""
+    Issue = apps.get_model("projects_manager", "Issue")
+    Workload = apps.get_model("projects_manager", "Workload")
+    db_alias = schema_editor.connection.alias
+    assignments = (
+        Issue.assignees.through.objects.using(db_alias)
+        .exclude(issue__status="finished")
+        .order_by()
+    )
+    rows = assignments.values("user_id", "issue__project_id").annotate(
+        open_low=Count("id", filter=Q(issue__priority="low")),
+        open_medium=Count("id", filter=Q(issue__priority="medium")),
+        open_high=Count("id", filter=Q(issue__priority="high")),
+        oldest_open_time=Min("issue__created_time"),
+    )
+    Workload.objects.using(db_alias).bulk_create(
+        Workload(
+            user_id=row["user_id"],
+            project_id=row["issue__project_id"],
+            open_low=row["open_low"],
+            open_medium=row["open_medium"],
+            open_high=row["open_high"],
+            oldest_open_time=row["oldest_open_time"],
+            oldest_open_issue_id=assignments.filter(
+                user_id=row["user_id"],
+                issue__project_id=row["issue__project_id"],
+                issue__created_time=row["oldest_open_time"],
+            )
+            .order_by("issue_id")
+            .values_list("issue_id", flat=True)
+            .first(),
+        )
+        for row in rows
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("projects_manager", "0007_counters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Workload",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("open_low", models.PositiveIntegerField(default=0)),
+                ("open_medium", models.PositiveIntegerField(default=0)),
+                ("open_high", models.PositiveIntegerField(default=0)),
+                ("oldest_open_time", models.DateTimeField(null=True)),
+                ("updated_time", models.DateTimeField(auto_now=True)),
+                (
+                    "oldest_open_issue",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="projects_manager.issue",
+                    ),
+                ),
+                (
+                    "project",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="workloads",
+                        to="projects_manager.project",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="workloads",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="workload",
+            constraint=models.UniqueConstraint(
+                fields=("user", "project"), name="unique_workload_user_project"
+            ),
+        ),
+        # Assignments of a user, to refresh his workload (the table is auto-created
+        # by the assignees field, so the index can't be declared on a model)
+        migrations.RunSQL(
+            "CREATE INDEX projects_manager_issue_assignees_user_issue "
+            "ON projects_manager_issue_assignees (user_id, issue_id)",
+            reverse_sql="DROP INDEX projects_manager_issue_assignees_user_issue",
+        ),
+        migrations.RunPython(init_workload, migrations.RunPython.noop),
+    ]
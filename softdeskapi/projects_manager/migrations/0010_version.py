@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("projects_manager", "0009_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="version",
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name="issue",
+            name="version",
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name="project",
+            name="version",
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
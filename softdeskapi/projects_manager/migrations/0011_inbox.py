@@ -0,0 +1,129 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+PRIORITY_RANKS = {"high": 0, "medium": 1, "low": 2}
+
+
+def init_inbox(apps, schema_editor):
+    """Add the open issues to the inbox of their assignees and authors."""
+    Issue = apps.get_model("projects_manager", "Issue")
+    InboxEntry = apps.get_model("projects_manager", "InboxEntry")
+    db_alias = schema_editor.connection.alias
+    issues = (
+        Issue.objects.using(db_alias)
+        .exclude(status="finished")
+        .prefetch_related("assignees")
+    )
+    entries = []
+    for issue in issues.iterator(chunk_size=2000):
+        assignee_ids = {user.id for user in issue.assignees.all()}
+        user_ids = assignee_ids | ({issue.author_id} if issue.author_id else set())
+        entries.extend(
+            InboxEntry(
+                user_id=user_id,
+                issue_id=issue.id,
+                project_id=issue.project_id,
+                name=issue.name,
+                priority=issue.priority,
+                priority_rank=PRIORITY_RANKS[issue.priority],
+                status=issue.status,
+                issue_created_time=issue.created_time,
+                assigned=user_id in assignee_ids,
+                authored=user_id == issue.author_id,
+            )
+            for user_id in user_ids
+        )
+    InboxEntry.objects.using(db_alias).bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("projects_manager", "0010_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InboxEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                (
+                    "priority",
+                    models.CharField(
+                        choices=[
+                            ("low", "LOW"),
+                            ("medium", "MEDIUM"),
+                            ("high", "HIGH"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("priority_rank", models.PositiveSmallIntegerField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("todo", "To Do"),
+                            ("in_progress", "In Progress"),
+                            ("finished", "Finished"),
+                        ],
+                        max_length=15,
+                    ),
+                ),
+                ("issue_created_time", models.DateTimeField()),
+                ("assigned", models.BooleanField(default=False)),
+                ("authored", models.BooleanField(default=False)),
+                (
+                    "issue",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="projects_manager.issue",
+                    ),
+                ),
+                (
+                    "project",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="projects_manager.project",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="inbox",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "priority_rank", "issue_created_time", "issue"],
+                        name="inbox_user_order_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="inboxentry",
+            constraint=models.UniqueConstraint(
+                fields=("user", "issue"), name="unique_inbox_entry_user_issue"
+            ),
+        ),
+        migrations.RunPython(init_inbox, migrations.RunPython.noop),
+    ]
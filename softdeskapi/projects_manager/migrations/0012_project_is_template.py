@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("projects_manager", "0011_inbox"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="project",
+            name="is_template",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:21
+
+from django.db import migrations, models
+
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def spread_keys(count):
+    """Rank keys of count issues, like projects_manager.ranking.spread_keys()."""
+    base = len(DIGITS)
+    width = 1
+    while (base**width * 3 // 8) // (count + 1) < base:
+        width += 1
+    span = base**width
+    start, step = span // 8, (span * 3 // 8) // (count + 1)
+    keys = []
+    for index in range(count):
+        value, digits = start + step * (index + 1), []
+        for _ in range(width):
+            value, digit = divmod(value, base)
+            digits.append(DIGITS[digit])
+        keys.append("".join(reversed(digits)).rstrip("0"))
+    return keys
+
+
+def init_ranks(apps, schema_editor):
+    """Order the backlog of each project by creation (id)."""
+    Issue = apps.get_model("projects_manager", "Issue")
+    db_alias = schema_editor.connection.alias
+    issues = Issue.objects.using(db_alias)
+    project_ids = issues.values_list("project_id", flat=True).distinct().order_by()
+    for project_id in list(project_ids):
+        project_issues = list(
+            issues.filter(project_id=project_id).order_by("id").only("id")
+        )
+        for issue, rank in zip(project_issues, spread_keys(len(project_issues))):
+            issue.rank = rank
+        issues.bulk_update(project_issues, ["rank"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("projects_manager", "0012_project_is_template"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="issue",
+            name="rank",
+            field=models.CharField(default="", editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name="issue",
+            index=models.Index(
+                fields=["project", "rank", "id"], name="issue_project_rank_idx"
+            ),
+        ),
+        migrations.RunPython(init_ranks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count(model, field, db_alias):
+    return Coalesce(
+        Subquery(
+            model.objects.using(db_alias)
+            .filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def recount_counters(apps, schema_editor):
+    """
+    Compute the counters again on the database migrated: 0007 runs its queries on
+    the current shard, which may not be the one being migrated.
+    """
+    Project = apps.get_model("projects_manager", "Project")
+    Contributor = apps.get_model("projects_manager", "Contributor")
+    Issue = apps.get_model("projects_manager", "Issue")
+    Comment = apps.get_model("projects_manager", "Comment")
+    db_alias = schema_editor.connection.alias
+    Project.objects.using(db_alias).update(
+        issues_count=count(Issue, "project", db_alias),
+        contributors_count=count(Contributor, "project", db_alias),
+    )
+    Issue.objects.using(db_alias).update(
+        comments_count=count(Comment, "issue", db_alias)
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("projects_manager", "0013_issue_rank"),
+    ]
+
+    operations = [
+        migrations.RunPython(recount_counters, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,94 @@
 import uuid
 from django.conf import settings
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router
+from django.db.models import F
+from django.utils import timezone
 
+from projects_manager import ranking
 
-class Project(models.Model):
+
+class CountersMixin:
+    """
+    Counter fields are maintained with F() expressions (see
+    projects_manager/counters.py) so saving an instance must not write back the values
+    it was loaded with.
+    """
+
+    COUNTER_FIELDS = []
+
+    def save(self, *args, **kwargs):
+        """Exclude counter fields from updates, unless update_fields is given."""
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+
+class ChangeLogQuerySet(models.QuerySet):
+    """Deletions record the change events of the rows deleted (and cascades) at once."""
+
+    def delete(self):
+        from projects_manager import changes
+
+        with changes.batch():
+            return super().delete()
+
+
+class ChangeLogMixin:
+    """Like ChangeLogQuerySet, for the deletion of an instance."""
+
+    def delete(self, *args, **kwargs):
+        from projects_manager import changes
+
+        with changes.batch():
+            return super().delete(*args, **kwargs)
+
+
+class VersionConflict(Exception):
+    """The row was updated or deleted since the instance was loaded."""
+
+
+class VersionMixin:
+    """
+    Optimistic concurrency control: the version field is incremented by every update,
+    and an instance is only saved if its row still has the version it was loaded with
+    (compare-and-set, UPDATE ... WHERE version = N), else VersionConflict is raised.
+    New instances with a pk (fixtures, explicit ids) are saved like Django does.
+    Queryset updates must increment the version themselves.
+    """
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        """Update the row only if it has the version of the instance."""
+        if self._state.adding:
+            # Django tries an UPDATE before the INSERT, there is no version to check
+            return super()._do_update(
+                base_qs, using, pk_val, values, update_fields, forced_update
+            )
+        field = self._meta.get_field("version")
+        values = [value for value in values if value[0] is not field]
+        values.append((field, None, F("version") + 1))
+        if not super()._do_update(
+            base_qs.filter(version=self.version),
+            using,
+            pk_val,
+            values,
+            update_fields,
+            forced_update,
+        ):
+            if not base_qs.filter(pk=pk_val).exists():
+                # The row was deleted, Django inserts it again (or raises
+                # DatabaseError with update_fields), like without versions
+                return False
+            raise VersionConflict(f"{self._meta.object_name} {pk_val} was modified")
+        self.version += 1
+        return True
+
+
+class Project(ChangeLogMixin, CountersMixin, VersionMixin, models.Model):
     """Project model."""
 
     PROJECT_TYPES = [
@@ -29,25 +114,37 @@ class Project(models.Model):
         related_name="contributing_projects",
     )
     created_time = models.DateTimeField(auto_now_add=True)
+    issues_count = models.PositiveIntegerField(default=0, editable=False)
+    contributors_count = models.PositiveIntegerField(default=0, editable=False)
+    # templates can be cloned by every user (see projects_manager/cloning.py)
+    is_template = models.BooleanField(default=False)
+    # incremented by every update (see VersionMixin)
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    objects = ChangeLogQuerySet.as_manager()
+
+    COUNTER_FIELDS = ["issues_count", "contributors_count"]
 
     def __str__(self):
         """Return project name."""
         return self.name
 
 
-class Contributor(models.Model):
+class Contributor(ChangeLogMixin, models.Model):
     """Custom through model for contributors."""
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     project = models.ForeignKey(Project, on_delete=models.CASCADE)
     created_time = models.DateTimeField(auto_now_add=True)
 
+    objects = ChangeLogQuerySet.as_manager()
+
     def __str__(self):
         """Return user and project name."""
         return f"{self.user.username} - {self.project.name}"
 
 
-class Issue(models.Model):
+class Issue(ChangeLogMixin, CountersMixin, VersionMixin, models.Model):
     """
     Issue model. An issue is always linked to one (same) project. Only contributors of
     this project can be assigned to the issue.
@@ -95,13 +192,48 @@ class Issue(models.Model):
     )
 
     created_time = models.DateTimeField(auto_now_add=True)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    # updated when the issue is updated or commented
+    last_activity_time = models.DateTimeField(default=timezone.now, editable=False)
+    version = models.PositiveIntegerField(default=1, editable=False)
+    # position in the backlog of the project (see projects_manager/ranking.py)
+    rank = models.CharField(max_length=255, default="", editable=False)
+
+    objects = ChangeLogQuerySet.as_manager()
+
+    COUNTER_FIELDS = ["comments_count"]
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["project", "rank", "id"], name="issue_project_rank_idx"
+            )
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        New issues are added at the end of the backlog of their project. Keep track
+        of the last activity on updates.
+        """
+        if self._state.adding and not self.rank:
+            using = kwargs.get("using") or router.db_for_write(Issue, instance=self)
+            self.rank = ranking.key_after(ranking.last_rank(using, self.project_id))
+            ranking.schedule_rebalance_if_needed(using, self.project_id, self.rank)
+        if not self._state.adding:
+            self.last_activity_time = timezone.now()
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = [
+                    *kwargs["update_fields"],
+                    "last_activity_time",
+                ]
+        super().save(*args, **kwargs)
 
     def __str__(self):
         """Return issue name."""
         return self.name
 
 
-class Comment(models.Model):
+class Comment(ChangeLogMixin, VersionMixin, models.Model):
     """Comment model. A comment is always linked to one (same) issue."""
 
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
@@ -114,9 +246,198 @@ class Comment(models.Model):
         null=True,
     )
     created_time = models.DateTimeField(auto_now_add=True)
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    objects = ChangeLogQuerySet.as_manager()
 
     def __str__(self):
         """Return comment uuid, issue name and author username."""
         comment = f"""Comment {self.uuid} from issue '{self.issue.name}',
         created by {self.author.username}"""
         return comment
+
+
+class Workload(models.Model):
+    """
+    Open issues assigned to a user in a project, by priority, and the oldest of them.
+    Refreshed after each change of the assignments or issues concerned (see
+    projects_manager/workload.py). Rows without open issues are deleted.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="workloads"
+    )
+    project = models.ForeignKey(
+        Project, on_delete=models.CASCADE, related_name="workloads"
+    )
+    open_low = models.PositiveIntegerField(default=0)
+    open_medium = models.PositiveIntegerField(default=0)
+    open_high = models.PositiveIntegerField(default=0)
+    oldest_open_issue = models.ForeignKey(
+        Issue, on_delete=models.SET_NULL, null=True, related_name="+"
+    )
+    oldest_open_time = models.DateTimeField(null=True)
+    updated_time = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "project"], name="unique_workload_user_project"
+            )
+        ]
+
+    def __str__(self):
+        """Return user id, project id and open issues count."""
+        total = self.open_low + self.open_medium + self.open_high
+        return f"User {self.user_id} - project {self.project_id}: {total} open"
+
+
+class InboxEntry(models.Model):
+    """
+    Open issue a user is assigned to or is the author of, with the fields the inbox
+    is sorted by. Refreshed after each change of the issue or of its assignees (see
+    projects_manager/inbox.py). Finished issues have no entries.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="inbox"
+    )
+    issue = models.ForeignKey(Issue, on_delete=models.CASCADE, related_name="+")
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="+")
+    name = models.CharField(max_length=100)
+    priority = models.CharField(max_length=10, choices=Issue.PRIORITIES)
+    # 0 for the highest priority, the inbox is sorted by rank
+    priority_rank = models.PositiveSmallIntegerField()
+    status = models.CharField(max_length=15, choices=Issue.STATUS)
+    issue_created_time = models.DateTimeField()
+    assigned = models.BooleanField(default=False)
+    authored = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "issue"], name="unique_inbox_entry_user_issue"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "priority_rank", "issue_created_time", "issue"],
+                name="inbox_user_order_idx",
+            )
+        ]
+
+    def __str__(self):
+        """Return user id and issue id."""
+        return f"User {self.user_id} - issue {self.issue_id}"
+
+
+class ChangeEvent(models.Model):
+    """
+    Append-only log of create/update/delete events on projects, contributors, issues
+    and comments. The id is used as a cursor by clients to only fetch what changed.
+    For contributor events, object_id and user_id are the id of the user concerned.
+    """
+
+    ACTIONS = [
+        ("create", "Create"),
+        ("update", "Update"),
+        ("delete", "Delete"),
+    ]
+
+    MODELS = [
+        ("project", "Project"),
+        ("contributor", "Contributor"),
+        ("issue", "Issue"),
+        ("comment", "Comment"),
+    ]
+
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    model = models.CharField(max_length=15, choices=MODELS)
+    object_id = models.BigIntegerField()
+    # not foreign keys, events must outlive the objects they describe
+    project_id = models.BigIntegerField()
+    user_id = models.BigIntegerField(null=True, blank=True)
+    data = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["project_id", "id"])]
+
+    def __str__(self):
+        """Return action, model and object id."""
+        return f"{self.action} {self.model} {self.object_id}"
+
+
+class Notification(models.Model):
+    """
+    Outbox of notifications to send to users who can be contacted. Rows are written in
+    the same transaction as the change and delivered in the background.
+    """
+
+    EVENTS = [
+        ("assigned", "Assigned to an issue"),
+        ("commented", "New comment on an issue"),
+    ]
+
+    STATUS = [
+        ("pending", "Pending"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+
+    recipient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="notifications",
+    )
+    event = models.CharField(max_length=15, choices=EVENTS)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=10, choices=STATUS, default="pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_time = models.DateTimeField(default=timezone.now)
+    # set when a worker claims the notification to deliver it
+    claim = models.UUIDField(null=True, blank=True)
+    claimed_time = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_time = models.DateTimeField(auto_now_add=True)
+    sent_time = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_time"])]
+
+    def __str__(self):
+        """Return event and recipient username."""
+        return f"{self.event} for {self.recipient.username} ({self.status})"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response of a POST request sent with an Idempotency-Key header, replayed when the
+    client sends the request again with the same key. The response is empty while the
+    request is in progress. Rows expire after the IDEMPOTENCY["TTL"] setting.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="idempotency_keys",
+    )
+    key = models.CharField(max_length=255)
+    # hash of the method, path and body of the request
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="unique_idempotency_key"
+            )
+        ]
+        indexes = [models.Index(fields=["created_time"])]
+
+    def __str__(self):
+        """Return user id and key."""
+        return f"User {self.user_id}: {self.key}"
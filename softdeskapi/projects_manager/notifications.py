@@ -0,0 +1,173 @@
+"""
+Notifications for issue assignments and comments. Notifications are written to the
+Notification outbox table in the request transaction (once the shard of the
+project has committed, see sharding.on_shard_commit), then delivered by background
+jobs once the transaction is committed. Notifications of a same recipient are
+delivered together, failed deliveries are retried with an exponential backoff.
+"""
+import logging
+import uuid
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from projects_manager import sharding
+from projects_manager.models import Notification
+from softdeskapi import tasks
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+DEFAULTS = {
+    "BACKEND": "projects_manager.notifications.log_backend",
+    "MAX_ATTEMPTS": 5,
+    "RETRY_DELAY": 30,  # seconds
+    "BATCH_SIZE": 100,
+    "CLAIM_TIMEOUT": 300,  # seconds before a claimed notification can be claimed again
+}
+
+
+def get_setting(name):
+    """Return a NOTIFICATIONS setting."""
+    return getattr(settings, "NOTIFICATIONS", {}).get(name, DEFAULTS[name])
+
+
+def log_backend(recipient, notifications):
+    """Default delivery backend, only logs the notifications."""
+    for notification in notifications:
+        logger.info(
+            "Notify %s: %s %s",
+            recipient.username,
+            notification.event,
+            notification.payload,
+        )
+
+
+def notify(user_ids, event, payload, exclude=None, shard=None):
+    """
+    Add a notification to the outbox for each user who can be contacted, once the
+    shard of the change has committed, and schedule its delivery after commit.
+    """
+    recipients = User.objects.filter(
+        id__in=user_ids, is_active=True, can_be_contacted=True
+    )
+    if exclude is not None:
+        recipients = recipients.exclude(id=exclude.id)
+    notifications = [
+        Notification(recipient_id=user_id, event=event, payload=payload)
+        for user_id in recipients.values_list("id", flat=True)
+    ]
+
+    def insert():
+        Notification.objects.bulk_create(notifications)
+        tasks.submit_on_commit(dispatch_pending)
+
+    if notifications:
+        sharding.on_shard_commit(shard, insert)
+    return notifications
+
+
+def notify_assigned(issue, user_ids, actor):
+    """Notify users newly assigned to an issue."""
+    payload = {"issue": issue.id, "project": issue.project_id, "by": actor.id}
+    return notify(user_ids, "assigned", payload, exclude=actor, shard=issue._state.db)
+
+
+def notify_commented(comment):
+    """Notify the author and the assignees of the issue that was commented."""
+    issue = comment.issue
+    user_ids = set(issue.assignees.values_list("id", flat=True))
+    if issue.author_id:
+        user_ids.add(issue.author_id)
+    payload = {
+        "issue": issue.id,
+        "project": issue.project_id,
+        "comment": str(comment.uuid),
+        "by": comment.author_id,
+    }
+    return notify(
+        user_ids,
+        "commented",
+        payload,
+        exclude=comment.author,
+        shard=comment._state.db,
+    )
+
+
+def claim_batch():
+    """Claim a batch of due notifications and return them ordered by recipient."""
+    now = timezone.now()
+    stale = now - timedelta(seconds=get_setting("CLAIM_TIMEOUT"))
+    due = Notification.objects.filter(
+        Q(status="pending", next_attempt_time__lte=now)
+        | Q(status="sending", claimed_time__lt=stale)
+    )
+    ids = list(
+        due.order_by("id").values_list("id", flat=True)[: get_setting("BATCH_SIZE")]
+    )
+    if not ids:
+        return []
+    # The update only claims rows that were not claimed by another worker meanwhile
+    claim = uuid.uuid4()
+    due.filter(id__in=ids).update(status="sending", claim=claim, claimed_time=now)
+    return list(
+        Notification.objects.filter(claim=claim)
+        .select_related("recipient")
+        .order_by("recipient_id", "id")
+    )
+
+
+def deliver(notifications):
+    """Deliver claimed notifications, grouped by recipient. Return the failed count."""
+    backend = import_string(get_setting("BACKEND"))
+    failed = 0
+    for _, group in groupby(notifications, key=lambda n: n.recipient_id):
+        group = list(group)
+        ids = [notification.id for notification in group]
+        try:
+            backend(group[0].recipient, group)
+        except Exception as error:
+            failed += len(group)
+            logger.warning("Notification delivery failed: %s", error)
+            # The retry delay is doubled after each failed attempt
+            attempts = group[0].attempts + 1
+            delay = get_setting("RETRY_DELAY") * 2 ** (attempts - 1)
+            Notification.objects.filter(id__in=ids).update(
+                status="pending",
+                attempts=F("attempts") + 1,
+                claim=None,
+                next_attempt_time=timezone.now() + timedelta(seconds=delay),
+                last_error=str(error),
+            )
+            Notification.objects.filter(
+                id__in=ids, attempts__gte=get_setting("MAX_ATTEMPTS")
+            ).update(status="failed")
+        else:
+            Notification.objects.filter(id__in=ids).update(
+                status="sent", claim=None, sent_time=timezone.now()
+            )
+    return failed
+
+
+def dispatch_pending():
+    """
+    Deliver due notifications batch after batch. If some deliveries failed, another
+    dispatch is scheduled after the retry delay.
+    """
+    delivered = failed = 0
+    while True:
+        notifications = claim_batch()
+        if not notifications:
+            break
+        batch_failed = deliver(notifications)
+        failed += batch_failed
+        delivered += len(notifications) - batch_failed
+    if failed:
+        tasks.submit_later(get_setting("RETRY_DELAY"), dispatch_pending)
+    return delivered, failed
@@ -1,5 +1,7 @@
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
+from projects_manager.loaders import get_loader
+
 
 class AuthorOrReadOnly(BasePermission):
     """
@@ -21,7 +23,7 @@ class AuthorOrReadOnly(BasePermission):
             return True
 
         # Allow write for the author of the object
-        return obj.author == request.user
+        return obj.author_id == request.user.id
 
 
 class AuthorOrAssignee(BasePermission):
@@ -40,6 +42,7 @@ class AuthorOrAssignee(BasePermission):
             return True
 
         is_author_or_assignee = (
-            obj.author == request.user or request.user in obj.assignees.all()
+            obj.author_id == request.user.id
+            or request.user.id in get_loader(request).assignee_ids(obj.id)
         )
         return is_author_or_assignee
@@ -0,0 +1,203 @@
+"""
+Order of the issues in the backlog of a project, with fractional rank keys: ranks
+are strings of base 36 digits compared in alphabetical order, read as the digits
+of a number between 0 and 1 ("i" is 0.5). A key can always be made between two
+others, so moving an issue only updates its own row. New issues are added after
+the last one by incrementing its key, which doesn't make it longer.
+Keys get longer when issues are often moved between the same neighbours: when a
+key is longer than RANKING["MAX_LENGTH"], the ranks of the project are spread again
+in a background job (rebalance), which keeps the order.
+"""
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from softdeskapi import tasks
+
+DEFAULTS = {"MAX_LENGTH": 12}
+
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+
+
+def get_setting(name):
+    """Return a RANKING setting."""
+    return getattr(settings, "RANKING", {}).get(name, DEFAULTS[name])
+
+
+def midpoint(a, b):
+    """
+    Return a key between a and b (a < b, "" for 0 and None for 1). Keys never end
+    with "0", so there is always room before them.
+    """
+    if b is not None:
+        # Keep the common prefix
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else "0") == b[n]:
+            n += 1
+        if n:
+            return b[:n] + midpoint(a[n:], b[n:])
+    digit_a = DIGITS.index(a[0]) if a else 0
+    digit_b = DIGITS.index(b[0]) if b is not None else BASE
+    if digit_b - digit_a > 1:
+        return DIGITS[(digit_a + digit_b + 1) // 2]
+    # Consecutive digits: keep the first digit of b if b is longer, else go deeper
+    if b is not None and len(b) > 1:
+        return b[0]
+    return DIGITS[digit_a] + midpoint(a[1:], None)
+
+
+def key_between(a, b):
+    """Return a key between the keys a and b (None or "" for no bound)."""
+    return midpoint(a or "", b or None)
+
+
+def key_after(a):
+    """
+    Return a key after a: a incremented as a number of the same length (skipping
+    the keys ending with "0"). If a is made of "z" digits, it is followed by as many
+    "0" then a "1", which leaves room for more keys at each overflow.
+    """
+    if not a:
+        return key_between(None, None)
+    value = to_value(a) + 1
+    if value % BASE == 0:
+        value += 1
+    if value >= BASE ** len(a):
+        return a + "0" * len(a) + "1"
+    return to_key(value, len(a))
+
+
+def spread_keys(count):
+    """
+    Return count keys evenly spaced between 1/8 and 1/2, at least 36 apart, so there
+    is room before the first one, between each, and for many issues after the last.
+    """
+    width = 1
+    while (BASE**width * 3 // 8) // (count + 1) < BASE:
+        width += 1
+    span = BASE**width
+    start, step = span // 8, (span * 3 // 8) // (count + 1)
+    return [to_key(start + step * (index + 1), width) for index in range(count)]
+
+
+def to_key(value, width):
+    """Return the key of the number value / 36**width (trailing zeros removed)."""
+    digits = []
+    for _ in range(width):
+        value, digit = divmod(value, BASE)
+        digits.append(DIGITS[digit])
+    return "".join(reversed(digits)).rstrip("0")
+
+
+def to_value(key):
+    """Return the digits of a key as an integer."""
+    value = 0
+    for digit in key:
+        value = value * BASE + DIGITS.index(digit)
+    return value
+
+
+def last_rank(shard, project_id):
+    """Return the rank of the last issue of a project, None if there is none."""
+    from projects_manager.models import Issue
+
+    return (
+        Issue.objects.using(shard)
+        .filter(project_id=project_id)
+        .order_by("-rank", "-id")
+        .values_list("rank", flat=True)
+        .first()
+    )
+
+
+def get_neighbours(issue, before=None, after=None, position=None):
+    """
+    Return the ranks the issue must be placed between, to move it before or after
+    another issue of the project, or at the "first" or "last" position.
+    """
+    issues = (
+        type(issue)
+        .objects.using(issue._state.db)
+        .filter(project_id=issue.project_id)
+        .exclude(id=issue.id)
+        .order_by("rank", "id")
+        .values_list("rank", flat=True)
+    )
+    if after is not None:
+        following = issues.filter(
+            Q(rank__gt=after.rank) | Q(rank=after.rank, id__gt=after.id)
+        ).first()
+        return after.rank, following
+    if before is not None:
+        preceding = issues.filter(
+            Q(rank__lt=before.rank) | Q(rank=before.rank, id__lt=before.id)
+        ).last()
+        return preceding, before.rank
+    if position == "first":
+        return None, issues.first()
+    return issues.last(), None
+
+
+def move(issue, before=None, after=None, position=None):
+    """
+    Move an issue before or after another issue of its project, or to the "first"
+    or "last" position, by updating its rank only. If its neighbours have the same
+    rank (or no rank), the project is rebalanced first.
+    """
+    shard = issue._state.db
+    low, high = get_neighbours(issue, before, after, position)
+    if (high is not None and not high) or (low and high and low >= high):
+        rebalance(shard, issue.project_id)
+        # The rebalance incremented the version of the issue too
+        issue.refresh_from_db(fields=["version"])
+        for target in (before, after):
+            if target is not None:
+                target.refresh_from_db(fields=["rank"])
+        low, high = get_neighbours(issue, before, after, position)
+    if position == "last" and high is None:
+        issue.rank = key_after(low)
+    else:
+        issue.rank = key_between(low, high)
+    issue.save(update_fields=["rank"])
+    schedule_rebalance_if_needed(shard, issue.project_id, issue.rank)
+    return issue
+
+
+def schedule_rebalance_if_needed(shard, project_id, rank):
+    """Rebalance the project in the background if the rank is too long."""
+    if len(rank) > get_setting("MAX_LENGTH"):
+        transaction.on_commit(
+            partial(tasks.submit, rebalance, shard, project_id), using=shard
+        )
+
+
+def rebalance(shard, project_id):
+    """
+    Spread the ranks of the issues of a project again, in the same order. The
+    change of each issue is recorded in the change log.
+    """
+    from projects_manager import changes
+    from projects_manager.models import Issue
+
+    with transaction.atomic(using=shard):
+        issues = list(
+            Issue.objects.using(shard)
+            .select_for_update()
+            .filter(project_id=project_id)
+            .order_by("rank", "id")
+            .only("id", "rank")
+        )
+        for issue, rank in zip(issues, spread_keys(len(issues))):
+            issue.rank = rank
+            # The representation of the issue changed (see VersionMixin)
+            issue.version = F("version") + 1
+        Issue.objects.using(shard).bulk_update(
+            issues, ["rank", "version"], batch_size=500
+        )
+        changes.record_many(
+            Issue.objects.using(shard).filter(project_id=project_id), "update"
+        )
+    return len(issues)
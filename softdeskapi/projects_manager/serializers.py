@@ -1,7 +1,13 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
-from projects_manager.models import Project, Issue, Comment
+from projects_manager import sharding
+from projects_manager.fields import (
+    LoaderPrimaryKeyRelatedField,
+    LoaderHyperlinkedRelatedField,
+)
+from projects_manager.loaders import get_loader
+from projects_manager.models import Project, Issue, Comment, ChangeEvent, InboxEntry
 
 User = get_user_model()
 
@@ -15,20 +21,26 @@ class ProjectSerializer(serializers.ModelSerializer):
     class Meta:
         model = Project
         fields = "__all__"
-        read_only_fields = ["author", "created_time"]
+        read_only_fields = [
+            "author",
+            "created_time",
+            "issues_count",
+            "contributors_count",
+        ]
 
     def get_contributors_queryset(self):
         """Every active user can be a contributor."""
         return User.objects.filter(is_active=True)
 
     # I removed the validate_contributors method as already handled now with this
-    contributors = serializers.PrimaryKeyRelatedField(
+    contributors = LoaderPrimaryKeyRelatedField(
         queryset=get_contributors_queryset(serializers.ModelSerializer), many=True
     )
 
     def validate_name(self, value):
-        """Check if project name is unique."""
-        if Project.objects.filter(name=value).exists():
+        """Check if project name is unique (on every shard)."""
+        projects = Project.objects.filter(name=value)
+        if any(queryset.exists() for queryset in sharding.fan_out(projects)):
             raise serializers.ValidationError("Project name already exists")
         return value
 
@@ -53,6 +65,8 @@ class ProjectSerializer(serializers.ModelSerializer):
         # Add the contributors provided and validated to the project
         for contributor in contributors:
             project.contributors.add(contributor.id)
+        # Counters were updated in the database when adding contributors
+        project.refresh_from_db(fields=Project.COUNTER_FIELDS)
         return project
 
     def update(self, instance, validated_data):
@@ -76,36 +90,48 @@ class ProjectSerializer(serializers.ModelSerializer):
                 instance.contributors.add(instance.author.id)
             for contributor in contributors:
                 instance.contributors.add(contributor.id)
+        instance.refresh_from_db(fields=Project.COUNTER_FIELDS)
         return instance
 
 
 class IssueSerializer(serializers.ModelSerializer):
     """Serializer for issue objects."""
 
-    project = serializers.PrimaryKeyRelatedField(queryset=Project.objects.all())
-    assignees = serializers.PrimaryKeyRelatedField(
+    project = LoaderPrimaryKeyRelatedField(queryset=Project.objects.all())
+    assignees = LoaderPrimaryKeyRelatedField(
         queryset=User.objects.filter(is_active=True), many=True
     )
 
     class Meta:
         model = Issue
         fields = "__all__"
-        read_only_fields = ("project", "author", "created_time")
-
-    def validate_assignees(self, assignees):
-        """Check if assignees are contributors of the project."""
+        read_only_fields = (
+            "project",
+            "author",
+            "created_time",
+            "comments_count",
+            "last_activity_time",
+        )
+
+    def get_project(self):
+        """Return the project of the issue, loaded once per request."""
         if self.instance:
-            project = self.instance.project
+            project_id = self.instance.project_id
         else:
             project_id = self.initial_data.get("project")
-            try:
-                project = Project.objects.get(id=project_id)
-            except Project.DoesNotExist:
-                raise serializers.ValidationError(
-                    f"Project with id {project_id} does not exist."
-                )
+        try:
+            return get_loader(self.context["request"]).get(Project, project_id)
+        except (Project.DoesNotExist, ValueError):
+            raise serializers.ValidationError(
+                f"Project with id {project_id} does not exist."
+            )
+
+    def validate_assignees(self, assignees):
+        """Check if assignees are contributors of the project."""
+        project = self.get_project()
+        contributors = get_loader(self.context["request"]).contributor_ids(project.id)
         for user in assignees:
-            if user not in project.contributors.all():
+            if user.id not in contributors:
                 raise serializers.ValidationError(
                     f"{user.username} (id:{user.id}) is not a contributor "
                     "of this project."
@@ -114,16 +140,7 @@ class IssueSerializer(serializers.ModelSerializer):
 
     def validate_name(self, value):
         """The name of an issue must be unique in a project."""
-        if self.instance:
-            project = self.instance.project
-        else:
-            project_id = self.initial_data.get("project")
-            try:
-                project = Project.objects.get(id=project_id)
-            except Project.DoesNotExist:
-                raise serializers.ValidationError(
-                    f"Project with id {project_id} does not exist."
-                )
+        project = self.get_project()
         if Issue.objects.filter(project=project, name=value).exists():
             raise serializers.ValidationError(
                 f"An issue named '{value}' already exists in this project."
@@ -137,7 +154,7 @@ class IssueSerializer(serializers.ModelSerializer):
         we check if it is the same of the instance to inform the user that he cannot
         change the project if he tries to.
         """
-        if instance.project != validated_data["project"]:
+        if instance.project_id != validated_data["project"].id:
             raise serializers.ValidationError("Project cannot be changed.")
         return super().update(instance, validated_data)
 
@@ -148,14 +165,14 @@ class IssueSerializer(serializers.ModelSerializer):
         called and that requires project to be present in the request data.
         """
         if "project" not in data and self.instance:
-            data["project"] = self.instance.project.id
+            data["project"] = self.instance.project_id
         return super().to_internal_value(data)
 
 
 class CommentSerializer(serializers.ModelSerializer):
     """Serializer for comment objects."""
 
-    issue = serializers.HyperlinkedRelatedField(
+    issue = LoaderHyperlinkedRelatedField(
         view_name="issues-detail", queryset=Issue.objects.all()
     )
 
@@ -179,7 +196,31 @@ class ProjectListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Project
-        fields = ["id", "name", "type", "description"]
+        fields = [
+            "id",
+            "name",
+            "type",
+            "description",
+            "issues_count",
+            "contributors_count",
+            "is_template",
+        ]
+
+
+class ProjectCloneSerializer(serializers.Serializer):
+    """Name and options of a project cloned from another one."""
+
+    name = serializers.CharField(max_length=100)
+    description = serializers.CharField(required=False)
+    type = serializers.ChoiceField(choices=Project.PROJECT_TYPES, required=False)
+    contributors = serializers.BooleanField(default=True)
+    issues = serializers.BooleanField(default=True)
+    assignees = serializers.BooleanField(default=False)
+    is_template = serializers.BooleanField(default=False)
+
+    def validate_name(self, value):
+        """Same rule as for new projects."""
+        return ProjectSerializer.validate_name(self, value)
 
 
 class IssueListSerializer(serializers.ModelSerializer):
@@ -187,4 +228,75 @@ class IssueListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Issue
-        fields = ["id", "project", "name", "type", "priority", "status"]
+        fields = [
+            "id",
+            "project",
+            "name",
+            "type",
+            "priority",
+            "status",
+            "comments_count",
+            "last_activity_time",
+            "rank",
+        ]
+
+
+class IssueMoveSerializer(serializers.Serializer):
+    """New place of an issue in the backlog of its project."""
+
+    before = serializers.IntegerField(required=False)
+    after = serializers.IntegerField(required=False)
+    position = serializers.ChoiceField(choices=["first", "last"], required=False)
+
+    def validate(self, data):
+        """Only one of before, after and position can be given."""
+        if len(data) != 1:
+            raise serializers.ValidationError(
+                "Give one of before, after (issue id) or position (first or last)."
+            )
+        return data
+
+
+class ChangeEventSerializer(serializers.ModelSerializer):
+    """Serializer for change log events."""
+
+    class Meta:
+        model = ChangeEvent
+        fields = [
+            "id",
+            "action",
+            "model",
+            "object_id",
+            "project_id",
+            "user_id",
+            "data",
+            "created_time",
+        ]
+
+
+class InboxEntrySerializer(serializers.ModelSerializer):
+    """Serializer for the open issues of the inbox."""
+
+    id = serializers.IntegerField(source="issue_id")
+    project_id = serializers.IntegerField()
+    created_time = serializers.DateTimeField(source="issue_created_time")
+
+    class Meta:
+        model = InboxEntry
+        fields = [
+            "id",
+            "project_id",
+            "name",
+            "priority",
+            "status",
+            "created_time",
+            "assigned",
+            "authored",
+        ]
+
+
+class IssueStatusTransitionSerializer(serializers.Serializer):
+    """A status change requested for an issue, used for bulk transitions."""
+
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=Issue.STATUS)
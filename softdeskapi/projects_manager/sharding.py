@@ -0,0 +1,269 @@
+"""
+Sharding of projects across several databases. A project and its contributors,
+issues, comments and workloads are stored on one shard, the other models (users,
+change log, notifications...) are stored on the default database. Users are mirrored
+on every shard, so that foreign keys and joins on them keep working there.
+
+The shards are the database aliases of the PROJECT_SHARDS setting. Each shard owns
+a range of PROJECT_SHARD_ID_SPAN ids (set up by the init_shards command), so the
+shard of a project, issue or comment is known from its id. Views set the shard of
+the request as the current shard, and lists of the user's objects are fetched on
+every shard and merged. With a single shard (the default), nothing changes.
+"""
+import heapq
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import islice
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction, NotSupportedError
+
+GLOBAL_DATABASE = "default"
+
+SHARDED_MODELS = {
+    "projects_manager.project",
+    "projects_manager.contributor",
+    "projects_manager.issue",
+    "projects_manager.issue_assignees",
+    "projects_manager.comment",
+    "projects_manager.workload",
+    "projects_manager.inboxentry",
+}
+
+MIRRORED_MODELS = {settings.AUTH_USER_MODEL.lower()}
+
+# Shard of the project the current request (or job) is working on
+current_shard = ContextVar("current_shard", default=None)
+
+
+def get_shards():
+    """Return the aliases of the shards."""
+    return getattr(settings, "PROJECT_SHARDS", [GLOBAL_DATABASE])
+
+
+def get_id_span():
+    """Return the number of ids owned by each shard."""
+    return getattr(settings, "PROJECT_SHARD_ID_SPAN", 10**12)
+
+
+def is_enabled():
+    """Return True if there is more than one shard."""
+    return len(get_shards()) > 1
+
+
+def is_sharded(model):
+    """Return True if the model (or instance) is stored on the shards."""
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+def get_sharded_models():
+    """Return the sharded models, including the assignees table."""
+    return [
+        model
+        for model in apps.get_models(include_auto_created=True)
+        if is_sharded(model)
+    ]
+
+
+def shard_for_id(pk):
+    """Return the shard owning the id of a sharded object, None if it's not valid."""
+    try:
+        index = int(pk) // get_id_span()
+    except (TypeError, ValueError):
+        return None
+    shards = get_shards()
+    if len(shards) == 1:
+        return shards[0]
+    if 0 <= index < len(shards):
+        return shards[index]
+    return None
+
+
+def pick_shard():
+    """Return the shard where a new project is created."""
+    return random.choice(get_shards())
+
+
+def get_current():
+    """Return the current shard, the first one if none is set."""
+    return current_shard.get() or get_shards()[0]
+
+
+@contextmanager
+def use_shard(alias):
+    """Set the current shard in a block."""
+    token = current_shard.set(alias)
+    try:
+        yield
+    finally:
+        current_shard.reset(token)
+
+
+def on_shard_commit(shard, func):
+    """
+    Run func once the shard has committed, for writes on the default database that
+    follow a change on a shard (change log, notifications). On the default database
+    func is run now, in the same transaction as the change.
+    """
+    if shard is None or shard == GLOBAL_DATABASE:
+        func()
+    else:
+        transaction.on_commit(func, using=shard)
+
+
+def fan_out(queryset):
+    """Return the queryset on each shard."""
+    return [queryset.using(shard) for shard in get_shards()]
+
+
+def group_by_shard(model, pks):
+    """Return {shard: pks}, the shard is None if the model is not sharded."""
+    if not is_sharded(model):
+        return {None: list(pks)}
+    groups = {}
+    for pk in pks:
+        groups.setdefault(shard_for_id(pk), []).append(pk)
+    return groups
+
+
+def get_value(row, field):
+    """Return a field of a model instance or of a values() row."""
+    return row[field] if isinstance(row, dict) else getattr(row, field)
+
+
+def iterate(queryset, field="id", chunk_size=2000):
+    """Iterate over the rows of a queryset on every shard, ordered by field."""
+    querysets = [
+        queryset.order_by(field).iterator(chunk_size=chunk_size)
+        for queryset in fan_out(queryset)
+    ]
+    return heapq.merge(*querysets, key=lambda row: get_value(row, field))
+
+
+class ShardedList:
+    """
+    The rows of a queryset on every shard, ordered by a unique field, as a sequence
+    for the paginator. A slice fetches the first rows of each shard with the index
+    of the field and merges them: only `stop` rows are read per shard.
+    """
+
+    ordered = True
+
+    def __init__(self, queryset, field="id"):
+        self.querysets = fan_out(queryset.order_by(field))
+        self.field = field
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index : index + 1][0]
+        start, stop = index.start or 0, index.stop
+        rows = heapq.merge(
+            *(queryset[:stop] for queryset in self.querysets),
+            key=lambda row: get_value(row, self.field),
+        )
+        return list(islice(rows, start, stop))
+
+
+class ShardRouter:
+    """
+    Route sharded models to the shard of the instance they are related to, or to the
+    current shard. Users are written on the default database and read from the
+    mirror of the shard when they are related to a sharded object (assignees,
+    contributors...), other models stay on the default database.
+    Every database gets the whole schema: the users mirror needs the auth tables.
+    """
+
+    def get_instance_shard(self, hints):
+        instance = hints.get("instance")
+        if instance is not None and is_sharded(instance) and instance._state.db:
+            return instance._state.db
+        return None
+
+    def db_for_read(self, model, **hints):
+        label = model._meta.label_lower
+        if label in SHARDED_MODELS:
+            return self.get_instance_shard(hints) or get_current()
+        if label in MIRRORED_MODELS:
+            return self.get_instance_shard(hints) or GLOBAL_DATABASE
+        return GLOBAL_DATABASE
+
+    def db_for_write(self, model, **hints):
+        if model._meta.label_lower in SHARDED_MODELS:
+            return self.get_instance_shard(hints) or get_current()
+        return GLOBAL_DATABASE
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_sharded(obj1) and is_sharded(obj2):
+            return obj1._state.db == obj2._state.db
+        return True
+
+
+def get_mirrors():
+    """Return the shards where users are mirrored."""
+    return [shard for shard in get_shards() if shard != GLOBAL_DATABASE]
+
+
+def mirror_users(users):
+    """Insert or update users on the mirrors."""
+    User = get_user_model()
+    fields = User._meta.concrete_fields
+    copies = [
+        User(**{field.attname: getattr(user, field.attname) for field in fields})
+        for user in users
+    ]
+    for shard in get_mirrors():
+        User.objects.using(shard).bulk_create(
+            copies,
+            update_conflicts=True,
+            unique_fields=[User._meta.pk.name],
+            update_fields=[field.name for field in fields if not field.primary_key],
+        )
+
+
+def delete_user_mirrors(user_id):
+    """
+    Delete a user from the mirrors. Like on the default database, his memberships
+    and assignments are deleted and his authorship is nulled on the shards.
+    """
+    User = get_user_model()
+    for shard in get_mirrors():
+        with use_shard(shard):
+            User.objects.using(shard).filter(pk=user_id).delete()
+
+
+def init_sequences(alias, start):
+    """Start the ids of the sharded tables of a shard after start."""
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        for model in get_sharded_models():
+            table = model._meta.db_table
+            if connection.vendor == "sqlite":
+                cursor.execute(
+                    "UPDATE sqlite_sequence SET seq = MAX(seq, %s) WHERE name = %s",
+                    [start, table],
+                )
+                if not cursor.rowcount:
+                    cursor.execute(
+                        "INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)",
+                        [table, start],
+                    )
+            elif connection.vendor == "postgresql":
+                cursor.execute(
+                    "SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                    f"GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM "
+                    f"{connection.ops.quote_name(table)})))",
+                    [table, start],
+                )
+            else:
+                raise NotSupportedError(
+                    f"Sharding is not supported on {connection.vendor}"
+                )
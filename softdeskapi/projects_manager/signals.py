@@ -0,0 +1,197 @@
+"""Signal handlers of projects_manager, connected in ProjectsManagerConfig.ready()."""
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from projects_manager import changes, counters, inbox, sharding, workload
+from projects_manager.models import Project, Contributor, Issue, Comment
+
+User = get_user_model()
+
+Assignment = Issue.assignees.through
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=Issue)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Contributor)
+def record_save(sender, instance, created, raw=False, **kwargs):
+    """Log creations and updates in the change log."""
+    if raw:  # loaddata
+        return
+    changes.record(instance, "create" if created else "update")
+
+
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Issue)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Contributor)
+def record_delete(sender, instance, **kwargs):
+    """Log deletions (including cascades) in the change log."""
+    changes.record(instance, "delete")
+
+
+@receiver(pre_delete, sender=Issue)
+def remember_deleted_issue(sender, instance, **kwargs):
+    """Comments deleted in cascade get the project of their issue without a query."""
+    changes.remember_issue(instance)
+
+
+@receiver(m2m_changed, sender=Contributor)
+def record_contributors_added(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    project.contributors.add() uses bulk_create so no post_save is sent for the
+    Contributor rows. Removals go through a queryset delete and send post_delete.
+    """
+    if action != "post_add" or not pk_set:
+        return
+    if reverse:  # user.contributing_projects.add(...)
+        for project_id in pk_set:
+            changes.record_contributors(project_id, [instance.id], "create")
+    else:
+        changes.record_contributors(instance.id, pk_set, "create")
+
+
+@receiver(post_save, sender=Issue)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Contributor)
+def increment_counters(sender, instance, created, raw=False, **kwargs):
+    """Keep issues, comments and contributors counts up to date on creations."""
+    if not created or raw:
+        return
+    if sender is Issue:
+        counters.add_issues(instance.project_id)
+    elif sender is Comment:
+        counters.add_comments(instance.issue_id)
+    else:
+        counters.add_contributors(instance.project_id)
+
+
+@receiver(post_delete, sender=Issue)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Contributor)
+def decrement_counters(sender, instance, origin=None, **kwargs):
+    """
+    Keep issues, comments and contributors counts up to date on deletions, except for
+    rows deleted in cascade with their project or issue (it is deleted too).
+    """
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if issubclass(origin_model, Project) or (
+        sender is Comment and issubclass(origin_model, Issue)
+    ):
+        return
+    if sender is Issue:
+        counters.add_issues(instance.project_id, -1)
+    elif sender is Comment:
+        counters.add_comments(instance.issue_id, -1)
+    else:
+        counters.add_contributors(instance.project_id, -1)
+
+
+@receiver(m2m_changed, sender=Contributor)
+def count_contributors_added(sender, instance, action, reverse, pk_set, **kwargs):
+    """Contributors added with project.contributors.add() (no post_save sent)."""
+    if action != "post_add" or not pk_set:
+        return
+    if reverse:
+        for project_id in pk_set:
+            counters.add_contributors(project_id)
+    else:
+        counters.add_contributors(instance.id, len(pk_set))
+
+
+@receiver(post_save, sender=Issue)
+def refresh_issue_workload(sender, instance, created, using, raw=False, **kwargs):
+    """Status or priority changes of an issue change the workload of its assignees."""
+    if created or raw:  # new issues have no assignees yet
+        return
+    workload.schedule_issues(using, [instance.id])
+
+
+@receiver(pre_delete, sender=Issue)
+def refresh_deleted_issue_workload(sender, instance, using, **kwargs):
+    """Assignees of a deleted issue, while they are still known."""
+    workload.schedule_issues(using, [instance.id])
+
+
+@receiver(m2m_changed, sender=Assignment)
+def refresh_assignees_workload(
+    sender, instance, action, reverse, pk_set, using, **kwargs
+):
+    """
+    Assignees added or removed with add(), remove() or set(). No post_delete is sent
+    for the rows of the assignees table, even when they are deleted in cascade.
+    """
+    if action == "pre_clear":
+        if reverse:  # user.issues_assigned.clear()
+            workload.schedule_assignments(using, user_id=instance.id)
+        else:
+            workload.schedule_issues(using, [instance.id])
+    elif action in ("post_add", "post_remove") and pk_set:
+        if reverse:  # user.issues_assigned.add(...)
+            projects = Issue.objects.using(using).filter(id__in=pk_set)
+            workload.schedule(
+                using,
+                [
+                    (instance.id, project_id)
+                    for project_id in projects.values_list("project_id", flat=True)
+                ],
+            )
+        else:
+            workload.schedule(
+                using, [(user_id, instance.project_id) for user_id in pk_set]
+            )
+
+
+@receiver(post_save, sender=Issue)
+def refresh_issue_inbox(sender, instance, using, raw=False, **kwargs):
+    """The author, status, priority or name of an issue may have changed."""
+    if raw:
+        return
+    inbox.schedule_issues(using, [instance.id])
+
+
+@receiver(m2m_changed, sender=Assignment)
+def refresh_assignees_inbox(sender, instance, action, reverse, pk_set, using, **kwargs):
+    """Assignees added or removed with add(), remove(), set() or clear()."""
+    if reverse:  # user.issues_assigned...
+        if action == "pre_clear":
+            inbox.schedule_issues(
+                using,
+                Assignment.objects.using(using)
+                .filter(user_id=instance.id)
+                .values_list("issue_id", flat=True),
+            )
+        elif action in ("post_add", "post_remove") and pk_set:
+            inbox.schedule_issues(using, pk_set)
+    elif action in ("post_add", "post_remove", "post_clear"):
+        inbox.schedule_issues(using, [instance.id])
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=Issue)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Contributor)
+def check_shard(sender, instance, created, using, **kwargs):
+    """The id of a new object must be in the range of the shard it was created on."""
+    if created and sharding.shard_for_id(instance.pk) != using:
+        raise ImproperlyConfigured(
+            f"{sender.__name__} {instance.pk} was created on {using}, outside of "
+            "its ids range: run the init_shards command"
+        )
+
+
+@receiver(post_save, sender=User)
+def mirror_user(sender, instance, using, **kwargs):
+    """Copy users saved on the default database to the shards."""
+    if using == sharding.GLOBAL_DATABASE:
+        sharding.mirror_users([instance])
+
+
+@receiver(post_delete, sender=User)
+def delete_user_mirrors(sender, instance, using, **kwargs):
+    """Delete users deleted from the default database from the shards."""
+    if using == sharding.GLOBAL_DATABASE:
+        sharding.delete_user_mirrors(instance.pk)
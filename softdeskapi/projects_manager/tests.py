@@ -1,3 +1,1406 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import json
+import os
+import re
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from projects_manager import counters, events, notifications, ranking, sharding
+from projects_manager.models import (
+    Project,
+    Issue,
+    Comment,
+    ChangeEvent,
+    IdempotencyKey,
+    InboxEntry,
+    Notification,
+    VersionConflict,
+)
+from projects_manager.loaders import RequestLoader
+from projects_manager.views import IssueViewSet
+
+User = get_user_model()
+
+
+def create_user(username, can_be_contacted=True, **kwargs):
+    """Create an active user, who can be contacted by default."""
+    return User.objects.create_user(
+        username,
+        datetime.date(1990, 1, 1),
+        can_be_contacted,
+        True,
+        "password",
+        **kwargs,
+    )
+
+
+def create_project(author, *contributors, name="Project"):
+    """Create a project with its author and contributors."""
+    project = Project.objects.create(
+        name=name, description="Description", type="backend", author=author
+    )
+    project.contributors.add(author, *contributors)
+    return project
+
+
+def create_issue(project, author, name="Issue", **kwargs):
+    """Create an issue of a project."""
+    fields = {"type": "bug", "priority": "low", "status": "todo", **kwargs}
+    return Issue.objects.create(
+        project=project, author=author, name=name, description="Description", **fields
+    )
+
+
+def create_comment(issue, author):
+    """Create a comment on an issue."""
+    return Comment.objects.create(issue=issue, author=author, description="Comment")
+
+
+class APITestCase(TestCase):
+    """Test case with a client authenticated as a user."""
+
+    def setUp(self):
+        self.user = create_user("author")
+        self.client = self.client_for(self.user)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+
+class ChangeLogTests(APITestCase):
+    def test_changes_are_recorded(self):
+        project = create_project(self.user)
+        issue = create_issue(project, self.user)
+        issue.name = "Renamed"
+        issue.save()
+        comment = create_comment(issue, self.user)
+        comment_id = comment.id
+        comment.delete()
+
+        events = list(
+            ChangeEvent.objects.order_by("id").values_list(
+                "action", "model", "object_id"
+            )
+        )
+        self.assertEqual(
+            events,
+            [
+                ("create", "project", project.id),
+                ("create", "contributor", self.user.id),
+                ("create", "issue", issue.id),
+                ("update", "issue", issue.id),
+                ("create", "comment", comment_id),
+                ("delete", "comment", comment_id),
+            ],
+        )
+        self.assertEqual(
+            ChangeEvent.objects.get(model="comment", action="create").project_id,
+            project.id,
+        )
+
+    def test_cascade_deletion_is_recorded_at_once(self):
+        contributor = create_user("contributor")
+        project = create_project(self.user, contributor)
+        issues = [create_issue(project, self.user, name=f"Issue {i}") for i in range(3)]
+        comments = [create_comment(issue, contributor) for issue in issues]
+        since = ChangeEvent.objects.latest("id").id
+        project_id = project.id
+        issue_ids = [issue.id for issue in issues]
+        comment_ids = [comment.id for comment in comments]
+
+        with CaptureQueriesContext(connection) as queries:
+            project.delete()
+
+        inserts = [
+            query
+            for query in queries.captured_queries
+            if query["sql"].startswith("INSERT")
+            and ChangeEvent._meta.db_table in query["sql"]
+        ]
+        self.assertEqual(len(inserts), 1)
+        deleted = set(
+            ChangeEvent.objects.filter(id__gt=since).values_list(
+                "action", "model", "object_id", "project_id"
+            )
+        )
+        self.assertEqual(
+            deleted,
+            {("delete", "project", project_id, project_id)}
+            | {
+                ("delete", "contributor", user.id, project_id)
+                for user in (self.user, contributor)
+            }
+            | {("delete", "issue", id, project_id) for id in issue_ids}
+            | {("delete", "comment", id, project_id) for id in comment_ids},
+        )
+
+    def test_feed_only_returns_visible_events_after_cursor(self):
+        other = create_user("other")
+        project = create_project(self.user)
+        create_project(other, name="Hidden")
+        since = ChangeEvent.objects.filter(project_id=project.id).latest("id").id
+        issue = create_issue(project, self.user)
+
+        response = self.client.get("/api/changes/", {"since": since})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [
+                (event["model"], event["object_id"])
+                for event in response.data["results"]
+            ],
+            [("issue", issue.id)],
+        )
+        self.assertEqual(response.data["cursor"], ChangeEvent.objects.latest("id").id)
+        self.assertFalse(response.data["has_more"])
+
+    def test_feed_pagination(self):
+        project = create_project(self.user)
+        for i in range(3):
+            create_issue(project, self.user, name=f"Issue {i}")
+
+        first = self.client.get("/api/changes/", {"limit": 2}).data
+        second = self.client.get(
+            "/api/changes/", {"since": first["cursor"], "limit": 10}
+        ).data
+
+        self.assertTrue(first["has_more"])
+        self.assertFalse(second["has_more"])
+        ids = [event["id"] for event in first["results"] + second["results"]]
+        self.assertEqual(
+            ids, list(ChangeEvent.objects.order_by("id").values_list("id", flat=True))
+        )
+
+
+@override_settings(EVENT_STREAMS={"MAX_DURATION": 0.1})
+class EventStreamTests(TestCase):
+    def setUp(self):
+        self.owner = create_user("owner")
+        self.member = create_user("member")
+        self.project = create_project(self.owner, self.member)
+        self.owner_issue = create_issue(self.project, self.owner)
+        self.member_issue = create_issue(self.project, self.member, name="Member's")
+        self.since = ChangeEvent.objects.latest("id").id
+
+    def make_changes(self):
+        """The member leaves the project, then issues change."""
+        self.project.contributors.remove(self.member)
+        self.owner_issue.name = "Renamed"
+        self.owner_issue.save()
+        comment = create_comment(self.member_issue, self.owner)
+        comment_id, issue_id = comment.id, self.member_issue.id
+        self.member_issue.delete()
+        return comment_id, issue_id
+
+    def get_streamed(self, user, replay=(), live=()):
+        """Return the (name, object id) of the events streamed to a contributor."""
+
+        async def collect():
+            subscription = events.broker.subscribe(self.project.id, user, True)
+            for event in live:
+                events.broker.publish(self.project.id, event)
+            return "".join(
+                [chunk async for chunk in events.stream(subscription, replay)]
+            )
+
+        text = asyncio.run(collect())
+        return [
+            (name, json.loads(data)["object_id"])
+            for name, data in re.findall(r"event: (\S+)\ndata: (.*)\n", text)
+        ]
+
+    def test_replay(self):
+        comment_id, issue_id = self.make_changes()
+        replay, overflowed = events.get_replay(self.project.id, self.since)
+
+        self.assertFalse(overflowed)
+        # After leaving the project, the member only sees his own issue
+        self.assertEqual(
+            self.get_streamed(self.member, replay),
+            [("contributor.delete", self.member.id), ("issue.delete", issue_id)],
+        )
+        self.assertEqual(
+            self.get_streamed(self.owner, replay),
+            [
+                ("contributor.delete", self.member.id),
+                ("issue.update", self.owner_issue.id),
+                ("comment.create", comment_id),
+                ("comment.delete", comment_id),
+                ("issue.delete", issue_id),
+            ],
+        )
+
+    def test_live(self):
+        self.make_changes()
+        live = [
+            events.to_event(change)
+            for change in ChangeEvent.objects.filter(
+                id__gt=self.since, model__in=events.STREAMED_MODELS
+            ).order_by("id")
+        ]
+
+        streamed = self.get_streamed(self.member, live=live)
+
+        self.assertEqual(
+            [name for name, _ in streamed], ["contributor.delete", "issue.delete"]
+        )
+
+    def test_access(self):
+        outsider = create_user("outsider")
+
+        self.assertIsNone(events.get_access(outsider, self.project.id))
+        self.assertTrue(events.get_access(self.member, self.project.id))
+        self.project.contributors.remove(self.owner)
+        self.assertFalse(events.get_access(self.owner, self.project.id))
+
+
+delivered = []
+
+
+def record_delivery(recipient, notifications):
+    """Notifications backend keeping what is delivered."""
+    delivered.append((recipient.id, [n.event for n in notifications]))
+
+
+def fail_delivery(recipient, notifications):
+    """Notifications backend always failing."""
+    raise ConnectionError("unreachable")
+
+
+@override_settings(
+    NOTIFICATIONS={
+        "BACKEND": "projects_manager.tests.record_delivery",
+        "MAX_ATTEMPTS": 2,
+    }
+)
+class NotificationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        delivered.clear()
+        self.assignee = create_user("assignee")
+        self.quiet = create_user("quiet", can_be_contacted=False)
+        self.project = create_project(self.user, self.assignee, self.quiet)
+
+    def create_issue(self):
+        response = self.client.post(
+            "/api/issues/",
+            {
+                "project": self.project.id,
+                "name": "Issue",
+                "description": "Description",
+                "type": "bug",
+                "priority": "low",
+                "status": "todo",
+                "assignees": [self.user.id, self.assignee.id, self.quiet.id],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data["id"]
+
+    def test_outbox(self):
+        with mock.patch("softdeskapi.tasks.submit") as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                issue_id = self.create_issue()
+                # Written in the request, delivered after commit
+                submit.assert_not_called()
+        self.assertIn(mock.call(notifications.dispatch_pending), submit.call_args_list)
+        self.assertEqual(
+            list(Notification.objects.values_list("recipient_id", "event", "status")),
+            [(self.assignee.id, "assigned", "pending")],
+        )
+        self.assertEqual(
+            Notification.objects.get().payload,
+            {"issue": issue_id, "project": self.project.id, "by": self.user.id},
+        )
+
+        response = self.client_for(self.assignee).post(
+            "/api/comments/",
+            {
+                "issue": f"http://localhost:8000/api/issues/{issue_id}/",
+                "description": "Comment",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        # The author of the issue, not the author of the comment
+        self.assertEqual(
+            list(
+                Notification.objects.filter(event="commented").values_list("recipient")
+            ),
+            [(self.user.id,)],
+        )
+
+    def test_delivery(self):
+        self.create_issue()
+        create_comment(Issue.objects.get(), self.assignee)
+        notifications.notify_commented(Comment.objects.get())
+
+        self.assertEqual(notifications.dispatch_pending(), (2, 0))
+
+        self.assertEqual(
+            sorted(delivered),
+            [(self.user.id, ["commented"]), (self.assignee.id, ["assigned"])],
+        )
+        self.assertEqual(
+            set(Notification.objects.values_list("status", flat=True)), {"sent"}
+        )
+        self.assertEqual(notifications.dispatch_pending(), (0, 0))
+
+    @override_settings(
+        NOTIFICATIONS={
+            "BACKEND": "projects_manager.tests.fail_delivery",
+            "MAX_ATTEMPTS": 2,
+            "RETRY_DELAY": 30,
+        }
+    )
+    def test_retries(self):
+        self.create_issue()
+
+        with mock.patch("softdeskapi.tasks.submit_later") as submit_later:
+            self.assertEqual(notifications.dispatch_pending(), (0, 1))
+        submit_later.assert_called_once_with(30, notifications.dispatch_pending)
+        notification = Notification.objects.get()
+        self.assertEqual((notification.status, notification.attempts), ("pending", 1))
+        self.assertEqual(notification.last_error, "unreachable")
+        self.assertGreater(notification.next_attempt_time, timezone.now())
+        # Not due yet
+        self.assertEqual(notifications.claim_batch(), [])
+
+        Notification.objects.update(next_attempt_time=timezone.now())
+        with mock.patch("softdeskapi.tasks.submit_later"):
+            notifications.dispatch_pending()
+        notification.refresh_from_db()
+        self.assertEqual((notification.status, notification.attempts), ("failed", 2))
+
+    def test_stale_claim(self):
+        self.create_issue()
+        self.assertEqual(len(notifications.claim_batch()), 1)
+        self.assertEqual(notifications.claim_batch(), [])
+
+        Notification.objects.update(
+            claimed_time=timezone.now() - datetime.timedelta(hours=1)
+        )
+        self.assertEqual(notifications.dispatch_pending(), (1, 0))
+
+
+class CounterTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.contributor = create_user("contributor")
+        self.project = create_project(self.user, self.contributor)
+
+    def assertCounters(self, project, issues, contributors):
+        project.refresh_from_db()
+        self.assertEqual(
+            (project.issues_count, project.contributors_count), (issues, contributors)
+        )
+
+    def test_creations_and_deletions(self):
+        issue = create_issue(self.project, self.user)
+        create_issue(self.project, self.user, name="Other")
+        comment = create_comment(issue, self.user)
+        create_comment(issue, self.contributor)
+        self.assertCounters(self.project, 2, 2)
+        issue.refresh_from_db()
+        self.assertEqual(issue.comments_count, 2)
+
+        comment.delete()
+        self.project.contributors.remove(self.contributor)
+        issue.refresh_from_db()
+        self.assertEqual(issue.comments_count, 1)
+        self.assertCounters(self.project, 2, 1)
+
+    def test_cascade_deletion_of_issue(self):
+        issue = create_issue(self.project, self.user)
+        for _ in range(3):
+            create_comment(issue, self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            issue.delete()
+
+        # The comments of the deleted issue don't update its counter
+        updates = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith(f'UPDATE "{Issue._meta.db_table}"')
+        ]
+        self.assertEqual(updates, [])
+        self.assertCounters(self.project, 0, 2)
+
+    def test_cascade_deletion_of_project(self):
+        other = create_project(self.user, name="Other")
+        issue = create_issue(self.project, self.user)
+        create_comment(issue, self.user)
+        create_issue(other, self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.project.delete()
+
+        updates = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith(
+                (
+                    f'UPDATE "{Issue._meta.db_table}"',
+                    f'UPDATE "{Project._meta.db_table}"',
+                )
+            )
+        ]
+        self.assertEqual(updates, [])
+        self.assertCounters(other, 1, 1)
+
+    def test_deleting_contributor_updates_project(self):
+        self.contributor.delete()
+        self.assertCounters(self.project, 0, 1)
+
+    def test_reconcile(self):
+        issue = create_issue(self.project, self.user)
+        create_comment(issue, self.user)
+        Project.objects.filter(id=self.project.id).update(
+            issues_count=5, contributors_count=0
+        )
+        Issue.objects.filter(id=issue.id).update(comments_count=0)
+
+        self.assertEqual(counters.reconcile(), (1, 1))
+        self.assertCounters(self.project, 1, 2)
+        issue.refresh_from_db()
+        self.assertEqual(issue.comments_count, 1)
+        self.assertEqual(counters.reconcile(), (0, 0))
+
+
+class BulkStatusTests(APITestCase):
+    def test_results(self):
+        contributor = create_user("contributor")
+        project = create_project(self.user, contributor)
+        hidden = create_project(contributor, name="Hidden")
+        updated = create_issue(project, self.user)
+        assigned = create_issue(project, contributor, name="Assigned")
+        assigned.assignees.add(self.user)
+        unchanged = create_issue(project, self.user, name="Unchanged")
+        forbidden = create_issue(project, contributor, name="Forbidden")
+        not_visible = create_issue(hidden, contributor, name="Not visible")
+
+        response = self.client.post(
+            "/api/issues/bulk-status/",
+            [
+                {"id": updated.id, "status": "todo"},
+                {"id": updated.id, "status": "finished"},
+                {"id": assigned.id, "status": "in_progress"},
+                {"id": unchanged.id, "status": "todo"},
+                {"id": forbidden.id, "status": "finished"},
+                {"id": not_visible.id, "status": "finished"},
+                {"id": 0, "status": "finished"},
+            ],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {item["id"]: item["result"] for item in response.data},
+            {
+                updated.id: "updated",
+                assigned.id: "updated",
+                unchanged.id: "unchanged",
+                forbidden.id: "forbidden",
+                not_visible.id: "not_found",
+                0: "not_found",
+            },
+        )
+        statuses = dict(Issue.objects.values_list("id", "status"))
+        self.assertEqual(statuses[updated.id], "finished")
+        self.assertEqual(statuses[assigned.id], "in_progress")
+        self.assertEqual(statuses[forbidden.id], "todo")
+        self.assertEqual(statuses[not_visible.id], "todo")
+        updated_version = updated.version
+        updated.refresh_from_db()
+        self.assertEqual(updated.version, updated_version + 1)
+
+    def test_invalid_status(self):
+        project = create_project(self.user)
+        issue = create_issue(project, self.user)
+
+        response = self.client.post(
+            "/api/issues/bulk-status/",
+            [{"id": issue.id, "status": "done"}],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        issue.refresh_from_db()
+        self.assertEqual(issue.status, "todo")
+
+
+class ConditionalWriteTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.contributor = create_user("contributor")
+        self.outsider = create_user("outsider")
+        self.project = create_project(self.user, self.contributor)
+        self.issue = create_issue(self.project, self.user)
+        self.comment = create_comment(self.issue, self.user)
+
+    def test_delete(self):
+        url = f"/api/comments/{self.comment.id}/"
+
+        self.assertEqual(self.client_for(self.outsider).delete(url).status_code, 404)
+        self.assertEqual(self.client_for(self.contributor).delete(url).status_code, 403)
+        self.assertTrue(Comment.objects.filter(id=self.comment.id).exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(url)
+
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Comment.objects.filter(id=self.comment.id).exists())
+        # Only the deletion collector loads the comment, there is no get_object()
+        selects = [
+            query
+            for query in queries.captured_queries
+            if query["sql"].startswith(f'SELECT "{Comment._meta.db_table}"')
+        ]
+        self.assertEqual(len(selects), 1)
+
+    def test_partial_update(self):
+        url = f"/api/comments/{self.comment.id}/"
+
+        response = self.client_for(self.contributor).patch(
+            url, {"description": "Changed"}
+        )
+        self.assertEqual(response.status_code, 403)
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.description, "Comment")
+
+        response = self.client.patch(url, {"description": "Changed"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["description"], "Changed")
+        self.comment.refresh_from_db()
+        self.assertEqual(
+            (self.comment.description, self.comment.version), ("Changed", 2)
+        )
+
+    def test_assignee_can_change_status(self):
+        self.issue.assignees.add(self.user, self.contributor)
+        url = f"/api/issues/{self.issue.id}/"
+        client = self.client_for(self.contributor)
+
+        response = client.patch(url, {"status": "in_progress"})
+
+        self.assertEqual(response.status_code, 200)
+        self.issue.refresh_from_db()
+        self.assertEqual((self.issue.status, self.issue.version), ("in_progress", 2))
+        # Several assignees match the write filter, the issue is still returned once
+        response = self.client.patch(url, {"status": "finished"})
+        self.assertEqual(response.data["status"], "finished")
+
+    def test_non_assignee_cannot_change_status(self):
+        url = f"/api/issues/{self.issue.id}/"
+
+        response = self.client_for(self.contributor).patch(url, {"status": "finished"})
+
+        self.assertEqual(response.status_code, 403)
+        self.issue.refresh_from_db()
+        self.assertEqual(self.issue.status, "todo")
+
+    def test_invalid_value(self):
+        response = self.client.patch(
+            f"/api/issues/{self.issue.id}/", {"status": "done"}
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("status", response.data)
+
+    def test_invalid_pk(self):
+        for url in ("/api/comments/abc/", "/api/issues/abc/", "/api/projects/abc/"):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.delete(url).status_code, 404)
+                response = self.client.patch(url, {"description": "Changed"})
+                self.assertEqual(response.status_code, 404)
+
+
+class LoaderTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = create_user("other")
+        self.projects = [
+            create_project(self.user, name=f"Project {i}") for i in range(3)
+        ]
+        self.ids = [project.id for project in self.projects]
+
+    def test_one_query_per_model_and_pks(self):
+        loader = RequestLoader()
+
+        with self.assertNumQueries(1):
+            found = loader.get_many(Project, [*self.ids, 0])
+        self.assertEqual(set(found), set(self.ids))
+        with self.assertNumQueries(0):
+            self.assertEqual(loader.get(Project, str(self.ids[0])).name, "Project 0")
+            with self.assertRaises(Project.DoesNotExist):
+                loader.get(Project, 0)
+            loader.get_many(Project, self.ids[:2])
+        with self.assertNumQueries(1):
+            loader.get_many(User, [self.user.id, self.other.id])
+        self.assertEqual((loader.queries, loader.hits), (2, 4))
+
+    def test_invalid_pk(self):
+        with self.assertRaises(ValueError):
+            RequestLoader().get(Project, "abc")
+
+    def test_restricted_queryset(self):
+        loader = RequestLoader()
+        loader.get_many(Project, self.ids)
+        others = Project.objects.filter(contributors=self.other)
+
+        # Loaded without restriction, but not in the queryset
+        with self.assertNumQueries(1), self.assertRaises(Project.DoesNotExist):
+            loader.get(Project, self.ids[0], others)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                loader.get_many(Project, self.ids, Project.objects.none()), {}
+            )
+
+        self.projects[1].contributors.add(self.other)
+        loader = RequestLoader()
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                set(loader.get_many(Project, self.ids, others)), {self.ids[1]}
+            )
+        # Found in the queryset, it exists
+        with self.assertNumQueries(0):
+            loader.get(Project, self.ids[1])
+            loader.get(Project, self.ids[1], Project.objects.all())
+
+    def test_assignees_loaded_at_once(self):
+        users = [create_user(f"user{i}") for i in range(3)]
+        project = create_project(self.user, *users)
+        table = User._meta.db_table
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                "/api/issues/",
+                {
+                    "project": project.id,
+                    "name": "Issue",
+                    "description": "Description",
+                    "type": "bug",
+                    "priority": "low",
+                    "status": "todo",
+                    "assignees": [user.id for user in users],
+                },
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, 201, response.data)
+        # The assignees are validated with one query, not one per user
+        loads = [
+            query["sql"]
+            for query in queries.captured_queries
+            if f'FROM "{table}" WHERE' in query["sql"]
+            and f'"{table}"."id" IN (' in query["sql"]
+            and f'"{table}"."password"' in query["sql"]
+        ]
+        self.assertEqual(len(loads), 1, loads)
+
+
+@override_settings(
+    PROJECT_SHARDS=["default", "shard1", "shard2"], PROJECT_SHARD_ID_SPAN=100
+)
+class ShardingTests(TestCase):
+    def test_shard_for_id(self):
+        self.assertEqual(sharding.shard_for_id(5), "default")
+        self.assertEqual(sharding.shard_for_id(150), "shard1")
+        self.assertEqual(sharding.shard_for_id("250"), "shard2")
+        self.assertIsNone(sharding.shard_for_id(300))
+        self.assertIsNone(sharding.shard_for_id(-1))
+        self.assertIsNone(sharding.shard_for_id("abc"))
+        self.assertIsNone(sharding.shard_for_id(None))
+        with override_settings(PROJECT_SHARDS=["default"]):
+            self.assertEqual(sharding.shard_for_id(10**15), "default")
+
+    def test_group_by_shard(self):
+        self.assertEqual(
+            sharding.group_by_shard(Issue, [5, 150, 7, 300]),
+            {"default": [5, 7], "shard1": [150], None: [300]},
+        )
+        self.assertEqual(
+            sharding.group_by_shard(ChangeEvent, [5, 150]), {None: [5, 150]}
+        )
+
+    def test_router(self):
+        router = sharding.ShardRouter()
+        issue = Issue()
+        issue._state.db = "shard2"
+
+        self.assertEqual(router.db_for_read(Issue), "default")
+        self.assertEqual(router.db_for_read(Issue, instance=issue), "shard2")
+        self.assertEqual(router.db_for_read(User, instance=issue), "shard2")
+        self.assertEqual(router.db_for_read(User), "default")
+        self.assertEqual(router.db_for_write(User, instance=issue), "default")
+        with sharding.use_shard("shard1"):
+            self.assertEqual(router.db_for_read(Comment), "shard1")
+            self.assertEqual(router.db_for_write(Issue), "shard1")
+            self.assertEqual(router.db_for_write(Issue, instance=issue), "shard2")
+            self.assertEqual(router.db_for_read(ChangeEvent), "default")
+            self.assertEqual(router.db_for_write(ChangeEvent), "default")
+
+        project = Project()
+        project._state.db = "shard1"
+        self.assertFalse(router.allow_relation(issue, project))
+        project._state.db = "shard2"
+        self.assertTrue(router.allow_relation(issue, project))
+        self.assertTrue(router.allow_relation(issue, User()))
+
+
+class ShardedListTests(TestCase):
+    def setUp(self):
+        author = create_user("author")
+        project = create_project(author)
+        self.ids = [
+            create_issue(project, author, name=f"Issue {i}").id for i in range(7)
+        ]
+
+        # Two fake shards with interleaved ids, on the test database
+        def fan_out(queryset):
+            return [
+                queryset.filter(id__in=self.ids[::2]),
+                queryset.filter(id__in=self.ids[1::2]),
+            ]
+
+        patcher = mock.patch("projects_manager.sharding.fan_out", fan_out)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_merge(self):
+        rows = sharding.ShardedList(Issue.objects.all())
+
+        self.assertEqual(len(rows), 7)
+        self.assertEqual([issue.id for issue in rows[:7]], self.ids)
+        self.assertEqual([issue.id for issue in rows[2:5]], self.ids[2:5])
+        self.assertEqual(rows[3].id, self.ids[3])
+        self.assertEqual(rows[6:10], [rows[6]])
+
+    def test_merge_values(self):
+        rows = sharding.ShardedList(Issue.objects.values("id", "name"))
+
+        self.assertEqual([row["id"] for row in rows[1:4]], self.ids[1:4])
+
+    def test_slice_reads_stop_rows_per_shard(self):
+        rows = sharding.ShardedList(Issue.objects.all())
+
+        with CaptureQueriesContext(connection) as queries:
+            rows[0:2]
+
+        self.assertEqual(len(queries), 2)
+        self.assertTrue(all("LIMIT 2" in query["sql"] for query in queries))
+
+    def test_iterate(self):
+        self.assertEqual(
+            [issue.id for issue in sharding.iterate(Issue.objects.all(), chunk_size=2)],
+            self.ids,
+        )
+
+
+class IdempotencyTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.data = {
+            "name": "Project",
+            "description": "Description",
+            "type": "backend",
+            "contributors": [self.user.id],
+        }
+
+    def post(self, data, key="key", client=None):
+        return (client or self.client).post(
+            "/api/projects/", data, format="json", HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_replay(self):
+        first = self.post(self.data)
+        second = self.post(self.data)
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertFalse(first.has_header("Idempotent-Replayed"))
+        self.assertEqual(Project.objects.count(), 1)
+
+    def test_fingerprint_mismatch(self):
+        self.post(self.data)
+
+        response = self.post({**self.data, "name": "Other"})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Project.objects.count(), 1)
+
+    def test_keys_are_scoped_to_the_user(self):
+        self.post(self.data)
+        other = self.client_for(create_user("other"))
+
+        response = self.post({**self.data, "name": "Other"}, client=other)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header("Idempotent-Replayed"))
+        self.assertEqual(Project.objects.count(), 2)
+
+    def test_errors_are_not_stored(self):
+        self.assertEqual(self.post({"name": "Project"}).status_code, 400)
+
+        response = self.post(self.data)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header("Idempotent-Replayed"))
+
+    def test_expired_key(self):
+        self.post(self.data)
+        IdempotencyKey.objects.update(
+            created_time=timezone.now() - datetime.timedelta(days=2)
+        )
+
+        # The key can be used again, for another request
+        response = self.post({**self.data, "name": "Other"})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header("Idempotent-Replayed"))
+        self.assertEqual(Project.objects.count(), 2)
+
+    def test_invalid_key(self):
+        self.assertEqual(self.post(self.data, key="").status_code, 400)
+        self.assertEqual(self.post(self.data, key="k" * 256).status_code, 400)
+        self.assertEqual(Project.objects.count(), 0)
+
+
+class VersionTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.default_format = "json"
+        self.project = create_project(self.user)
+        self.issue = create_issue(self.project, self.user)
+        self.url = f"/api/issues/{self.issue.id}/"
+
+    def test_save_stale_instance(self):
+        stale = Issue.objects.get(id=self.issue.id)
+        self.issue.name = "Renamed"
+        self.issue.save()
+        self.assertEqual(self.issue.version, 2)
+
+        stale.name = "Other"
+        with self.assertRaises(VersionConflict), transaction.atomic():
+            stale.save()
+        self.issue.refresh_from_db()
+        self.assertEqual((self.issue.name, self.issue.version), ("Renamed", 2))
+
+    def test_save_with_explicit_pk(self):
+        project = Project(
+            id=50, name="Explicit", description="Description", type="backend"
+        )
+        project.save()
+
+        self.assertEqual(Project.objects.get(id=50).version, 1)
+        project.name = "Renamed"
+        project.save()
+        self.assertEqual(Project.objects.get(id=50).version, 2)
+
+    def test_save_deleted_row(self):
+        stale = Issue.objects.get(id=self.issue.id)
+        Issue.objects.filter(id=self.issue.id).delete()
+
+        # Not a version conflict: like Django, update_fields (always set for the
+        # models with counters) fails on a missing row
+        with self.assertRaisesMessage(DatabaseError, "did not affect any rows"):
+            with transaction.atomic():
+                stale.save()
+
+    def test_loaddata(self):
+        fixture = [
+            {
+                "model": "projects_manager.project",
+                "pk": pk,
+                "fields": {
+                    "name": name,
+                    "description": "Description",
+                    "type": "backend",
+                    "author": self.user.id,
+                    "created_time": "2024-01-01T00:00:00Z",
+                    "version": 3,
+                },
+            }
+            for pk, name in ((self.project.id, "Loaded"), (60, "New"))
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "projects.json")
+            with open(path, "w") as file:
+                json.dump(fixture, file)
+            call_command("loaddata", path, verbosity=0)
+
+        self.assertEqual(
+            list(Project.objects.order_by("id").values_list("id", "name", "version")),
+            [(self.project.id, "Loaded", 3), (60, "New", 3)],
+        )
+
+    def test_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["ETag"], '"1"')
+
+        response = self.client.patch(self.url, {"status": "finished"})
+        self.assertEqual(response["ETag"], '"2"')
+
+    def test_if_match(self):
+        self.client.patch(self.url, {"status": "in_progress"})
+
+        for data in ({"status": "finished"}, {"name": "Renamed"}):
+            with self.subTest(data=data):
+                response = self.client.patch(self.url, data, HTTP_IF_MATCH='"1"')
+                self.assertEqual(response.status_code, 412)
+        self.assertEqual(
+            self.client.delete(self.url, HTTP_IF_MATCH='"1"').status_code, 412
+        )
+        self.issue.refresh_from_db()
+        self.assertEqual(
+            (self.issue.name, self.issue.status, self.issue.version),
+            ("Issue", "in_progress", 2),
+        )
+
+        # Weak ETags (from the compression middleware) are accepted
+        response = self.client.patch(
+            self.url, {"name": "Renamed"}, HTTP_IF_MATCH='W/"2"'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], '"3"')
+        self.assertEqual(
+            self.client.delete(self.url, HTTP_IF_MATCH='"3"').status_code, 204
+        )
+
+    def test_concurrent_write_without_if_match(self):
+        get_object = IssueViewSet.get_object
+
+        def get_stale_object(view):
+            issue = get_object(view)
+            # Another request updates the issue after it was loaded
+            Issue.objects.filter(id=issue.id).update(
+                name="Concurrent", version=F("version") + 1
+            )
+            return issue
+
+        with mock.patch.object(IssueViewSet, "get_object", get_stale_object):
+            response = self.client.patch(self.url, {"name": "Renamed"})
+
+        self.assertEqual(response.status_code, 409)
+        # The request is rolled back, here with the simulated concurrent update
+        self.issue.refresh_from_db()
+        self.assertEqual((self.issue.name, self.issue.version), ("Issue", 1))
+
+
+class RankingTests(TestCase):
+    def assertBetween(self, a, b):
+        key = ranking.key_between(a, b)
+        self.assertLess(a or "", key)
+        if b:
+            self.assertLess(key, b)
+        self.assertFalse(key.endswith("0"))
+        return key
+
+    def test_key_between(self):
+        self.assertEqual(ranking.key_between(None, None), "i")
+        self.assertEqual(ranking.key_between("a", "c"), "b")
+        self.assertEqual(ranking.key_between("a", "b"), "ai")
+        self.assertEqual(ranking.key_between("b", "b1"), "b0i")
+        for a, b in [
+            (None, "1"),
+            (None, "01"),
+            ("z", None),
+            ("zz", None),
+            ("a", "a01"),
+            ("ai", "b"),
+            ("az", "b"),
+            ("a1", "a2"),
+            ("abc", "abd"),
+            ("y", "z"),
+        ]:
+            with self.subTest(a=a, b=b):
+                self.assertBetween(a, b)
+
+    def test_repeated_moves_keep_order(self):
+        # Always moving an issue between the same neighbours
+        low, high = "a", "b"
+        for _ in range(50):
+            high = self.assertBetween(low, high)
+        for _ in range(50):
+            low = self.assertBetween(low, high)
+
+    def test_key_after(self):
+        self.assertEqual(ranking.key_after(None), "i")
+        self.assertEqual(ranking.key_after("i"), "j")
+        self.assertEqual(ranking.key_after("a9"), "aa")
+        self.assertEqual(ranking.key_after("az"), "b1")
+        self.assertEqual(ranking.key_after("z"), "z01")
+        self.assertEqual(ranking.key_after("zz"), "zz001")
+        key = "m"
+        for _ in range(100):
+            following = ranking.key_after(key)
+            self.assertLess(key, following)
+            self.assertFalse(following.endswith("0"))
+            self.assertLessEqual(len(following), max(len(key), 3))
+            key = following
+
+    def test_spread_keys(self):
+        for count in (0, 1, 10, 35, 36, 1000):
+            with self.subTest(count=count):
+                keys = ranking.spread_keys(count)
+                self.assertEqual(len(keys), count)
+                self.assertEqual(keys, sorted(set(keys)))
+                self.assertTrue(all(key and key[-1] != "0" for key in keys))
+                if keys:
+                    self.assertLess("", ranking.key_between(None, keys[0]))
+                    self.assertLess(keys[-1], ranking.key_after(keys[-1]))
+
+
+class RankTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.project = create_project(self.user)
+        self.issues = [
+            create_issue(self.project, self.user, name=f"Issue {i}") for i in range(4)
+        ]
+
+    def get_order(self):
+        response = self.client.get(
+            "/api/issues/", {"project": self.project.id, "ordering": "rank"}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [issue["id"] for issue in response.data["results"]]
+
+    def move(self, issue, **data):
+        response = self.client.post(
+            f"/api/issues/{issue.id}/move/", data, format="json"
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        return response
+
+    def test_new_issues_are_last(self):
+        self.assertEqual(self.get_order(), [issue.id for issue in self.issues])
+
+    def test_move(self):
+        first, second, third, fourth = self.issues
+
+        self.move(fourth, position="first")
+        self.assertEqual(self.get_order(), [fourth.id, first.id, second.id, third.id])
+        self.move(first, after=third.id)
+        self.assertEqual(self.get_order(), [fourth.id, second.id, third.id, first.id])
+        self.move(third, before=second.id)
+        self.assertEqual(self.get_order(), [fourth.id, third.id, second.id, first.id])
+        self.move(fourth, position="last")
+        self.assertEqual(self.get_order(), [third.id, second.id, first.id, fourth.id])
+
+    def test_invalid_moves(self):
+        other = create_issue(create_project(self.user, name="Other"), self.user)
+        url = f"/api/issues/{self.issues[0].id}/move/"
+
+        for data in (
+            {"before": other.id},
+            {"after": self.issues[0].id},
+            {"position": "middle"},
+        ):
+            with self.subTest(data=data):
+                response = self.client.post(url, data, format="json")
+                self.assertEqual(response.status_code, 400)
+
+    def test_rebalance_keeps_order(self):
+        Issue.objects.filter(id=self.issues[2].id).update(rank="")
+        Issue.objects.filter(id=self.issues[3].id).update(rank="a0000000000001")
+        order = list(Issue.objects.order_by("rank", "id").values_list("id", flat=True))
+        since = ChangeEvent.objects.latest("id").id
+
+        self.assertEqual(ranking.rebalance("default", self.project.id), 4)
+
+        ranks = dict(Issue.objects.values_list("id", "rank"))
+        self.assertEqual(sorted(ranks, key=ranks.get), order)
+        self.assertEqual(len(set(ranks.values())), 4)
+        self.assertTrue(all(rank for rank in ranks.values()))
+        # The new ranks are in the change log, for the clients syncing the backlog
+        versions = dict(Issue.objects.values_list("id", "version"))
+        self.assertEqual(
+            {
+                (
+                    event.action,
+                    event.object_id,
+                    event.data["rank"],
+                    event.data["version"],
+                )
+                for event in ChangeEvent.objects.filter(id__gt=since, model="issue")
+            },
+            {("update", id, rank, versions[id]) for id, rank in ranks.items()},
+        )
+
+    def test_move_between_equal_ranks_rebalances(self):
+        first, second, third, fourth = self.issues
+        Issue.objects.filter(project=self.project).update(rank="")
+
+        self.move(fourth, after=first.id)
+
+        self.assertEqual(self.get_order(), [first.id, fourth.id, second.id, third.id])
+
+    def test_ordering_by_rank_needs_a_project(self):
+        response = self.client.get("/api/issues/", {"ordering": "rank"})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class WorkloadTests(APITestCase):
+    url = "/api/workload/"
+
+    def setUp(self):
+        super().setUp()
+        self.contributor = create_user("contributor")
+        self.project = create_project(self.user, self.contributor)
+        self.issues = [
+            create_issue(self.project, self.user, name=f"Issue {i}", priority=priority)
+            for i, priority in enumerate(["high", "low", "low"])
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            for issue in self.issues:
+                issue.assignees.add(self.contributor)
+
+    def get_entries(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return {entry["username"]: entry for entry in response.data}
+
+    def test_empty(self):
+        client = self.client_for(create_user("other"))
+        self.assertEqual(client.get(self.url).data, [])
+
+        create_project(self.user, name="Empty")
+        entries = self.get_entries()
+        self.assertEqual(
+            entries["author"]["open_issues"],
+            {"low": 0, "medium": 0, "high": 0, "total": 0},
+        )
+        self.assertIsNone(entries["author"]["oldest_open_issue"])
+
+    def test_workload(self):
+        entry = self.get_entries()["contributor"]
+
+        self.assertEqual(
+            entry["open_issues"], {"low": 2, "medium": 0, "high": 1, "total": 3}
+        )
+        self.assertEqual(entry["oldest_open_issue"]["id"], self.issues[0].id)
+
+    def test_refresh(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/api/issues/{self.issues[0].id}/",
+                {"status": "finished"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        entry = self.get_entries()["contributor"]
+        self.assertEqual(
+            entry["open_issues"], {"low": 2, "medium": 0, "high": 0, "total": 2}
+        )
+        self.assertEqual(entry["oldest_open_issue"]["id"], self.issues[1].id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.issues[1].assignees.remove(self.contributor)
+            self.issues[2].delete()
+        entry = self.get_entries()["contributor"]
+        self.assertEqual(entry["open_issues"]["total"], 0)
+        self.assertIsNone(entry["oldest_open_issue"])
+        self.assertFalse(self.contributor.workloads.exists())
+
+    def test_project(self):
+        other = create_project(self.contributor, name="Other")
+        with self.captureOnCommitCallbacks(execute=True):
+            create_issue(other, self.contributor).assignees.add(self.contributor)
+
+        # Not a contributor of the other project
+        self.assertEqual(self.get_entries(project=other.id), {})
+        entries = self.client_for(self.contributor).get(self.url).data
+        self.assertEqual([entry["open_issues"]["total"] for entry in entries], [0, 4])
+        entries = self.get_entries(project=self.project.id)
+        self.assertEqual(entries["contributor"]["open_issues"]["total"], 3)
+        response = self.client.get(self.url, {"project": "invalid"})
+        self.assertEqual(response.status_code, 400)
+
+
+class InboxTests(APITestCase):
+    url = "/api/inbox/"
+
+    def setUp(self):
+        super().setUp()
+        self.assignee = create_user("assignee")
+        self.project = create_project(self.user, self.assignee)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.issues = [
+                create_issue(self.project, self.user, name=name, priority=priority)
+                for name, priority in [
+                    ("Low", "low"),
+                    ("High", "high"),
+                    ("Medium", "medium"),
+                    ("Other high", "high"),
+                ]
+            ]
+            self.issues[0].assignees.add(self.assignee)
+            self.issues[1].assignees.add(self.assignee)
+
+    def get_names(self, client=None):
+        response = (client or self.client).get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return [entry["name"] for entry in response.data["results"]]
+
+    def test_order(self):
+        # By priority, then oldest first
+        self.assertEqual(self.get_names(), ["High", "Other high", "Medium", "Low"])
+        self.assertEqual(
+            self.get_names(self.client_for(self.assignee)), ["High", "Low"]
+        )
+
+    def test_refresh(self):
+        client = self.client_for(self.assignee)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/api/issues/{self.issues[1].id}/",
+                {"status": "finished"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_names(client), ["Low"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.issues[0].name = "Renamed"
+            self.issues[0].priority = "high"
+            self.issues[0].save()
+            self.issues[3].assignees.add(self.assignee)
+        self.assertEqual(self.get_names(client), ["Renamed", "Other high"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.issues[0].assignees.remove(self.assignee)
+            self.issues[3].delete()
+        self.assertEqual(self.get_names(client), [])
+        self.assertEqual(self.get_names(), ["Renamed", "Medium"])
+
+    def test_pagination(self):
+        names = []
+        cursor = None
+        while True:
+            params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            names.append([entry["name"] for entry in response.data["results"]])
+            cursor = response.data["cursor"]
+            if not response.data["has_more"]:
+                break
+
+        self.assertEqual(names, [["High", "Other high", "Medium"], ["Low"]])
+        # The last cursor is returned again once the inbox is read
+        response = self.client.get(self.url, {"cursor": cursor})
+        self.assertEqual(response.data["results"], [])
+        self.assertEqual(response.data["cursor"], cursor)
+
+    def test_invalid_parameters(self):
+        for params in ({"cursor": "invalid"}, {"limit": "invalid"}):
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 400)
+
+
+class CloneTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.assignee = create_user("assignee")
+        self.inactive = create_user("inactive")
+        self.cloner = create_user("cloner")
+        self.source = create_project(
+            self.user, self.assignee, self.inactive, self.cloner
+        )
+        self.issues = [
+            create_issue(self.source, self.user, name=name) for name in ("A", "B")
+        ]
+        self.issues[0].assignees.add(self.assignee, self.inactive)
+        self.issues[1].assignees.add(self.user)
+        self.inactive.is_active = False
+        self.inactive.save()
+
+    def clone(self, **options):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(self.cloner).post(
+                f"/api/projects/{self.source.id}/clone/",
+                {"name": "Clone", **options},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 201)
+        return Project.objects.get(id=response.data["id"]), response.data
+
+    def test_clone(self):
+        project, data = self.clone(assignees=True)
+
+        self.assertEqual(data["issues_copied"], 2)
+        self.assertEqual(project.author, self.cloner)
+        self.assertEqual(
+            set(project.contributors.values_list("username", flat=True)),
+            {"cloner", "author", "assignee"},
+        )
+        issues = project.issues.order_by("rank")
+        self.assertEqual(
+            [(issue.name, issue.author_id) for issue in issues],
+            [("A", self.cloner.id), ("B", self.cloner.id)],
+        )
+        self.assertEqual(
+            [
+                list(issue.assignees.values_list("username", flat=True))
+                for issue in issues
+            ],
+            [["assignee"], ["author"]],
+        )
+        # The source is unchanged
+        self.assertEqual(self.issues[0].assignees.count(), 2)
+
+    def test_counters_and_changes(self):
+        project, data = self.clone(assignees=True)
+
+        self.assertEqual((data["issues_count"], data["contributors_count"]), (2, 3))
+        self.assertEqual(counters.reconcile(), (0, 0))
+        self.assertEqual(
+            sorted(
+                ChangeEvent.objects.filter(project_id=project.id).values_list(
+                    "model", "action"
+                )
+            ),
+            [("contributor", "create")] * 3
+            + [("issue", "create")] * 2
+            + [("project", "create")],
+        )
+        self.assertEqual(
+            {
+                workload.user.username: workload.open_low
+                for workload in project.workloads.select_related("user")
+            },
+            {"assignee": 1, "author": 1},
+        )
+        self.assertEqual(
+            InboxEntry.objects.filter(project=project, user=self.cloner).count(), 2
+        )
+
+    def test_options(self):
+        project, data = self.clone()
+        self.assertFalse(Issue.assignees.through.objects.filter(issue__project=project))
+
+        project, data = self.clone(name="Empty", contributors=False, issues=False)
+        self.assertEqual(data["issues_copied"], 0)
+        self.assertEqual(
+            list(project.contributors.values_list("username", flat=True)), ["cloner"]
+        )
+        self.assertEqual(counters.reconcile(), (0, 0))
@@ -2,14 +2,26 @@
 from django.urls import path, include
 from rest_framework import routers
 
-from projects_manager.views import ProjectViewSet, IssueViewSet, CommentViewSet
+from projects_manager.views import (
+    ProjectViewSet,
+    IssueViewSet,
+    CommentViewSet,
+    ChangeViewSet,
+    WorkloadViewSet,
+    InboxViewSet,
+    project_events,
+)
 
 router = routers.SimpleRouter()
 router.register("projects", ProjectViewSet, basename="projects")
 router.register("issues", IssueViewSet, basename="issues")
 router.register("comments", CommentViewSet, basename="comments")
+router.register("changes", ChangeViewSet, basename="changes")
+router.register("workload", WorkloadViewSet, basename="workload")
+router.register("inbox", InboxViewSet, basename="inbox")
 
 
 urlpatterns = [
+    path("api/projects/<int:pk>/events/", project_events, name="project-events"),
     path("api/", include(router.urls)),
 ]
@@ -1,16 +1,56 @@
-from django.db.models import Q
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import BooleanField, Exists, ExpressionWrapper, F, OuterRef, Q
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.urls import resolve
-from rest_framework.exceptions import PermissionDenied, ValidationError
-from rest_framework.viewsets import ModelViewSet
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import (
+    AuthenticationFailed,
+    PermissionDenied,
+    ValidationError,
+)
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import set_rollback
+from rest_framework.viewsets import ModelViewSet, GenericViewSet
+from rest_framework_simplejwt.authentication import JWTAuthentication
 
-from projects_manager.models import Project, Issue, Comment
+from projects_manager import (
+    changes,
+    cloning,
+    events,
+    inbox,
+    notifications,
+    ranking,
+    sharding,
+    workload,
+)
+from projects_manager.idempotency import idempotent
+from projects_manager.loaders import get_loader
+from projects_manager.models import (
+    Project,
+    Contributor,
+    Issue,
+    Comment,
+    VersionConflict,
+)
 from projects_manager.permissions import AuthorOrReadOnly, AuthorOrAssignee
 from projects_manager.serializers import (
     ProjectSerializer,
     IssueSerializer,
     CommentSerializer,
     ProjectListSerializer,
+    ProjectCloneSerializer,
     IssueListSerializer,
+    IssueMoveSerializer,
+    ChangeEventSerializer,
+    InboxEntrySerializer,
+    IssueStatusTransitionSerializer,
 )
 
 
@@ -27,30 +67,281 @@ class MultipleSerializerMixin:
         return super().get_serializer_class()
 
 
-class ProjectViewSet(MultipleSerializerMixin, ModelViewSet):
+class LoaderMixin:
+    """Add the object of detail actions to the request loader."""
+
+    def get_object(self):
+        """Return the object and make it available to serializers and permissions."""
+        obj = super().get_object()
+        get_loader(self.request).prime(obj)
+        return obj
+
+
+class ShardMixin:
+    """
+    Run the queries of the request on the shard of the project it concerns, found
+    from the id in the URL or from the request data on creations (see get_shard).
+    Lists are fetched on every shard and merged by id.
+    """
+
+    def get_shard(self):
+        """Return the shard of the request, None if it concerns every shard."""
+        lookup = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        if lookup is not None:
+            return sharding.shard_for_id(lookup)
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        """The current shard is set for this request only."""
+        with sharding.use_shard(None):
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        """Set the current shard before permissions are checked."""
+        sharding.current_shard.set(self.get_shard())
+        super().initial(request, *args, **kwargs)
+
+    def paginate_queryset(self, queryset):
+        """Paginate the rows of every shard, unless the request concerns one shard."""
+        if sharding.is_enabled() and self.get_shard() is None:
+            queryset = sharding.ShardedList(queryset)
+        return super().paginate_queryset(queryset)
+
+
+class VersionedWriteMixin:
+    """
+    Optimistic concurrency control on updates and deletions (see VersionMixin). The
+    version of the object is sent in the ETag header: when the client sends it back
+    in the If-Match header, the write fails with 412 if the object was changed in
+    the meantime. Concurrent writes without If-Match fail with 409 instead of
+    silently overwriting each other.
+    """
+
+    def get_expected_version(self):
+        """Return the version of the If-Match header, None if there is no condition."""
+        header = self.request.headers.get("If-Match", "").strip()
+        if not header or header == "*":
+            return None
+        # The compression middleware makes ETags weak, accept both forms
+        tag = header.removeprefix("W/").strip('"')
+        # Versions start at 1, an invalid tag never matches
+        return int(tag) if tag.isdigit() else 0
+
+    def get_object(self):
+        """Check the If-Match header before writing the object."""
+        obj = super().get_object()
+        expected = self.get_expected_version()
+        if self.request.method in ("PUT", "PATCH", "DELETE") and expected is not None:
+            if obj.version != expected:
+                raise VersionConflict(f"Expected version {expected}")
+        return obj
+
+    def get_write_queryset(self, fields=None):
+        """Conditional writes only match the expected version."""
+        queryset = super().get_write_queryset(fields)
+        expected = self.get_expected_version()
+        if expected is not None:
+            queryset = queryset.filter(version=expected)
+        return queryset
+
+    def get_conditional_update_values(self, data):
+        """Conditional updates increment the version."""
+        values = super().get_conditional_update_values(data)
+        if values is not None:
+            values["version"] = F("version") + 1
+        return values
+
+    def handle_exception(self, exc):
+        """Return 412 (with If-Match) or 409 when the object was changed meanwhile."""
+        if not isinstance(exc, VersionConflict):
+            return super().handle_exception(exc)
+        set_rollback()
+        if self.get_expected_version() is not None:
+            return Response(
+                {"detail": "The object was modified, get it again and retry."},
+                status=status.HTTP_412_PRECONDITION_FAILED,
+            )
+        return Response(
+            {"detail": "The object was modified by another request, retry."},
+            status=status.HTTP_409_CONFLICT,
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Send the version of the object in the ETag header."""
+        response = super().finalize_response(request, response, *args, **kwargs)
+        data = getattr(response, "data", None)
+        if (
+            (self.detail or self.action == "create")
+            and status.is_success(response.status_code)
+            and isinstance(data, dict)
+            and "version" in data
+        ):
+            response["ETag"] = f'"{data["version"]}"'
+        return response
+
+
+class ConditionalWriteMixin:
+    """
+    DELETE and PATCH of simple fields without loading the object first: the write
+    permission (author, or superusers and staff members) is compiled in the WHERE
+    clause of a single conditional DELETE or UPDATE. If no row matched, the regular
+    flow is run to return the right error (404, 403 or a detailed message).
+    Deletions still go through Django's collector for cascades and signals.
+    """
+
+    # Fields a PATCH can update without the serializer (no database validation)
+    conditional_update_fields = []
+
+    def get_write_filter(self, fields=None):
+        """Return a Q object matching the objects the user can write."""
+        user = self.request.user
+        if user.is_superuser or user.is_staff:
+            return Q()
+        return Q(author=user)
+
+    def get_lookup_pk(self):
+        """Return the pk in the URL, 404 if it's not valid (like get_object())."""
+        model = self.get_serializer_class().Meta.model
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            return model._meta.pk.to_python(lookup)
+        except (DjangoValidationError, ValueError, TypeError):
+            raise Http404
+
+    def get_write_queryset(self, fields=None):
+        """The object of the request, if the user can write it."""
+        model = self.get_serializer_class().Meta.model
+        return model.objects.filter(pk=self.get_lookup_pk()).filter(
+            self.get_write_filter(fields)
+        )
+
+    def get_conditional_update_values(self, data):
+        """
+        Return the validated values to update if the request only contains simple
+        fields, else None.
+        """
+        if not data or not set(data) <= set(self.conditional_update_fields):
+            return None
+        serializer = self.get_serializer()
+        values, errors = {}, {}
+        for name, value in data.items():
+            try:
+                value = serializer.fields[name].run_validation(value)
+                validate_method = getattr(serializer, f"validate_{name}", None)
+                if validate_method is not None:
+                    value = validate_method(value)
+            except ValidationError as error:
+                errors[name] = error.detail
+            else:
+                values[name] = value
+        if errors:
+            raise ValidationError(errors)
+        return values
+
+    def destroy(self, request, *args, **kwargs):
+        """Delete the object only if the user can write it."""
+        deleted, _ = self.get_write_queryset().delete()
+        if not deleted:
+            return super().destroy(request, *args, **kwargs)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def partial_update(self, request, *args, **kwargs):
+        """Update simple fields with a single conditional UPDATE if possible."""
+        values = self.get_conditional_update_values(request.data)
+        if values is not None:
+            queryset = self.get_write_queryset(request.data.keys())
+            if queryset.update(**values):
+                # The write filter can join several assignees, get the row by pk
+                instance = queryset.model.objects.get(pk=self.get_lookup_pk())
+                self.perform_conditional_update(instance)
+                return Response(self.get_serializer(instance).data)
+        return self.regular_partial_update(request, *args, **kwargs)
+
+    def perform_conditional_update(self, instance):
+        """No post_save signal is sent by update(), the change is recorded here."""
+        changes.record(instance, "update")
+
+    def regular_partial_update(self, request, *args, **kwargs):
+        """Partial update through get_object(), permissions and the serializer."""
+        return super().partial_update(request, *args, **kwargs)
+
+
+class ProjectViewSet(
+    ShardMixin,
+    VersionedWriteMixin,
+    ConditionalWriteMixin,
+    LoaderMixin,
+    MultipleSerializerMixin,
+    ModelViewSet,
+):
     serializer_class = ProjectSerializer
     list_serializer_class = ProjectListSerializer
     permission_classes = [AuthorOrReadOnly]
+    conditional_update_fields = ["description", "type", "is_template"]
+
+    def get_permissions(self):
+        """Every project the user can see can be cloned, not only his own."""
+        if self.action == "clone":
+            self.permission_classes = [IsAuthenticated]
+        return super().get_permissions()
 
     def get_queryset(self):
         """
         Restricted to authors and contributors. Superusers and staff members can see all
-        projects.
+        projects. Templates can also be cloned (and listed) by every user.
         """
         user = self.request.user
         if user.is_superuser or user.is_staff:
             return Project.objects.all()
-        else:
-            return (
-                Project.objects.filter(Q(author=user) | Q(contributors=user))
-                .distinct()
-                .order_by("id")
-            )
+        visible = Q(author=user) | Q(contributors=user)
+        if self.action in ("clone", "templates"):
+            visible |= Q(is_template=True)
+        return Project.objects.filter(visible).distinct().order_by("id")
+
+    def get_shard(self):
+        """New projects are spread over the shards."""
+        if self.action == "create":
+            return sharding.pick_shard()
+        return super().get_shard()
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        """Handle POST request, replayed if the Idempotency-Key was already used."""
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         """The user who made the request is set as the author of the project."""
         serializer.save(author=self.request.user)
 
+    @action(detail=True, methods=["post"])
+    @idempotent
+    def clone(self, request, *args, **kwargs):
+        """
+        Create a copy of the project (e.g. a template) named after the `name` of the
+        body, on the server: its contributors, its issues (authored by the user) and
+        optionally their assignees are copied with a few statements. Options:
+        `contributors` and `issues` (true by default), `assignees` (false by default),
+        `is_template`, and `description` and `type` (those of the source by default).
+        """
+        source = self.get_object()
+        serializer = ProjectCloneSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        project, issues_copied = cloning.clone_project(
+            source, request.user, **serializer.validated_data
+        )
+        data = ProjectSerializer(project, context=self.get_serializer_context()).data
+        return Response(
+            {**data, "issues_copied": issues_copied}, status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=False)
+    def templates(self, request, *args, **kwargs):
+        """List the project templates (of every user), to clone them."""
+        queryset = self.get_queryset().filter(is_template=True)
+        page = self.paginate_queryset(queryset)
+        serializer = ProjectListSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     # update() method removed as it was only calling the super().update method
 
     def partial_update(self, request, *args, **kwargs):
@@ -58,13 +349,21 @@ class ProjectViewSet(MultipleSerializerMixin, ModelViewSet):
         return super().partial_update(request, *args, **kwargs)
 
 
-class IssueViewSet(MultipleSerializerMixin, ModelViewSet):
+class IssueViewSet(
+    ShardMixin,
+    VersionedWriteMixin,
+    ConditionalWriteMixin,
+    LoaderMixin,
+    MultipleSerializerMixin,
+    ModelViewSet,
+):
     serializer_class = IssueSerializer
     list_serializer_class = IssueListSerializer
+    conditional_update_fields = ["description", "type", "priority", "status"]
 
     def get_permissions(self):
-        """Return a different permission for partial_update action."""
-        if self.action == "partial_update":
+        """Return a different permission for partial_update and move actions."""
+        if self.action in ("partial_update", "move"):
             self.permission_classes = [AuthorOrAssignee]
         else:
             self.permission_classes = [AuthorOrReadOnly]
@@ -73,53 +372,240 @@ class IssueViewSet(MultipleSerializerMixin, ModelViewSet):
     def get_queryset(self):
         """
         Restricted to authors and contributors. Superusers and staff members can see all
-        issues.
+        issues. Lists can be filtered on a `project` and, for a project, ordered by
+        `rank` (the order of its backlog, see the move action) with `ordering=rank`.
         """
         user = self.request.user
         if user.is_superuser or user.is_staff:
-            return Issue.objects.all()
+            queryset = Issue.objects.all()
         else:
-            return (
+            queryset = (
                 Issue.objects.filter(Q(author=user) | Q(project__contributors=user))
                 .distinct()
                 .order_by("id")
             )
+        if self.action == "list":
+            project_id = self.get_project_filter()
+            if project_id is not None:
+                queryset = queryset.filter(project_id=project_id)
+            if self.request.query_params.get("ordering") == "rank":
+                if project_id is None:
+                    raise ValidationError("Ordering by rank needs a project.")
+                queryset = queryset.order_by("rank", "id")
+        return queryset
 
+    def get_project_filter(self):
+        """Return the id of the `project` query parameter, None if there is none."""
+        project_id = self.request.query_params.get("project")
+        if project_id is None:
+            return None
+        if not project_id.isdigit():
+            raise ValidationError("project must be a project id.")
+        return int(project_id)
+
+    def get_shard(self):
+        """
+        New issues are created on the shard of their project, and lists of the issues
+        of a project are read from its shard.
+        """
+        if self.action == "create":
+            return sharding.shard_for_id(self.request.data.get("project"))
+        if self.action == "list" and self.get_project_filter() is not None:
+            return sharding.shard_for_id(self.get_project_filter())
+        return super().get_shard()
+
+    def get_write_filter(self, fields=None):
+        """Like AuthorOrAssignee, assignees can also change the status."""
+        write_filter = super().get_write_filter(fields)
+        if fields is not None and set(fields) == {"status"} and write_filter:
+            return write_filter | Q(assignees=self.request.user)
+        return write_filter
+
+    def get_conditional_update_values(self, data):
+        """Keep track of the last activity, like Issue.save() does."""
+        values = super().get_conditional_update_values(data)
+        if values is not None:
+            values["last_activity_time"] = timezone.now()
+        return values
+
+    def perform_conditional_update(self, instance):
+        """Status and priority changes also change the workload and inbox of users."""
+        super().perform_conditional_update(instance)
+        workload.schedule_issues(instance._state.db, [instance.id])
+        inbox.schedule_issues(instance._state.db, [instance.id])
+
+    @idempotent
     def create(self, request, *args, **kwargs):
         """Override create() method to only allow contributors to create issues."""
         # Check if the project exists and return an error if not
+        loader = get_loader(request)
         try:
             project_id = request.data["project"]
-            project = Project.objects.get(id=project_id)
+            project = loader.get(Project, project_id)
         except Project.DoesNotExist:
             raise ValidationError(f"Project {project_id} not found")
-        if request.user not in project.contributors.all():
+        if request.user.id not in loader.contributor_ids(project.id):
             raise PermissionDenied(
                 "Only contributors of this project can create issues"
             )
         return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        """The user who made the request is set as the author of the issue."""
-        serializer.save(author=self.request.user)
+        """
+        The user who made the request is set as the author of the issue. Assignees are
+        notified in the background.
+        """
+        issue = serializer.save(author=self.request.user)
+        assignees = serializer.validated_data.get("assignees", [])
+        notifications.notify_assigned(
+            issue, [user.id for user in assignees], self.request.user
+        )
 
-    def partial_update(self, request, *args, **kwargs):
+    def perform_update(self, serializer):
+        """Notify the users newly assigned to the issue in the background."""
+        previous = set(serializer.instance.assignees.values_list("id", flat=True))
+        issue = serializer.save()
+        if "assignees" in serializer.validated_data:
+            new = {user.id for user in serializer.validated_data["assignees"]}
+            notifications.notify_assigned(issue, new - previous, self.request.user)
+
+    def regular_partial_update(self, request, *args, **kwargs):
         """If the user is an assignee, he can only change the status of the issue."""
         user = self.request.user
         issue = self.get_object()
         # Check if the user is an assignee of the issue and not the author and restrict
         # the fields he can update to only status if it's the case
-        if user in issue.assignees.all() and user != issue.author:
+        assignees = get_loader(request).assignee_ids(issue.id)
+        if user.id in assignees and user.id != issue.author_id:
             if len(request.data) > 1 or "status" not in request.data:
                 raise PermissionDenied(
                     "As a simple assignee, you can only change the status of this issue"
                 )
-        return super().partial_update(request, *args, **kwargs)
+        return super().regular_partial_update(request, *args, **kwargs)
+
+    @action(detail=False, methods=["post"], url_path="bulk-status")
+    def bulk_status(self, request):
+        """
+        Change the status of several issues at once (e.g. moving cards on a board).
+        The body is a list of {"id": issue_id, "status": new_status}. Rights are
+        checked for all issues with one query (per shard) and issues are updated with
+        one UPDATE per target status. The result of each transition is returned:
+        updated, unchanged, forbidden (not author or assignee) or not_found.
+        """
+        serializer = IssueStatusTransitionSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        # If an issue is provided several times, the last status wins
+        targets = {item["id"]: item["status"] for item in serializer.validated_data}
+
+        rights = self.get_transition_rights(targets.keys()).values(
+            "id", "status", "visible", "allowed"
+        )
+        issues = {
+            issue["id"]: issue
+            for queryset in sharding.fan_out(rights)
+            for issue in queryset
+        }
+        results = {}
+        to_update = {}
+        for issue_id, status in targets.items():
+            issue = issues.get(issue_id)
+            if issue is None or not issue["visible"]:
+                results[issue_id] = "not_found"
+            elif not issue["allowed"]:
+                results[issue_id] = "forbidden"
+            elif issue["status"] == status:
+                results[issue_id] = "unchanged"
+            else:
+                results[issue_id] = "updated"
+                to_update.setdefault(status, []).append(issue_id)
+
+        now = timezone.now()
+        updated_ids = [id for ids in to_update.values() for id in ids]
+        for shard, shard_ids in sharding.group_by_shard(Issue, updated_ids).items():
+            shard_issues = Issue.objects.using(shard)
+            with transaction.atomic(using=shard), transaction.atomic():
+                for status, ids in to_update.items():
+                    ids = set(ids) & set(shard_ids)
+                    if ids:
+                        shard_issues.filter(id__in=ids).update(
+                            status=status,
+                            last_activity_time=now,
+                            version=F("version") + 1,
+                        )
+                changes.record_many(shard_issues.filter(id__in=shard_ids), "update")
+                workload.schedule_issues(shard, shard_ids)
+                inbox.schedule_issues(shard, shard_ids)
 
+        return Response(
+            [{"id": issue_id, "result": result} for issue_id, result in results.items()]
+        )
 
-class CommentViewSet(ModelViewSet):
+    @action(detail=True, methods=["post"])
+    def move(self, request, *args, **kwargs):
+        """
+        Move the issue in the backlog of its project, `before` or `after` another
+        issue (id) of the project, or to the `first` or `last` position. Only the rank
+        of the issue is updated.
+        """
+        issue = self.get_object()
+        serializer = IssueMoveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        targets = {}
+        for name in ("before", "after"):
+            target_id = serializer.validated_data.get(name)
+            if target_id is None:
+                continue
+            try:
+                targets[name] = Issue.objects.using(issue._state.db).get(
+                    id=target_id, project_id=issue.project_id
+                )
+            except Issue.DoesNotExist:
+                raise ValidationError(
+                    {name: f"Issue {target_id} not found in this project."}
+                )
+            if targets[name].id == issue.id:
+                raise ValidationError({name: "An issue can't be moved next to itself."})
+        ranking.move(
+            issue, position=serializer.validated_data.get("position"), **targets
+        )
+        return Response(
+            IssueSerializer(issue, context=self.get_serializer_context()).data
+        )
+
+    def get_transition_rights(self, ids):
+        """
+        Issues with the given ids, annotated with `visible` (same rule as
+        get_queryset) and `allowed` (author or assignee, like AuthorOrAssignee).
+        """
+        user = self.request.user
+        issues = Issue.objects.filter(id__in=ids)
+        if user.is_superuser or user.is_staff:
+            return issues.annotate(
+                visible=ExpressionWrapper(Q(pk__isnull=False), BooleanField()),
+                allowed=ExpressionWrapper(Q(pk__isnull=False), BooleanField()),
+            )
+        is_contributor = Exists(
+            Contributor.objects.filter(project=OuterRef("project"), user=user)
+        )
+        is_assignee = Exists(
+            Issue.assignees.through.objects.filter(issue=OuterRef("pk"), user=user)
+        )
+        return issues.annotate(
+            visible=ExpressionWrapper(
+                Q(author=user) | is_contributor, output_field=BooleanField()
+            ),
+            allowed=ExpressionWrapper(
+                Q(author=user) | is_assignee, output_field=BooleanField()
+            ),
+        )
+
+
+class CommentViewSet(
+    ShardMixin, VersionedWriteMixin, ConditionalWriteMixin, LoaderMixin, ModelViewSet
+):
     serializer_class = CommentSerializer
     permission_classes = [AuthorOrReadOnly]
+    conditional_update_fields = ["description"]
 
     def get_queryset(self):
         """
@@ -138,25 +624,186 @@ class CommentViewSet(ModelViewSet):
                 .order_by("id")
             )
 
+    def get_issue_id(self):
+        """Return the id of the issue of a new comment, from its URL."""
+        issue_full_url = self.request.data["issue"]
+
+        # resolve() expects an URL path, not a full URL
+        matched_view = resolve(issue_full_url.replace("http://localhost:8000", ""))
+        # issue_id = matched_view.kwargs.get("id")  # Doesn't work, why ?
+        return matched_view.kwargs.get("pk")
+
+    def get_shard(self):
+        """New comments are created on the shard of their issue."""
+        if self.action == "create":
+            try:
+                return sharding.shard_for_id(self.get_issue_id())
+            except (KeyError, AttributeError, Http404):
+                # create() returns the error
+                return None
+        return super().get_shard()
+
+    @idempotent
     def create(self, request, *args, **kwargs):
         """Override create() method to only allow contributors to comment."""
         # Check if the issue exists and return an error if not
+        loader = get_loader(request)
         try:
-            issue_full_url = request.data["issue"]
-
-            # resolve() expects an URL path, not a full URL
-            matched_view = resolve(issue_full_url.replace("http://localhost:8000", ""))
-            # issue_id = matched_view.kwargs.get("id")  # Doesn't work, why ?
-            issue_id = matched_view.kwargs.get("pk")
-            issue = Issue.objects.get(id=issue_id)
+            issue_id = self.get_issue_id()
+            issue = loader.get(Issue, issue_id)
         except Issue.DoesNotExist:
             raise ValidationError(f"Issue {issue_id} not found")
-        if request.user not in issue.project.contributors.all():
+        if request.user.id not in loader.contributor_ids(issue.project_id):
             raise PermissionDenied(
                 "Only contributors of this project can comment its issues"
             )
         return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        """The user who made the request is set as the author of the comment."""
-        serializer.save(author=self.request.user)
+        """
+        The user who made the request is set as the author of the comment. The author
+        and assignees of the issue are notified in the background.
+        """
+        comment = serializer.save(author=self.request.user)
+        notifications.notify_commented(comment)
+
+
+class ChangeViewSet(GenericViewSet):
+    """
+    Change feed for clients to sync. Returns events after the `since` cursor (an
+    event id) in order. Clients keep the returned cursor for their next call.
+    """
+
+    serializer_class = ChangeEventSerializer
+    default_limit = 100
+    max_limit = 500
+
+    def get_queryset(self):
+        """Restricted to the events the user can see."""
+        return changes.visible_events(self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        """Handle GET request with `since` and `limit` query parameters."""
+        try:
+            since = int(request.query_params.get("since", 0))
+            limit = int(request.query_params.get("limit", self.default_limit))
+        except ValueError:
+            raise ValidationError("since and limit must be integers")
+        limit = max(1, min(limit, self.max_limit))
+
+        # Fetch one more event than asked to know if there are more to come
+        events = list(
+            self.get_queryset().filter(id__gt=since).order_by("id")[: limit + 1]
+        )
+        has_more = len(events) > limit
+        events = events[:limit]
+        return Response(
+            {
+                "cursor": events[-1].id if events else since,
+                "has_more": has_more,
+                "results": self.get_serializer(events, many=True).data,
+            }
+        )
+
+
+class WorkloadViewSet(GenericViewSet):
+    """
+    Workload of the contributors of the user's projects: open issues assigned to them
+    by priority and their oldest open issue. Read from rows maintained when issues
+    and assignments change, so the cost doesn't depend on the number of issues.
+    """
+
+    def list(self, request, *args, **kwargs):
+        """Handle GET request, with an optional `project` query parameter."""
+        project_id = request.query_params.get("project")
+        if project_id is not None:
+            try:
+                project_id = int(project_id)
+            except ValueError:
+                raise ValidationError("project must be an integer")
+        return Response(workload.summary(request.user, project_id))
+
+
+class InboxViewSet(GenericViewSet):
+    """
+    Open issues the user is assigned to or is the author of, in all projects, by
+    priority (highest first) then age (oldest first). Read from rows maintained when
+    issues and assignments change. Pages are fetched with the returned `cursor`.
+    """
+
+    serializer_class = InboxEntrySerializer
+    default_limit = 50
+    max_limit = 200
+
+    def list(self, request, *args, **kwargs):
+        """Handle GET request with `cursor` and `limit` query parameters."""
+        try:
+            limit = int(request.query_params.get("limit", self.default_limit))
+            cursor = request.query_params.get("cursor")
+            after = inbox.decode_cursor(cursor) if cursor else None
+        except ValueError:
+            raise ValidationError("limit must be an integer and cursor a valid cursor")
+        limit = max(1, min(limit, self.max_limit))
+
+        # One more entry than asked is returned to know if there are more to come
+        entries = inbox.get_page(request.user, after, limit)
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        return Response(
+            {
+                "cursor": inbox.encode_cursor(entries[-1]) if entries else cursor,
+                "has_more": has_more,
+                "results": self.get_serializer(entries, many=True).data,
+            }
+        )
+
+
+async def project_events(request, pk):
+    """
+    Stream the events on the issues and comments of a project (server-sent events),
+    so clients don't have to poll. Needs a JWT access token in the Authorization
+    header. Send the Last-Event-ID header to get the events missed since then.
+    The stream ends after a few minutes, or with an `overflow` event if the client
+    can't keep up: clients then reconnect.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {"detail": "Event streams are only served under ASGI."}, status=501
+        )
+    try:
+        authenticated = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed as error:
+        detail = error.detail
+        if not isinstance(detail, dict):
+            detail = {"detail": detail}
+        return JsonResponse(detail, status=401)
+    if authenticated is None:
+        return JsonResponse(
+            {"detail": "Authentication credentials were not provided."}, status=401
+        )
+    user = authenticated[0]
+
+    contributor = await sync_to_async(events.get_access)(user, pk)
+    if contributor is None:
+        return JsonResponse({"detail": "Not found."}, status=404)
+
+    # Subscribe before reading the missed events, so none is lost in between
+    subscription = events.broker.subscribe(pk, user, contributor)
+    replay, overflowed = [], False
+    last_event_id = request.headers.get("Last-Event-ID", "")
+    if last_event_id.isdigit():
+        replay, overflowed = await sync_to_async(events.get_replay)(
+            pk, int(last_event_id)
+        )
+    response = StreamingHttpResponse(
+        events.stream(subscription, replay, overflowed),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # no buffering by nginx
+    return response
+
+
+# Async views can't run in a transaction
+for alias in settings.DATABASES:
+    project_events = transaction.non_atomic_requests(using=alias)(project_events)
@@ -0,0 +1,121 @@
+"""
+Workload of users: open issues assigned to each user in each project, by priority,
+and the oldest of them. A Workload row is refreshed for each (user, project) pair
+affected by a change once the transaction is committed, so the workload endpoint
+reads one row per user and project whatever the number of issues.
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from projects_manager import sharding
+from projects_manager.models import Contributor, Issue, Workload
+
+Assignment = Issue.assignees.through
+
+PRIORITIES = [priority for priority, _ in Issue.PRIORITIES]
+
+
+def schedule(shard, keys):
+    """Refresh the workload of the (user_id, project_id) keys after commit."""
+    keys = set(keys)
+    if keys:
+        transaction.on_commit(partial(refresh, shard, keys), using=shard)
+
+
+def schedule_assignments(shard, **filters):
+    """Refresh the workload of the users and projects of assignments after commit."""
+    schedule(
+        shard,
+        Assignment.objects.using(shard)
+        .filter(**filters)
+        .values_list("user_id", "issue__project_id"),
+    )
+
+
+def schedule_issues(shard, issue_ids):
+    """Refresh the workload of the assignees of issues after commit."""
+    schedule_assignments(shard, issue_id__in=issue_ids)
+
+
+def refresh(shard, keys):
+    """Recompute the workload of the (user_id, project_id) keys."""
+    for user_id, project_id in keys:
+        issues = (
+            Issue.objects.using(shard)
+            .filter(project_id=project_id, assignees=user_id)
+            .exclude(status="finished")
+        )
+        oldest = issues.order_by("created_time", "id").first()
+        if oldest is None:
+            Workload.objects.using(shard).filter(
+                user_id=user_id, project_id=project_id
+            ).delete()
+            continue
+        counts = issues.aggregate(
+            **{
+                f"open_{priority}": Count("id", filter=Q(priority=priority))
+                for priority in PRIORITIES
+            }
+        )
+        Workload.objects.using(shard).update_or_create(
+            user_id=user_id,
+            project_id=project_id,
+            defaults={
+                **counts,
+                "oldest_open_issue": oldest,
+                "oldest_open_time": oldest.created_time,
+            },
+        )
+
+
+def summary(user, project_id=None):
+    """
+    Return the workload of each contributor of the user's projects (or of one of
+    them), ordered by username.
+    """
+    if project_id is not None:
+        shards = [sharding.shard_for_id(project_id)]
+    else:
+        shards = sharding.get_shards()
+    users = {}
+    for shard in shards:
+        projects = Contributor.objects.using(shard).filter(user=user)
+        if project_id is not None:
+            projects = projects.filter(project_id=project_id)
+        projects = projects.values("project")
+
+        contributors = Contributor.objects.using(shard).filter(project__in=projects)
+        for contributor in contributors.select_related("user"):
+            get_entry(users, contributor.user)
+
+        workloads = Workload.objects.using(shard).filter(project__in=projects)
+        for workload in workloads.select_related("user"):
+            entry = get_entry(users, workload.user)
+            for priority in PRIORITIES:
+                count = getattr(workload, f"open_{priority}")
+                entry["open_issues"][priority] += count
+                entry["open_issues"]["total"] += count
+            oldest = entry["oldest_open_issue"]
+            if workload.oldest_open_time is not None and (
+                oldest is None or workload.oldest_open_time < oldest["created_time"]
+            ):
+                entry["oldest_open_issue"] = {
+                    "id": workload.oldest_open_issue_id,
+                    "project": workload.project_id,
+                    "created_time": workload.oldest_open_time,
+                }
+    return sorted(users.values(), key=lambda entry: entry["username"])
+
+
+def get_entry(users, user):
+    """Return the workload entry of a user, created empty if missing."""
+    if user.id not in users:
+        users[user.id] = {
+            "id": user.id,
+            "username": user.username,
+            "open_issues": {**{priority: 0 for priority in PRIORITIES}, "total": 0},
+            "oldest_open_issue": None,
+        }
+    return users[user.id]
@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
+from softdeskapi.warmup import warm_up
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "softdeskapi.settings")
 
 application = get_asgi_application()
+
+if settings.WARMUP_ON_STARTUP:
+    # Database connections are per thread under ASGI, they can't be opened here
+    warm_up(database=False)
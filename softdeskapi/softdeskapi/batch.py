@@ -0,0 +1,223 @@
+"""
+Batch endpoint: several API requests sent in a single HTTP request, e.g. to load a
+project page. The batch is authenticated once, then each sub-request is resolved
+with the URL confs of the apps and dispatched to its view in-process, through the
+middlewares of BATCH["MIDDLEWARES"] only (metrics and load shedding: each
+sub-request is counted and takes a slot of its class). Sub-requests run in order,
+each in its own savepoint so that a failing one doesn't roll back the others. A
+batch of GET requests only can be dispatched in a thread pool.
+"""
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections, transaction
+from django.urls import Resolver404, resolve
+from django.utils.module_loading import import_string
+from rest_framework import serializers, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+DEFAULTS = {
+    "MAX_REQUESTS": 20,
+    "WORKERS": 4,  # threads dispatching GET requests, 1 to dispatch them in order
+    # Middlewares run for each sub-request, if they are in MIDDLEWARE
+    "MIDDLEWARES": [
+        "softdeskapi.metrics.MetricsMiddleware",
+        "softdeskapi.middleware.LoadSheddingMiddleware",
+    ],
+}
+
+# URL confs where sub-requests are resolved (no admin, token or batch endpoints)
+URLCONFS = ["users.urls", "projects_manager.urls"]
+
+# Headers of the batch request passed to sub-requests, besides their own headers
+FORWARDED_META = [
+    "SERVER_NAME",
+    "SERVER_PORT",
+    "REMOTE_ADDR",
+    "HTTP_HOST",
+    "HTTP_X_FORWARDED_PROTO",
+    "HTTP_ACCEPT_LANGUAGE",
+    "wsgi.url_scheme",
+]
+
+_executor = None
+_executor_lock = threading.Lock()
+_handler = None
+
+
+def get_setting(name):
+    """Return a BATCH setting."""
+    return getattr(settings, "BATCH", {}).get(name, DEFAULTS[name])
+
+
+def get_executor():
+    """Return the thread pool dispatching GET requests, created on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_setting("WORKERS"), thread_name_prefix="softdesk-batch"
+            )
+        return _executor
+
+
+def call_view(sub_request):
+    """Call the view of a resolved sub-request."""
+    match = sub_request.resolver_match
+    return match.func(sub_request, *match.args, **match.kwargs)
+
+
+def get_handler():
+    """Return the view of sub-requests wrapped in their middlewares, in order."""
+    global _handler
+    if _handler is None:
+        handler = call_view
+        names = [
+            name for name in settings.MIDDLEWARE if name in get_setting("MIDDLEWARES")
+        ]
+        for name in reversed(names):
+            handler = import_string(name)(handler)
+        _handler = handler
+    return _handler
+
+
+class SubRequestSerializer(serializers.Serializer):
+    """A request of a batch."""
+
+    method = serializers.ChoiceField(choices=["GET", "POST", "PUT", "PATCH", "DELETE"])
+    path = serializers.CharField()
+    body = serializers.JSONField(required=False, allow_null=True)
+    headers = serializers.DictField(
+        child=serializers.CharField(), required=False, default=dict
+    )
+
+    def validate_path(self, value):
+        """Only relative URLs of the API."""
+        if not value.startswith("/api/"):
+            raise serializers.ValidationError("The path must start with /api/.")
+        return value
+
+
+def build_request(request, item):
+    """Return the Django request of a sub-request, authenticated as the batch."""
+    url = urlsplit(item["path"])
+    body = b""
+    if item.get("body") is not None:
+        body = json.dumps(item["body"]).encode()
+    environ = {key: request.META[key] for key in FORWARDED_META if key in request.META}
+    environ.update(
+        {
+            f"HTTP_{name.upper().replace('-', '_')}": value
+            for name, value in item["headers"].items()
+        }
+    )
+    environ.update(
+        {
+            "REQUEST_METHOD": item["method"],
+            "PATH_INFO": url.path,
+            "QUERY_STRING": url.query,
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.input": BytesIO(body),
+        }
+    )
+    environ.setdefault("wsgi.url_scheme", request.scheme)
+    sub_request = WSGIRequest(environ)
+    # Used by DRF instead of the authentication classes (like the test client)
+    sub_request._force_auth_user = request.user
+    sub_request._force_auth_token = request.auth
+    return sub_request
+
+
+def resolve_view(path):
+    """Return the view and arguments of a path, None if it's not an API endpoint."""
+    for urlconf in URLCONFS:
+        try:
+            return resolve(path, urlconf=urlconf)
+        except Resolver404:
+            continue
+    return None
+
+
+def error(status_code, detail):
+    """Return the result of a sub-request that can't be dispatched."""
+    return {"status": status_code, "headers": {}, "body": {"detail": detail}}
+
+
+def dispatch(request, item):
+    """Run a sub-request and return its status, headers and body."""
+    sub_request = build_request(request, item)
+    match = resolve_view(sub_request.path_info)
+    if match is None:
+        return error(status.HTTP_404_NOT_FOUND, "Not found.")
+    if asyncio.iscoroutinefunction(match.func):
+        return error(status.HTTP_400_BAD_REQUEST, "Streams can't be batched.")
+    sub_request.resolver_match = match
+    response = get_handler()(sub_request)
+    if response.streaming:
+        return error(status.HTTP_400_BAD_REQUEST, "Downloads can't be batched.")
+    headers = {
+        name: value
+        for name, value in response.items()
+        if name not in ("Content-Type", "Content-Length", "Vary", "Allow")
+    }
+    if hasattr(response, "data"):  # DRF response, rendered with the batch
+        body = response.data
+    elif response.get("Content-Type", "").startswith("application/json"):
+        body = json.loads(response.content or b"null")
+    else:
+        body = response.content.decode()
+    return {"status": response.status_code, "headers": headers, "body": body}
+
+
+def dispatch_in_savepoint(request, item):
+    """Run a sub-request in a savepoint of each database, rolled back on errors."""
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(transaction.atomic(using=alias))
+        return dispatch(request, item)
+
+
+def dispatch_in_thread(request, item):
+    """Run a GET sub-request in a thread and release its database connections."""
+    try:
+        return dispatch(request, item)
+    finally:
+        connections.close_all()
+
+
+class BatchView(APIView):
+    """
+    Run a list of requests ({"method", "path", "body", "headers"}) and return the list
+    of their responses ({"status", "headers", "body"}), in the same order.
+    """
+
+    def post(self, request):
+        serializer = SubRequestSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data
+        if len(items) > get_setting("MAX_REQUESTS"):
+            return Response(
+                {"detail": f"At most {get_setting('MAX_REQUESTS')} requests by batch."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        # Independent reads can run at the same time, writes run in order
+        if (
+            len(items) > 1
+            and get_setting("WORKERS") > 1
+            and all(item["method"] == "GET" for item in items)
+        ):
+            results = list(
+                get_executor().map(dispatch_in_thread, [request] * len(items), items)
+            )
+        else:
+            results = [dispatch_in_savepoint(request, item) for item in items]
+        return Response(results)
@@ -0,0 +1,400 @@
+"""
+Metrics of the API, in the Prometheus text format at /metrics: the number of
+requests, their duration, number of queries and response size by view (and action
+of viewsets), and the stats of the compression and load shedding middlewares.
+
+Each thread aggregates the requests it serves in its own store, so recording a
+request takes no lock: stores are only merged when the metrics are read. With
+several worker processes, set METRICS["MULTIPROCESS_DIRECTORY"]: each process then
+writes its metrics in a file of the directory (at most every FLUSH_INTERVAL
+seconds), and /metrics merges the files of all the processes. Empty the directory
+when the application is restarted.
+
+/metrics is not public by default: it is only served to the IP addresses of
+ALLOWED_IPS (localhost) and to clients sending the AUTH_TOKEN, unless PUBLIC is set.
+"""
+import atexit
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+from softdeskapi.middleware import compression_stats, load_shedding_stats
+from softdeskapi.profiling import QueryTimer
+from softdeskapi.slow_queries import get_view_name
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "MULTIPROCESS_DIRECTORY": None,
+    "FLUSH_INTERVAL": 1.0,  # seconds
+    "AUTH_TOKEN": None,  # if set, "Authorization: Bearer <token>" gives access
+    "ALLOWED_IPS": ["127.0.0.1", "::1"],
+    "PUBLIC": False,  # serve /metrics to everyone
+}
+
+# name: (type, help, buckets of histograms)
+METRICS = {
+    "softdesk_http_requests_total": (
+        "counter",
+        "Requests served, by view, method and status.",
+        None,
+    ),
+    "softdesk_http_request_duration_seconds": (
+        "histogram",
+        "Duration of the requests, by view and method.",
+        [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+    ),
+    "softdesk_http_request_db_queries": (
+        "histogram",
+        "Database queries run by the requests, by view and method.",
+        [0, 1, 2, 5, 10, 20, 50, 100],
+    ),
+    "softdesk_http_response_size_bytes": (
+        "histogram",
+        "Size of the response bodies (not streamed), by view and method.",
+        [100, 1_000, 10_000, 100_000, 1_000_000],
+    ),
+    "softdesk_compression_responses_total": (
+        "counter",
+        "Responses compressed or too small to be compressed.",
+        None,
+    ),
+    "softdesk_compression_bytes_in_total": (
+        "counter",
+        "Bytes of the responses before compression.",
+        None,
+    ),
+    "softdesk_compression_bytes_out_total": (
+        "counter",
+        "Bytes of the responses after compression.",
+        None,
+    ),
+    "softdesk_compression_cpu_seconds_total": (
+        "counter",
+        "CPU time spent compressing responses.",
+        None,
+    ),
+    "softdesk_load_shedding_running": (
+        "gauge",
+        "Requests being served, by request class.",
+        None,
+    ),
+    "softdesk_load_shedding_waiting": (
+        "gauge",
+        "Requests waiting for a slot, by request class.",
+        None,
+    ),
+    "softdesk_load_shedding_admitted_total": (
+        "counter",
+        "Requests admitted, by request class.",
+        None,
+    ),
+    "softdesk_load_shedding_queued_total": (
+        "counter",
+        "Requests that waited for a slot, by request class.",
+        None,
+    ),
+    "softdesk_load_shedding_shed_total": (
+        "counter",
+        "Requests rejected with a 503, by request class.",
+        None,
+    ),
+}
+
+
+def get_setting(name):
+    """Return a METRICS setting."""
+    return getattr(settings, "METRICS", {}).get(name, DEFAULTS[name])
+
+
+class Store:
+    """Metrics recorded by a thread, keyed by (name, labels)."""
+
+    def __init__(self):
+        self.values = defaultdict(float)
+        # counts by bucket (the last one is +Inf), then the sum of the observations
+        self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        self.values[name, labels] += value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            histogram = self.histograms[name, labels] = [0] * (len(buckets) + 2)
+        histogram[bisect.bisect_left(buckets, value)] += 1
+        histogram[-1] += value
+
+
+class Registry:
+    """The stores of the threads of the process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.stores = []
+        self.flush_lock = threading.Lock()
+        self.flushed_time = 0.0
+
+    def get_store(self):
+        """Return the store of the current thread."""
+        store = getattr(self.local, "store", None)
+        if store is None:
+            store = self.local.store = Store()
+            with self.lock:
+                self.stores.append(store)
+        return store
+
+    def collect(self):
+        """Return the metrics of the process, {"values": ..., "histograms": ...}."""
+        values = defaultdict(float)
+        histograms = {}
+        with self.lock:
+            stores = list(self.stores)
+        for store in stores:
+            # copies are atomic, the threads may be recording
+            for key, value in list(store.values.items()):
+                values[key] += value
+            for key, histogram in list(store.histograms.items()):
+                merge_histogram(histograms, key, list(histogram))
+        collect_middleware_stats(values)
+        return {"values": dict(values), "histograms": histograms}
+
+
+registry = Registry()
+
+
+def merge_histogram(histograms, key, histogram):
+    """Add the counts and sum of a histogram to a dict of histograms."""
+    total = histograms.get(key)
+    if total is None:
+        histograms[key] = histogram
+    else:
+        for index, value in enumerate(histogram):
+            total[index] += value
+
+
+def collect_middleware_stats(values):
+    """Add the stats of the compression and load shedding middlewares."""
+    with compression_stats.lock:
+        values[
+            "softdesk_compression_responses_total", (("result", "compressed"),)
+        ] = compression_stats.compressed
+        values[
+            "softdesk_compression_responses_total", (("result", "skipped"),)
+        ] = compression_stats.skipped
+        values["softdesk_compression_bytes_in_total", ()] = compression_stats.bytes_in
+        values["softdesk_compression_bytes_out_total", ()] = compression_stats.bytes_out
+        values[
+            "softdesk_compression_cpu_seconds_total", ()
+        ] = compression_stats.cpu_seconds
+    for stat, classes in load_shedding_stats.snapshot().items():
+        suffix = "" if stat in ("running", "waiting") else "_total"
+        for request_class, value in classes.items():
+            values[
+                f"softdesk_load_shedding_{stat}{suffix}", (("class", request_class),)
+            ] = value
+
+
+def get_process_file(directory, pid):
+    return os.path.join(directory, f"metrics-{pid}.json")
+
+
+def flush():
+    """Write the metrics of the process in the multiprocess directory."""
+    directory = get_setting("MULTIPROCESS_DIRECTORY")
+    if not directory:
+        return
+    with registry.flush_lock:
+        write_process_file(directory)
+
+
+def write_process_file(directory):
+    metrics = registry.collect()
+    data = {
+        "values": [
+            [name, labels, value] for (name, labels), value in metrics["values"].items()
+        ],
+        "histograms": [
+            [name, labels, histogram]
+            for (name, labels), histogram in metrics["histograms"].items()
+        ],
+    }
+    os.makedirs(directory, exist_ok=True)
+    path = get_process_file(directory, os.getpid())
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(data, file)
+    # readers never see a partially written file
+    os.replace(f"{path}.tmp", path)
+    registry.flushed_time = time.monotonic()
+
+
+def flush_if_due():
+    """Flush the metrics if the last flush is older than FLUSH_INTERVAL."""
+    directory = get_setting("MULTIPROCESS_DIRECTORY")
+    if not directory:
+        return
+    if time.monotonic() - registry.flushed_time < get_setting("FLUSH_INTERVAL"):
+        return
+    # a thread already flushing writes the metrics of this request too
+    if not registry.flush_lock.acquire(blocking=False):
+        return
+    try:
+        write_process_file(directory)
+    except OSError:
+        logger.exception("Metrics not written in %s", directory)
+    finally:
+        registry.flush_lock.release()
+
+
+atexit.register(flush)
+
+
+def is_alive(pid):
+    """Return True if a process is running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect_all():
+    """Return the metrics of all the processes (or of this one)."""
+    directory = get_setting("MULTIPROCESS_DIRECTORY")
+    if not directory:
+        return registry.collect()
+    flush()
+    values = defaultdict(float)
+    histograms = {}
+    for entry in os.scandir(directory):
+        if not (entry.name.startswith("metrics-") and entry.name.endswith(".json")):
+            continue
+        pid = int(entry.name[len("metrics-") : -len(".json")])
+        try:
+            with open(entry.path) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            continue
+        # the counters of stopped processes are kept, not their gauges
+        alive = is_alive(pid)
+        for name, labels, value in data["values"]:
+            if alive or METRICS[name][0] != "gauge":
+                values[name, tuple(map(tuple, labels))] += value
+        for name, labels, histogram in data["histograms"]:
+            merge_histogram(histograms, (name, tuple(map(tuple, labels))), histogram)
+    return {"values": dict(values), "histograms": histograms}
+
+
+def escape(value):
+    """Escape a label value."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels, extra=()):
+    if not labels and not extra:
+        return ""
+    pairs = (f'{name}="{escape(value)}"' for name, value in (*labels, *extra))
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_number(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def render(metrics):
+    """Return metrics in the Prometheus text format."""
+    by_name = defaultdict(list)
+    for (name, labels), value in metrics["values"].items():
+        by_name[name].append((labels, value))
+    for (name, labels), histogram in metrics["histograms"].items():
+        by_name[name].append((labels, histogram))
+
+    lines = []
+    for name, (metric_type, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in sorted(by_name[name]):
+            if metric_type != "histogram":
+                lines.append(f"{name}{format_labels(labels)} {format_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip([*buckets, "+Inf"], value[:-1]):
+                cumulative += count
+                le = bound if bound == "+Inf" else format_number(bound)
+                lines.append(
+                    f"{name}_bucket{format_labels(labels, [('le', le)])} {cumulative}"
+                )
+            lines.append(
+                f"{name}_sum{format_labels(labels)} {format_number(value[-1])}"
+            )
+            lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Record the duration, queries and response size of each request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        store = registry.get_store()
+        labels = (
+            ("view", get_view_name(request) or "unresolved"),
+            ("method", request.method),
+        )
+        store.inc(
+            "softdesk_http_requests_total",
+            (*labels, ("status", str(response.status_code))),
+        )
+        store.observe("softdesk_http_request_duration_seconds", labels, duration)
+        store.observe("softdesk_http_request_db_queries", labels, timer.count)
+        # Responses of batched requests are rendered with the batch
+        if not response.streaming and getattr(response, "is_rendered", True):
+            store.observe(
+                "softdesk_http_response_size_bytes", labels, len(response.content)
+            )
+        flush_if_due()
+        return response
+
+
+def is_allowed(request):
+    """Return whether the client can read the metrics."""
+    if get_setting("PUBLIC"):
+        return True
+    token = get_setting("AUTH_TOKEN")
+    if token and request.headers.get("Authorization") == f"Bearer {token}":
+        return True
+    return request.META.get("REMOTE_ADDR") in get_setting("ALLOWED_IPS")
+
+
+def metrics_view(request):
+    """Return the metrics in the Prometheus text format."""
+    if not is_allowed(request):
+        return HttpResponse(status=401 if get_setting("AUTH_TOKEN") else 403)
+    return HttpResponse(
+        render(collect_all()), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
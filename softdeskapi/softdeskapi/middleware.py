@@ -0,0 +1,395 @@
+"""Project-wide middlewares."""
+import itertools
+import re
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+
+ACCEPT_ENCODING_RE = re.compile(r"^\s*([\w*]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*$")
+
+
+class CompressionStats:
+    """Counters of the compression middleware for the current process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.compressed = 0
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_seconds = 0.0
+
+    def add(self, bytes_in, bytes_out, cpu_seconds):
+        with self.lock:
+            self.compressed += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.cpu_seconds += cpu_seconds
+
+    def add_skipped(self):
+        with self.lock:
+            self.skipped += 1
+
+    @property
+    def bytes_saved(self):
+        return self.bytes_in - self.bytes_out
+
+
+compression_stats = CompressionStats()
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with gzip or deflate, depending on what the client accepts.
+    Unlike django.middleware.gzip.GZipMiddleware, the level, the minimum size and
+    the excluded content types can be configured with the COMPRESSION setting, and
+    the bytes saved and CPU time spent are tracked in compression_stats.
+    Streaming responses are compressed chunk by chunk.
+    """
+
+    DEFAULTS = {
+        "ENCODINGS": ["gzip", "deflate"],  # by order of preference
+        "LEVEL": 6,
+        "MIN_SIZE": 500,  # bytes
+        # already compressed or needing to be sent as soon as produced
+        "EXCLUDED_CONTENT_TYPES": ["application/zip", "image/", "text/event-stream"],
+    }
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = {**self.DEFAULTS, **getattr(settings, "COMPRESSION", {})}
+        self.encodings = config["ENCODINGS"]
+        self.level = config["LEVEL"]
+        self.min_size = config["MIN_SIZE"]
+        self.excluded_content_types = config["EXCLUDED_CONTENT_TYPES"]
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        encoding = self.negotiate(request.headers.get("Accept-Encoding", ""))
+        if not self.should_compress(response):
+            return response
+        # Even if not compressed for this client, the response depends on the header
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self.compress_async_stream(
+                    response.streaming_content, encoding
+                )
+            else:
+                response.streaming_content = self.compress_stream(
+                    response.streaming_content, encoding
+                )
+            del response["Content-Length"]
+        else:
+            if len(response.content) < self.min_size:
+                compression_stats.add_skipped()
+                return response
+            compressed = self.compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                compression_stats.add_skipped()
+                return response
+            response.content = compressed
+            response["Content-Length"] = str(len(response.content))
+
+        # The representation changed, a strong ETag would be wrong (like GZipMiddleware)
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = encoding
+        return response
+
+    def negotiate(self, accept_encoding):
+        """Return the accepted encoding with the highest quality, or None."""
+        qualities = {}
+        for item in accept_encoding.split(","):
+            match = ACCEPT_ENCODING_RE.match(item)
+            if match:
+                name, quality = match.groups()
+                try:
+                    qualities[name.lower()] = float(quality) if quality else 1.0
+                except ValueError:
+                    continue
+        best, best_quality = None, 0.0
+        for encoding in self.encodings:
+            quality = qualities.get(encoding, qualities.get("*", 0.0))
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def should_compress(self, response):
+        """Only successful responses that are not already encoded are compressed."""
+        if response.status_code != 200 or response.has_header("Content-Encoding"):
+            # 304 and 204 have no body, and a 206 is a part of the identity encoding
+            return False
+        content_type = response.get("Content-Type", "")
+        return not any(
+            content_type.startswith(excluded)
+            for excluded in self.excluded_content_types
+        )
+
+    def compressor(self, encoding):
+        """Return a zlib compressor producing gzip or deflate (zlib) data."""
+        wbits = 16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS
+        return zlib.compressobj(self.level, zlib.DEFLATED, wbits)
+
+    def compress(self, content, encoding):
+        """Compress a whole body."""
+        start = time.thread_time()
+        compressor = self.compressor(encoding)
+        compressed = compressor.compress(content) + compressor.flush()
+        compression_stats.add(len(content), len(compressed), time.thread_time() - start)
+        return compressed
+
+    def compress_stream(self, chunks, encoding):
+        """Compress a stream chunk by chunk."""
+        compressor = self.compressor(encoding)
+        bytes_in = bytes_out = 0
+        cpu_seconds = 0.0
+        for chunk in chunks:
+            start = time.thread_time()
+            data = compressor.compress(chunk)
+            cpu_seconds += time.thread_time() - start
+            bytes_in += len(chunk)
+            bytes_out += len(data)
+            if data:
+                yield data
+        start = time.thread_time()
+        data = compressor.flush()
+        cpu_seconds += time.thread_time() - start
+        bytes_out += len(data)
+        compression_stats.add(bytes_in, bytes_out, cpu_seconds)
+        yield data
+
+    async def compress_async_stream(self, chunks, encoding):
+        """Same as compress_stream, for async streaming responses under ASGI."""
+        compressor = self.compressor(encoding)
+        bytes_in = bytes_out = 0
+        cpu_seconds = 0.0
+        async for chunk in chunks:
+            start = time.thread_time()
+            data = compressor.compress(chunk)
+            cpu_seconds += time.thread_time() - start
+            bytes_in += len(chunk)
+            bytes_out += len(data)
+            if data:
+                yield data
+        start = time.thread_time()
+        data = compressor.flush()
+        cpu_seconds += time.thread_time() - start
+        bytes_out += len(data)
+        compression_stats.add(bytes_in, bytes_out, cpu_seconds)
+        yield data
+
+
+# Classes of requests, by order of priority when waiting for a slot
+REQUEST_CLASSES = ["auth", "detail", "write", "list"]
+
+DETAIL_RE = re.compile(r"/\d+/$")
+
+
+class LoadSheddingStats:
+    """Gauges and counters of the load shedding middleware, by request class."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.running = dict.fromkeys(REQUEST_CLASSES, 0)
+        self.waiting = dict.fromkeys(REQUEST_CLASSES, 0)
+        self.admitted = dict.fromkeys(REQUEST_CLASSES, 0)
+        self.queued = dict.fromkeys(REQUEST_CLASSES, 0)
+        self.shed = dict.fromkeys(REQUEST_CLASSES, 0)
+
+    def snapshot(self):
+        """Return a copy of the stats, {name: {request class: value}}."""
+        with self.lock:
+            return {
+                name: dict(getattr(self, name))
+                for name in ("running", "waiting", "admitted", "queued", "shed")
+            }
+
+
+load_shedding_stats = LoadSheddingStats()
+
+
+class ConcurrencyLimiter:
+    """
+    Slots of concurrent requests, limited by request class and in total. Requests
+    without a free slot wait in a bounded queue of their class, for at most max_wait
+    seconds. When slots are freed, the waiting requests of the classes with the
+    highest priority are admitted first (in arrival order within a class).
+    """
+
+    def __init__(self, limits, max_concurrent, queue_size, max_wait):
+        self.limits = limits
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.condition = threading.Condition()
+        self.running = dict.fromkeys(REQUEST_CLASSES, 0)
+        self.waiting = []  # (priority, arrival, request class)
+        self.arrivals = itertools.count()
+
+    def has_slot(self, request_class):
+        return (
+            self.running[request_class] < self.limits[request_class]
+            and sum(self.running.values()) < self.max_concurrent
+        )
+
+    def next_admitted(self):
+        """Return the first waiting request that can run, None if there is none."""
+        for ticket in sorted(self.waiting):
+            if self.has_slot(ticket[2]):
+                return ticket
+        return None
+
+    def update_stats(self, request_class, counter=None):
+        with load_shedding_stats.lock:
+            load_shedding_stats.running[request_class] = self.running[request_class]
+            load_shedding_stats.waiting[request_class] = sum(
+                1 for ticket in self.waiting if ticket[2] == request_class
+            )
+            if counter is not None:
+                getattr(load_shedding_stats, counter)[request_class] += 1
+
+    def acquire(self, request_class, wait=True):
+        """Take a slot, return False if the request is shed."""
+        with self.condition:
+            if not self.waiting and self.has_slot(request_class):
+                self.running[request_class] += 1
+                self.update_stats(request_class, "admitted")
+                return True
+            waiting = sum(1 for ticket in self.waiting if ticket[2] == request_class)
+            if not wait or waiting >= self.queue_size:
+                self.update_stats(request_class, "shed")
+                return False
+
+            ticket = (
+                REQUEST_CLASSES.index(request_class),
+                next(self.arrivals),
+                request_class,
+            )
+            self.waiting.append(ticket)
+            self.update_stats(request_class, "queued")
+            deadline = time.monotonic() + self.max_wait
+            while self.next_admitted() != ticket:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.waiting.remove(ticket)
+                    self.update_stats(request_class, "shed")
+                    # the requests behind this one may be admitted now
+                    self.condition.notify_all()
+                    return False
+                self.condition.wait(remaining)
+            self.waiting.remove(ticket)
+            self.running[request_class] += 1
+            self.update_stats(request_class, "admitted")
+            # another waiting request may fit in a slot of another class
+            self.condition.notify_all()
+            return True
+
+    def release(self, request_class):
+        with self.condition:
+            self.running[request_class] -= 1
+            self.update_stats(request_class)
+            self.condition.notify_all()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(limits, max_concurrent, queue_size, max_wait):
+    """
+    Return the limiter of a configuration, shared by the middleware instances of the
+    process (e.g. the one of the batch endpoint, see softdeskapi/batch.py).
+    """
+    key = (tuple(sorted(limits.items())), max_concurrent, queue_size, max_wait)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = ConcurrencyLimiter(
+                limits, max_concurrent, queue_size, max_wait
+            )
+        return _limiters[key]
+
+
+class LoadSheddingMiddleware:
+    """
+    Limit the number of requests served at the same time, so that bursts of
+    expensive requests (lists) can't take all the worker threads: requests are
+    classified (auth, detail, write or list) and limited by class. Requests without
+    a free slot wait a little, then are rejected with a 503 and a Retry-After header
+    rather than making every request slow. Authentication and detail requests have
+    priority over writes and lists. Under ASGI, where sync middlewares share a thread,
+    requests are rejected without waiting. The requests of a batch are limited one by
+    one, not the batch itself.
+    """
+
+    DEFAULTS = {
+        "LIMITS": {"auth": 8, "detail": 8, "write": 4, "list": 4},
+        "MAX_CONCURRENT": 12,  # all classes, e.g. the worker threads of a process
+        "QUEUE_SIZE": 16,  # waiting requests by class
+        "MAX_WAIT": 1.0,  # seconds
+        "RETRY_AFTER": 1,  # seconds
+        "AUTH_PATHS": ["/api/token/"],
+        # long-lived streams, the admin site and the metrics are not limited, nor
+        # batches (their requests are)
+        "EXEMPT_PATHS": [
+            r"^/admin/",
+            r"^/api/projects/\d+/events/$",
+            r"^/metrics$",
+            r"^/api/batch/$",
+        ],
+    }
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = {**self.DEFAULTS, **getattr(settings, "LOAD_SHEDDING", {})}
+        self.limiter = get_limiter(
+            config["LIMITS"],
+            config["MAX_CONCURRENT"],
+            config["QUEUE_SIZE"],
+            config["MAX_WAIT"],
+        )
+        self.retry_after = config["RETRY_AFTER"]
+        self.auth_paths = tuple(config["AUTH_PATHS"])
+        self.exempt_paths = [re.compile(path) for path in config["EXEMPT_PATHS"]]
+
+    def __call__(self, request):
+        if any(path.search(request.path) for path in self.exempt_paths):
+            return self.get_response(request)
+        request_class = self.get_request_class(request)
+        wait = not isinstance(request, ASGIRequest)
+        if not self.limiter.acquire(request_class, wait=wait):
+            response = JsonResponse(
+                {"detail": "The server is overloaded, please retry later."},
+                status=503,
+            )
+            response["Retry-After"] = str(self.retry_after)
+            return response
+        try:
+            return self.get_response(request)
+        finally:
+            self.limiter.release(request_class)
+
+    def get_request_class(self, request):
+        """Return the class of a request, from its path and method."""
+        if request.path.startswith(self.auth_paths):
+            return "auth"
+        if request.method not in ("GET", "HEAD", "OPTIONS"):
+            return "write"
+        if DETAIL_RE.search(request.path):
+            return "detail"
+        return "list"
@@ -0,0 +1,212 @@
+"""
+Opt-in profiling of single requests. A request is profiled when a staff member
+sends the X-Profile header, or when it is drawn by the PROFILING["SAMPLE_RATE"]
+setting. While the request is served, its stack is sampled every few milliseconds.
+The samples are written in the collapsed-stack format of flame graph tools (one
+"frame;frame;frame weight" line per stack, weights in microseconds), in the
+PROFILING["DIRECTORY"] directory where only the last MAX_FILES profiles are kept.
+
+Each sample is attributed to a phase of the request (authentication, permissions,
+validation, serialization, rendering, orm or view) from the frames of the stack,
+the innermost phase wins (a query run by a validator is orm time). Phases are the
+root frame of the collapsed stacks, and for staff members the time per phase is
+returned in the Server-Timing header.
+"""
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "SAMPLE_RATE": 0.0,  # share of the requests profiled
+    "INTERVAL": 0.005,  # seconds between samples
+    "DIRECTORY": settings.BASE_DIR / "profiles",
+    "MAX_FILES": 200,
+    "HEADER": "X-Profile",
+}
+
+# (module prefix, function names or None for any function) of each phase
+PHASES = [
+    ("orm", "django.db.backends", None),
+    ("orm", "django.db.models.sql", None),
+    ("rendering", "rest_framework.renderers", {"render"}),
+    ("serialization", "rest_framework.serializers", {"to_representation"}),
+    ("validation", "rest_framework.serializers", {"is_valid"}),
+    ("permissions", "rest_framework.views", {"check_permissions"}),
+    ("permissions", "rest_framework.views", {"check_object_permissions"}),
+    ("authentication", "rest_framework.views", {"perform_authentication"}),
+]
+
+SLUG_RE = re.compile(r"[^\w]+")
+
+
+def get_setting(name):
+    """Return a PROFILING setting."""
+    return getattr(settings, "PROFILING", {}).get(name, DEFAULTS[name])
+
+
+def get_frame_name(frame):
+    """Return the module and qualified name of the function of a frame."""
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}.{code.co_qualname}"
+
+
+def get_phase(frames):
+    """Return the phase of a stack (from the innermost frame to the root)."""
+    for frame in frames:
+        module = frame.f_globals.get("__name__", "")
+        for phase, prefix, names in PHASES:
+            if module.startswith(prefix) and (
+                names is None or frame.f_code.co_name in names
+            ):
+                return phase
+    return "view"
+
+
+class Sampler:
+    """
+    Record the stack of the current thread at most every interval, from a profile
+    hook (sys.setprofile) called on function calls and returns. Unlike a sampling
+    thread, samples are not biased towards the moments the GIL is released (I/O).
+    Each sample weighs the time elapsed since the previous one, in microseconds.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.phases = Counter()
+        self.previous_profile = None
+        self.last_time = None
+
+    def start(self):
+        self.previous_profile = sys.getprofile()
+        self.last_time = time.perf_counter()
+        sys.setprofile(self.profile)
+
+    def stop(self):
+        sys.setprofile(self.previous_profile)
+
+    def profile(self, frame, event, arg):
+        now = time.perf_counter()
+        if now - self.last_time < self.interval:
+            return
+        weight = round((now - self.last_time) * 1_000_000)
+        self.last_time = now
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        phase = get_phase(frames)
+        self.phases[phase] += weight
+        names = [get_frame_name(frame) for frame in reversed(frames)]
+        self.stacks[";".join([phase, *names])] += weight
+
+    def get_timings(self):
+        """Return the milliseconds spent in each phase."""
+        return {phase: weight / 1000 for phase, weight in self.phases.most_common()}
+
+
+class QueryTimer:
+    """Execute wrapper measuring the time spent in the database (exact)."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def is_staff_request(request):
+    """Return True if the JWT of the request is a staff member's."""
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    if authenticated is None:
+        return False
+    user = authenticated[0]
+    return user.is_staff or user.is_superuser
+
+
+def write_profile(request, sampler, duration):
+    """Write the collapsed stacks of a request and remove the oldest profiles."""
+    directory = get_setting("DIRECTORY")
+    os.makedirs(directory, exist_ok=True)
+    slug = SLUG_RE.sub("-", request.path).strip("-")
+    name = (
+        f"{timezone.now():%Y%m%dT%H%M%S.%f}-{request.method}-{slug}-"
+        f"{duration * 1000:.0f}ms.folded"
+    )
+    with open(os.path.join(directory, name), "w") as file:
+        for stack, count in sampler.stacks.most_common():
+            file.write(f"{stack} {count}\n")
+    profiles = sorted(
+        entry.path for entry in os.scandir(directory) if entry.name.endswith(".folded")
+    )
+    for path in profiles[: -get_setting("MAX_FILES")]:
+        os.remove(path)
+    return name
+
+
+class ProfilingMiddleware:
+    """Profile the requests asked by staff members, and a sample of the others."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        header = request.headers.get(get_setting("HEADER"))
+        staff = header is not None and is_staff_request(request)
+        if not staff and random.random() >= get_setting("SAMPLE_RATE"):
+            return self.get_response(request)
+
+        sampler = Sampler(get_setting("INTERVAL"))
+        timer = QueryTimer()
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timer))
+                response = self.get_response(request)
+        finally:
+            sampler.stop()
+        duration = time.perf_counter() - start
+        try:
+            name = write_profile(request, sampler, duration)
+        except OSError:
+            logger.exception(
+                "Profile of %s %s not written", request.method, request.path
+            )
+            name = None
+        if staff:
+            timings = [
+                f"total;dur={duration * 1000:.1f}",
+                f'db;dur={timer.duration * 1000:.1f};desc="{timer.count} queries"',
+                *(
+                    f"{phase};dur={ms:.1f}"
+                    for phase, ms in sampler.get_timings().items()
+                ),
+            ]
+            response["Server-Timing"] = ", ".join(timings)
+            if name is not None:
+                response["X-Profile-File"] = name
+        return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,12 +45,18 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "softdeskapi.metrics.MetricsMiddleware",
+    "softdeskapi.middleware.LoadSheddingMiddleware",
+    "softdeskapi.profiling.ProfilingMiddleware",
+    "softdeskapi.slow_queries.SlowQueryMiddleware",
+    "softdeskapi.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "projects_manager.middleware.RequestLoaderMiddleware",
 ]
 
 ROOT_URLCONF = "softdeskapi.urls"
@@ -80,9 +87,30 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Each request runs in a transaction, so the change log is written with the
+        # changes it describes
+        "ATOMIC_REQUESTS": True,
+        # Persistent connections (seconds, 0 to close them after each request), the
+        # connection opened at warm-up is only reused if they are enabled
+        "CONN_MAX_AGE": int(os.environ.get("SOFTDESK_CONN_MAX_AGE", "0")),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Projects sharding (see projects_manager/sharding.py). Set SOFTDESK_SHARDS to spread
+# the projects over several SQLite files (db.sqlite3, shard1.sqlite3...), then run
+# the init_shards command
+SHARDS_COUNT = int(os.environ.get("SOFTDESK_SHARDS", "1"))
+for index in range(1, SHARDS_COUNT):
+    DATABASES[f"shard{index}"] = {
+        **DATABASES["default"],
+        "NAME": BASE_DIR / f"shard{index}.sqlite3",
+    }
+PROJECT_SHARDS = ["default", *(f"shard{index}" for index in range(1, SHARDS_COUNT))]
+# Ids owned by each shard: shard n stores the ids from n * PROJECT_SHARD_ID_SPAN + 1
+PROJECT_SHARD_ID_SPAN = 10**12
+DATABASE_ROUTERS = ["projects_manager.sharding.ShardRouter"]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -135,3 +163,117 @@ REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 6,
 }
+
+SIMPLE_JWT = {
+    # rejects revoked refresh tokens (see users/revocation.py)
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.TokenRefreshSerializer",
+}
+
+# Filter of the revoked refresh tokens, rebuilt from the database every
+# REBUILD_INTERVAL seconds (see users/revocation.py)
+TOKEN_REVOCATION = {
+    "REBUILD_INTERVAL": 60,
+    "FALSE_POSITIVE_RATE": 0.01,
+}
+
+# In-process background jobs (see softdeskapi/tasks.py). Set EAGER to True to run the
+# jobs right away, in the request thread (useful for tests)
+BACKGROUND_TASKS = {
+    "WORKERS": 4,
+    "EAGER": False,
+}
+
+# Notifications outbox (see projects_manager/notifications.py)
+NOTIFICATIONS = {
+    "BACKEND": "projects_manager.notifications.log_backend",
+    "MAX_ATTEMPTS": 5,
+    "RETRY_DELAY": 30,
+    "BATCH_SIZE": 100,
+}
+
+# Server-sent events streams of projects (see projects_manager/events.py)
+EVENT_STREAMS = {
+    "QUEUE_SIZE": 100,
+    "HEARTBEAT": 15,
+    "MAX_DURATION": 300,
+}
+
+# Idempotency-Key header of POST requests (see projects_manager/idempotency.py)
+IDEMPOTENCY = {
+    "TTL": 24 * 3600,  # seconds a response can be replayed
+}
+
+# Batch endpoint (see softdeskapi/batch.py)
+BATCH = {
+    "MAX_REQUESTS": 20,
+    "WORKERS": 4,
+}
+
+# Profiling of requests (see softdeskapi/profiling.py): staff members send the X-Profile
+# header, a share of the other requests can be sampled
+PROFILING = {
+    "SAMPLE_RATE": 0.0,
+    "INTERVAL": 0.005,
+    "DIRECTORY": BASE_DIR / "profiles",
+    "MAX_FILES": 200,
+}
+
+# Set SOFTDESK_METRICS_DIR when running several worker processes (see
+# softdeskapi/metrics.py)
+METRICS = {
+    "MULTIPROCESS_DIRECTORY": os.environ.get("SOFTDESK_METRICS_DIR") or None,
+    "FLUSH_INTERVAL": 1.0,
+    "AUTH_TOKEN": os.environ.get("SOFTDESK_METRICS_TOKEN") or None,
+    "ALLOWED_IPS": os.environ.get(
+        "SOFTDESK_METRICS_ALLOWED_IPS", "127.0.0.1,::1"
+    ).split(","),
+    "PUBLIC": os.environ.get("SOFTDESK_METRICS_PUBLIC", "0") == "1",
+}
+
+# Queries slower than THRESHOLD milliseconds are logged in LOG_FILE with their plan
+SLOW_QUERIES = {
+    "THRESHOLD": 200,
+    "LOG_FILE": BASE_DIR / "slow_queries.log",
+    "MAX_BYTES": 10 * 1024 * 1024,
+    "BACKUP_COUNT": 3,
+    "EXPLAIN": True,
+}
+
+# Number of rows processed per transaction when deleting a user in the background
+USER_DELETION_CHUNK_SIZE = 500
+# Seconds without progress after which a deletion job is considered stopped with its
+# process, and resumed (see the resume_user_deletions command)
+USER_DELETION_STALE_AFTER = 600
+
+# Responses compression (see softdeskapi/middleware.py)
+COMPRESSION = {
+    "ENCODINGS": ["gzip", "deflate"],
+    "LEVEL": 6,
+    "MIN_SIZE": 500,
+    "EXCLUDED_CONTENT_TYPES": ["application/zip", "image/", "text/event-stream"],
+}
+
+# Requests served at the same time, by class (see softdeskapi/middleware.py)
+LOAD_SHEDDING = {
+    "LIMITS": {"auth": 8, "detail": 8, "write": 4, "list": 4},
+    "MAX_CONCURRENT": 12,
+    "QUEUE_SIZE": 16,
+    "MAX_WAIT": 1.0,
+    "RETRY_AFTER": 1,
+}
+
+# Issues order in the backlog of projects (see projects_manager/ranking.py): the
+# ranks of a project are spread again when a rank is longer than MAX_LENGTH
+RANKING = {
+    "MAX_LENGTH": 12,
+}
+
+# Warm up workers when the WSGI/ASGI application is loaded (see softdeskapi/warmup.py)
+WARMUP_ON_STARTUP = os.environ.get("SOFTDESK_WARMUP", "1") == "1"
+
+# How long the user directory results are cached, in seconds
+USER_DIRECTORY_CACHE_TIMEOUT = 30
+
+# How long the size of a personal data export is cached (by ETag) for resumed
+# downloads, in seconds
+USER_EXPORT_SIZE_CACHE_TIMEOUT = 24 * 60 * 60
@@ -0,0 +1,212 @@
+"""
+Slow query log. SlowQueryMiddleware wraps the execution of the queries of each
+request (on every database): queries slower than SLOW_QUERIES["THRESHOLD"] (in
+milliseconds) are written as JSON lines in SLOW_QUERIES["LOG_FILE"] (rotated), with
+their normalized SQL and its fingerprint, the parameters, the view and the frame
+of the project's code running the query, and the query plan (EXPLAIN) of SELECTs.
+Run `python manage.py slow_queries` to see them aggregated by fingerprint.
+"""
+import hashlib
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from contextlib import ExitStack
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.db import connections, DatabaseError
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "THRESHOLD": 200,  # milliseconds
+    "LOG_FILE": settings.BASE_DIR / "slow_queries.log",
+    "MAX_BYTES": 10 * 1024 * 1024,
+    "BACKUP_COUNT": 3,
+    "EXPLAIN": True,
+}
+
+# Modules of the project, to find the frame running a query
+PROJECT_MODULES = ("projects_manager.", "users.", "softdeskapi.")
+
+# Modules of the project wrapping the execution of queries or the requests
+# (middlewares, execute wrappers), never the origin of a query
+INSTRUMENTATION_MODULES = (
+    "softdeskapi.batch",
+    "softdeskapi.metrics",
+    "softdeskapi.middleware",
+    "softdeskapi.profiling",
+    "softdeskapi.slow_queries",
+)
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_RE = re.compile(r"%s|\?")
+LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+SPACE_RE = re.compile(r"\s+")
+
+_log_file = None
+_log_file_lock = threading.Lock()
+_explaining = threading.local()
+
+
+def get_setting(name):
+    """Return a SLOW_QUERIES setting."""
+    return getattr(settings, "SLOW_QUERIES", {}).get(name, DEFAULTS[name])
+
+
+def normalize(sql):
+    """Return the SQL with values replaced by ? and lists of values collapsed."""
+    sql = STRING_RE.sub("?", sql)
+    sql = NUMBER_RE.sub("?", sql)
+    sql = PLACEHOLDER_RE.sub("?", sql)
+    sql = LIST_RE.sub("(...)", sql)
+    return SPACE_RE.sub(" ", sql).strip()
+
+
+def get_fingerprint(normalized_sql):
+    """Return a short hash identifying queries with the same normalized SQL."""
+    return hashlib.sha1(normalized_sql.encode()).hexdigest()[:12]
+
+
+def get_origin():
+    """
+    Return the innermost frame of the project's code, as module.function:line,
+    skipping the instrumentation the query went through.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith(PROJECT_MODULES) and module not in INSTRUMENTATION_MODULES:
+            return f"{module}.{frame.f_code.co_qualname}:{frame.f_lineno}"
+        frame = frame.f_back
+    return None
+
+
+def get_view_name(request):
+    """Return the view (and action of viewsets) serving a request."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return None
+    view_class = getattr(match.func, "cls", None)
+    if view_class is None:
+        return match._func_path
+    action = getattr(match.func, "actions", {}).get(request.method.lower())
+    return f"{view_class.__name__}.{action}" if action else view_class.__name__
+
+
+def explain(connection, sql, params):
+    """Return the query plan of a SELECT, None if it can't be explained."""
+    if not sql.lstrip().upper().startswith("SELECT"):
+        return None
+    _explaining.active = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+            return "\n".join(str(row[-1]) for row in cursor.fetchall())
+    except DatabaseError as error:
+        return f"EXPLAIN failed: {error}"
+    finally:
+        _explaining.active = False
+
+
+def get_log_file():
+    """Return the handler of the log file, opened on first use."""
+    global _log_file
+    with _log_file_lock:
+        if _log_file is None:
+            _log_file = RotatingFileHandler(
+                get_setting("LOG_FILE"),
+                maxBytes=get_setting("MAX_BYTES"),
+                backupCount=get_setting("BACKUP_COUNT"),
+            )
+            _log_file.setFormatter(logging.Formatter("%(message)s"))
+        return _log_file
+
+
+def write(entry):
+    """Append an entry to the log file."""
+    record = logging.LogRecord(
+        __name__, logging.WARNING, "", 0, json.dumps(entry, default=str), None, None
+    )
+    get_log_file().handle(record)
+
+
+class SlowQueryRecorder:
+    """Execute wrapper recording the slow queries of a request."""
+
+    def __init__(self, request):
+        self.request = request
+        self.threshold = get_setting("THRESHOLD") / 1000
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_explaining, "active", False):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = time.perf_counter() - start
+        if duration >= self.threshold:
+            self.record(sql, params, many, context["connection"], duration)
+        return result
+
+    def record(self, sql, params, many, connection, duration):
+        normalized = normalize(sql)
+        entry = {
+            "time": timezone.now().isoformat(),
+            "duration_ms": round(duration * 1000, 1),
+            "fingerprint": get_fingerprint(normalized),
+            "sql": normalized,
+            "params": repr(params)[:500],
+            "database": connection.alias,
+            "view": get_view_name(self.request),
+            "origin": get_origin(),
+            "plan": None,
+        }
+        if get_setting("EXPLAIN") and not many:
+            entry["plan"] = explain(connection, sql, params)
+        logger.warning(
+            "Slow query (%.1fms) in %s: %s",
+            entry["duration_ms"],
+            entry["view"],
+            normalized[:200],
+        )
+        try:
+            write(entry)
+        except OSError:
+            logger.exception("Slow query not written to the log file")
+
+
+class SlowQueryMiddleware:
+    """Record the slow queries run while serving requests."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = SlowQueryRecorder(request)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            return self.get_response(request)
+
+
+def read_entries():
+    """Yield the entries of the log file and of its backups."""
+    path = str(get_setting("LOG_FILE"))
+    paths = [
+        f"{path}.{index}" for index in range(get_setting("BACKUP_COUNT"), 0, -1)
+    ] + [path]
+    for path in paths:
+        try:
+            with open(path) as file:
+                for line in file:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            continue
@@ -0,0 +1,64 @@
+"""
+Minimal in-process background job queue. Jobs run in a thread pool shared by the
+worker process, so requests can return before slow work is done. Jobs must be able
+to run again (they are not persisted here), durable work is kept in the database by
+the callers (e.g. the notifications outbox).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_setting(name):
+    """Return a BACKGROUND_TASKS setting."""
+    defaults = {"WORKERS": 4, "EAGER": False}
+    return getattr(settings, "BACKGROUND_TASKS", {}).get(name, defaults[name])
+
+
+def get_executor():
+    """Return the thread pool of the process, created on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_setting("WORKERS"), thread_name_prefix="softdesk-task"
+            )
+        return _executor
+
+
+def _run(func, args, kwargs):
+    """Run a job and release the database connections of the worker thread."""
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        logger.exception("Background job %s failed", func.__qualname__)
+    finally:
+        connections.close_all()
+
+
+def submit(func, *args, **kwargs):
+    """Run func in the background, or right away if BACKGROUND_TASKS["EAGER"]."""
+    if get_setting("EAGER"):
+        return func(*args, **kwargs)
+    return get_executor().submit(_run, func, args, kwargs)
+
+
+def submit_on_commit(func, *args, **kwargs):
+    """Run func in the background once the current transaction is committed."""
+    transaction.on_commit(lambda: submit(func, *args, **kwargs))
+
+
+def submit_later(delay, func, *args, **kwargs):
+    """Run func in the background after delay seconds."""
+    timer = threading.Timer(delay, submit, args=(func, *args), kwargs=kwargs)
+    timer.daemon = True
+    timer.start()
+    return timer
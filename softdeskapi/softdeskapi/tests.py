@@ -0,0 +1,620 @@
+import datetime
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from projects_manager.models import ChangeEvent, Project
+from projects_manager.views import ProjectViewSet
+from softdeskapi import metrics, profiling, slow_queries, warmup
+from softdeskapi.middleware import (
+    CompressionMiddleware,
+    ConcurrencyLimiter,
+    LoadSheddingMiddleware,
+    load_shedding_stats,
+)
+
+User = get_user_model()
+
+
+def create_user(username, **kwargs):
+    """Create an active user who can be contacted."""
+    return User.objects.create_user(
+        username, datetime.date(1990, 1, 1), True, True, "password", **kwargs
+    )
+
+
+class APITestCase(TestCase):
+    """Test case with a client authenticated as a user."""
+
+    def setUp(self):
+        self.user = create_user("author")
+        self.client = self.client_for(self.user)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+
+class SlowQueryTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            SLOW_QUERIES={
+                "THRESHOLD": 0,
+                "LOG_FILE": os.path.join(directory.name, "slow_queries.log"),
+                "EXPLAIN": False,
+            }
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # The log file is opened on first use, with the settings of the test
+        patcher = mock.patch.object(slow_queries, "_log_file", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: slow_queries._log_file.close())
+
+    def test_origin_with_the_middlewares(self):
+        project = Project.objects.create(
+            name="Project", description="Description", type="backend"
+        )
+        project.contributors.add(self.user)
+
+        with self.assertLogs(slow_queries.logger, "WARNING"):
+            response = self.client.get(f"/api/projects/{project.id}/")
+
+        self.assertEqual(response.status_code, 200)
+        entries = list(slow_queries.read_entries())
+        self.assertTrue(entries)
+        self.assertEqual(
+            {entry["view"] for entry in entries}, {"ProjectViewSet.retrieve"}
+        )
+        origins = [entry["origin"] for entry in entries]
+        self.assertTrue(
+            any(origin.startswith("projects_manager.") for origin in origins),
+            origins,
+        )
+        for origin in origins:
+            self.assertFalse(
+                origin.startswith(slow_queries.INSTRUMENTATION_MODULES), origin
+            )
+
+
+class CompressionTests(TestCase):
+    body = b'{"name": "Project"}' * 100
+
+    def get(self, response, accept_encoding="gzip, deflate", **settings):
+        """Return the response of the middleware for a request."""
+        with override_settings(COMPRESSION=settings):
+            middleware = CompressionMiddleware(lambda request: response)
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept_encoding)
+        return middleware(request)
+
+    def test_negotiation(self):
+        middleware = CompressionMiddleware(lambda request: None)
+
+        self.assertEqual(middleware.negotiate("gzip, deflate"), "gzip")
+        self.assertEqual(middleware.negotiate("gzip;q=0.5, deflate"), "deflate")
+        self.assertEqual(middleware.negotiate("br, *;q=0.1"), "gzip")
+        self.assertEqual(middleware.negotiate("gzip;q=0, deflate;q=0"), None)
+        self.assertEqual(middleware.negotiate("br"), None)
+        self.assertEqual(middleware.negotiate(""), None)
+        self.assertEqual(middleware.negotiate("GZIP;q=invalid, deflate"), "deflate")
+
+    def test_gzip(self):
+        response = self.get(HttpResponse(self.body, content_type="application/json"))
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        self.assertEqual(gzip.decompress(response.content), self.body)
+
+    def test_deflate(self):
+        response = self.get(
+            HttpResponse(self.body, content_type="application/json"), "deflate"
+        )
+
+        self.assertEqual(response["Content-Encoding"], "deflate")
+        self.assertEqual(zlib.decompress(response.content), self.body)
+
+    def test_not_accepted(self):
+        response = self.get(HttpResponse(self.body), "identity")
+
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertEqual(response.content, self.body)
+
+    def test_min_size(self):
+        response = self.get(HttpResponse(self.body), MIN_SIZE=len(self.body) + 1)
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+        response = self.get(HttpResponse(self.body), MIN_SIZE=len(self.body))
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_excluded_content_types(self):
+        for content_type in ("application/zip", "image/png", "text/event-stream"):
+            with self.subTest(content_type=content_type):
+                response = self.get(HttpResponse(self.body, content_type=content_type))
+                self.assertFalse(response.has_header("Content-Encoding"))
+                self.assertFalse(response.has_header("Vary"))
+
+        response = self.get(
+            HttpResponse(self.body, content_type="application/json"),
+            EXCLUDED_CONTENT_TYPES=["application/"],
+        )
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_streaming(self):
+        response = StreamingHttpResponse(iter([self.body, self.body]))
+        response["Content-Length"] = str(2 * len(self.body))
+
+        response = self.get(response)
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertFalse(response.has_header("Content-Length"))
+        content = b"".join(response.streaming_content)
+        self.assertEqual(gzip.decompress(content), 2 * self.body)
+
+    def test_weak_etag(self):
+        response = HttpResponse(self.body)
+        response["ETag"] = '"1"'
+
+        self.assertEqual(self.get(response)["ETag"], 'W/"1"')
+
+    def test_partial_and_errors_are_not_compressed(self):
+        for status in (206, 304, 404):
+            with self.subTest(status=status):
+                response = self.get(HttpResponse(self.body, status=status))
+                self.assertFalse(response.has_header("Content-Encoding"))
+
+
+class WarmUpTests(TestCase):
+    databases = "__all__"
+
+    def test_empty_database(self):
+        self.assertFalse(Project.objects.exists())
+
+        with self.assertLogs(warmup.logger, "INFO"):
+            timings = warmup.warm_up()
+
+        self.assertEqual(
+            list(timings), ["urls", "serializers", "authentication", "database"]
+        )
+
+    def test_without_database(self):
+        with self.assertNumQueries(0), self.assertLogs(warmup.logger, "INFO"):
+            timings = warmup.warm_up(database=False)
+
+        self.assertNotIn("database", timings)
+
+    def test_serializers(self):
+        views = warmup.warm_up_urls()
+
+        self.assertIn(ProjectViewSet, {getattr(view, "cls", None) for view in views})
+        self.assertGreater(warmup.warm_up_serializers(views), 0)
+
+
+def perform_create(view, serializer):
+    """Create the project, then fail for the projects named "Failing"."""
+    serializer.save(author=view.request.user)
+    if serializer.validated_data["name"] == "Failing":
+        raise ValidationError("Failed after the project was created.")
+
+
+@override_settings(BATCH={"WORKERS": 1})
+class BatchTests(APITestCase):
+    url = "/api/batch/"
+
+    def create(self, name):
+        """Return the sub-request creating a project."""
+        return {
+            "method": "POST",
+            "path": "/api/projects/",
+            "body": {
+                "name": name,
+                "description": "Description",
+                "type": "backend",
+                "contributors": [self.user.id],
+            },
+        }
+
+    def test_failing_request_is_rolled_back_alone(self):
+        with mock.patch.object(ProjectViewSet, "perform_create", perform_create):
+            response = self.client.post(
+                self.url,
+                [self.create("First"), self.create("Failing"), self.create("Last")],
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result["status"] for result in response.data], [201, 400, 201]
+        )
+        self.assertEqual(
+            sorted(Project.objects.values_list("name", flat=True)), ["First", "Last"]
+        )
+        self.assertEqual(
+            set(ChangeEvent.objects.values_list("model", "object_id")),
+            {
+                ("project", response.data[0]["body"]["id"]),
+                ("project", response.data[2]["body"]["id"]),
+                ("contributor", self.user.id),
+            },
+        )
+
+    def test_reads(self):
+        project = Project.objects.create(
+            name="Project", description="Description", type="backend"
+        )
+        project.contributors.add(self.user)
+
+        response = self.client.post(
+            self.url,
+            [
+                {"method": "GET", "path": f"/api/projects/{project.id}/"},
+                {"method": "GET", "path": "/api/unknown/"},
+                {"method": "GET", "path": f"/api/projects/{project.id + 1}/"},
+            ],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result["status"] for result in response.data], [200, 404, 404]
+        )
+        self.assertEqual(response.data[0]["body"]["name"], "Project")
+
+    def test_invalid_batch(self):
+        response = self.client.post(
+            self.url, [{"method": "GET", "path": "/admin/"}], format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+        with override_settings(BATCH={"MAX_REQUESTS": 1}):
+            response = self.client.post(
+                self.url, [self.create("First"), self.create("Last")], format="json"
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Project.objects.exists())
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(
+            PROFILING={"INTERVAL": 0, "DIRECTORY": self.directory, "MAX_FILES": 2}
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = create_user("author")
+        self.project = Project.objects.create(
+            name="Project", description="Description", type="backend"
+        )
+        self.project.contributors.add(self.user)
+
+    def get(self, user, **headers):
+        """GET the project with a JWT of the user."""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+        return client.get(f"/api/projects/{self.project.id}/", **headers)
+
+    def test_staff_request(self):
+        self.user.is_staff = True
+        self.user.save()
+
+        response = self.get(self.user, HTTP_X_PROFILE="1")
+
+        self.assertEqual(response.status_code, 200)
+        timings = {
+            timing.split(";")[0]: timing
+            for timing in response["Server-Timing"].split(", ")
+        }
+        self.assertIn("total", timings)
+        self.assertIn("queries", timings["db"])
+        self.assertIn("orm", timings)
+        self.assertEqual(os.listdir(self.directory), [response["X-Profile-File"]])
+        with open(os.path.join(self.directory, response["X-Profile-File"])) as file:
+            lines = file.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, weight = line.rsplit(" ", 1)
+            self.assertIn(stack.split(";")[0], timings)
+            self.assertGreater(int(weight), 0)
+
+    def test_header_of_other_users_is_ignored(self):
+        response = self.get(self.user, HTTP_X_PROFILE="1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_sampled_requests(self):
+        with override_settings(
+            PROFILING={"SAMPLE_RATE": 1, "DIRECTORY": self.directory, "MAX_FILES": 2}
+        ):
+            for _ in range(3):
+                response = self.get(self.user)
+
+        self.assertNotIn("Server-Timing", response)
+        # Only the last MAX_FILES profiles are kept
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_get_phase(self):
+        def frame(module, name):
+            return SimpleNamespace(
+                f_globals={"__name__": module}, f_code=SimpleNamespace(co_name=name)
+            )
+
+        view = frame("projects_manager.views", "retrieve")
+        to_representation = frame("rest_framework.serializers", "to_representation")
+        execute = frame("django.db.backends.utils", "execute")
+
+        self.assertEqual(profiling.get_phase([view]), "view")
+        self.assertEqual(
+            profiling.get_phase([to_representation, view]), "serialization"
+        )
+        # The innermost phase wins
+        self.assertEqual(profiling.get_phase([execute, to_representation]), "orm")
+
+
+class ConcurrencyLimiterTests(TestCase):
+    limits = {"auth": 1, "detail": 1, "write": 1, "list": 1}
+
+    def test_limits_by_class(self):
+        limiter = ConcurrencyLimiter(self.limits, 3, 0, 0)
+
+        self.assertTrue(limiter.acquire("list"))
+        self.assertFalse(limiter.acquire("list"))
+        self.assertTrue(limiter.acquire("detail"))
+        self.assertTrue(limiter.acquire("write"))
+        # All the classes together
+        self.assertFalse(limiter.acquire("auth"))
+        limiter.release("list")
+        self.assertTrue(limiter.acquire("auth"))
+
+    def test_queue(self):
+        limiter = ConcurrencyLimiter(self.limits, 1, 1, 5)
+        self.assertTrue(limiter.acquire("detail"))
+        admitted = []
+
+        def acquire(request_class):
+            self.assertTrue(limiter.acquire(request_class))
+            admitted.append(request_class)
+            limiter.release(request_class)
+
+        threads = [
+            threading.Thread(target=acquire, args=(request_class,))
+            for request_class in ("list", "auth")
+        ]
+        for waiting, thread in enumerate(threads, 1):
+            thread.start()
+            while len(limiter.waiting) < waiting:
+                time.sleep(0.001)
+        # The queue of each class is full
+        self.assertFalse(limiter.acquire("list"))
+        self.assertFalse(limiter.acquire("auth", wait=False))
+        limiter.release("detail")
+        for thread in threads:
+            thread.join()
+
+        # Authentication requests have priority over lists
+        self.assertEqual(admitted, ["auth", "list"])
+        self.assertEqual(limiter.waiting, [])
+
+    def test_max_wait(self):
+        limiter = ConcurrencyLimiter(self.limits, 1, 1, 0.01)
+        self.assertTrue(limiter.acquire("list"))
+
+        self.assertFalse(limiter.acquire("detail"))
+        self.assertEqual(limiter.waiting, [])
+
+
+class LoadSheddingTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        settings = override_settings(
+            LOAD_SHEDDING={
+                "LIMITS": {"auth": 1, "detail": 1, "write": 1, "list": 1},
+                "MAX_CONCURRENT": 4,
+                "QUEUE_SIZE": 0,
+                "MAX_WAIT": 0.01,
+                "RETRY_AFTER": 5,
+            }
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.project = Project.objects.create(
+            name="Project", description="Description", type="backend", author=self.user
+        )
+        self.project.contributors.add(self.user)
+        self.limiter = LoadSheddingMiddleware(None).limiter
+        # A list request is running
+        self.assertTrue(self.limiter.acquire("list"))
+        self.addCleanup(self.limiter.release, "list")
+
+    def test_queue_overflow(self):
+        shed = load_shedding_stats.snapshot()["shed"]["list"]
+
+        response = self.client.get("/api/projects/")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "5")
+        self.assertEqual(
+            response.json(), {"detail": "The server is overloaded, please retry later."}
+        )
+        self.assertEqual(load_shedding_stats.snapshot()["shed"]["list"], shed + 1)
+
+    def test_other_classes(self):
+        response = self.client.get(f"/api/projects/{self.project.id}/")
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.patch(
+            f"/api/projects/{self.project.id}/", {"name": "Renamed"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.limiter.running["write"], 0)
+
+    def test_request_classes(self):
+        middleware = LoadSheddingMiddleware(None)
+        factory = RequestFactory()
+
+        for request, request_class in [
+            (factory.post("/api/token/"), "auth"),
+            (factory.get("/api/projects/1/"), "detail"),
+            (factory.delete("/api/projects/1/"), "write"),
+            (factory.get("/api/projects/1/issues/"), "list"),
+        ]:
+            with self.subTest(path=request.path, method=request.method):
+                self.assertEqual(middleware.get_request_class(request), request_class)
+
+
+@override_settings(METRICS={})
+class MetricsTests(APITestCase):
+    url = "/metrics"
+
+    def test_allowed_ips(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        response = self.client.get(self.url, REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 403)
+
+        with override_settings(METRICS={"ALLOWED_IPS": ["10.0.0.1"]}):
+            response = self.client.get(self.url, REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS={"AUTH_TOKEN": "secret"})
+    def test_token(self):
+        client = APIClient(REMOTE_ADDR="10.0.0.1")
+
+        self.assertEqual(client.get(self.url).status_code, 401)
+        response = client.get(self.url, HTTP_AUTHORIZATION="Bearer other")
+        self.assertEqual(response.status_code, 401)
+        response = client.get(self.url, HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS={"PUBLIC": True, "ALLOWED_IPS": []})
+    def test_public(self):
+        response = self.client.get(self.url, REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 200)
+
+    def test_format(self):
+        self.client.get("/api/projects/")
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(
+            response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8"
+        )
+        lines = response.content.decode().splitlines()
+        for name, (metric_type, _, _) in metrics.METRICS.items():
+            self.assertIn(f"# TYPE {name} {metric_type}", lines)
+        labels = 'view="ProjectViewSet.list",method="GET"'
+        self.assertTrue(
+            any(
+                line.startswith(
+                    f'softdesk_http_requests_total{{{labels},status="200"}} '
+                )
+                for line in lines
+            ),
+            lines,
+        )
+        buckets = [
+            line
+            for line in lines
+            if line.startswith(f"softdesk_http_request_db_queries_bucket{{{labels},")
+        ]
+        self.assertTrue(
+            buckets[-1].startswith(
+                f'softdesk_http_request_db_queries_bucket{{{labels},le="+Inf"}} '
+            )
+        )
+        counts = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+        self.assertEqual(counts, sorted(counts))
+        self.assertIn(
+            f"softdesk_http_request_db_queries_count{{{labels}}} {counts[-1]}", lines
+        )
+
+    def test_render(self):
+        text = metrics.render(
+            {
+                "values": {
+                    ("softdesk_http_requests_total", (("view", 'a"b'),)): 2.0,
+                    ("softdesk_compression_cpu_seconds_total", ()): 0.5,
+                },
+                "histograms": {
+                    ("softdesk_http_response_size_bytes", ()): [
+                        1,
+                        0,
+                        2,
+                        0,
+                        0,
+                        1,
+                        12345,
+                    ],
+                },
+            }
+        )
+
+        lines = text.splitlines()
+        self.assertIn('softdesk_http_requests_total{view="a\\"b"} 2', lines)
+        self.assertIn("softdesk_compression_cpu_seconds_total 0.5", lines)
+        self.assertEqual(
+            [line for line in lines if line.startswith("softdesk_http_response_size")],
+            [
+                'softdesk_http_response_size_bytes_bucket{le="100"} 1',
+                'softdesk_http_response_size_bytes_bucket{le="1000"} 1',
+                'softdesk_http_response_size_bytes_bucket{le="10000"} 3',
+                'softdesk_http_response_size_bytes_bucket{le="100000"} 3',
+                'softdesk_http_response_size_bytes_bucket{le="1000000"} 3',
+                'softdesk_http_response_size_bytes_bucket{le="+Inf"} 4',
+                "softdesk_http_response_size_bytes_sum 12345",
+                "softdesk_http_response_size_bytes_count 4",
+            ],
+        )
+
+    def test_multiprocess(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # A stopped process: its counters are kept, not its gauges
+        with open(os.path.join(directory.name, "metrics-999999999.json"), "w") as file:
+            json.dump(
+                {
+                    "values": [
+                        ["softdesk_load_shedding_running", [["class", "list"]], 3],
+                        ["softdesk_load_shedding_shed_total", [["class", "list"]], 5],
+                    ],
+                    "histograms": [],
+                },
+                file,
+            )
+
+        with override_settings(METRICS={"MULTIPROCESS_DIRECTORY": directory.name}):
+            collected = metrics.collect_all()
+
+        key = (("class", "list"),)
+        local = metrics.registry.collect()["values"]
+        self.assertEqual(
+            collected["values"]["softdesk_load_shedding_shed_total", key],
+            local["softdesk_load_shedding_shed_total", key] + 5,
+        )
+        self.assertEqual(
+            collected["values"]["softdesk_load_shedding_running", key],
+            local["softdesk_load_shedding_running", key],
+        )
+        self.assertIn(f"metrics-{os.getpid()}.json", os.listdir(directory.name))
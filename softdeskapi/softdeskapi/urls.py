@@ -18,10 +18,17 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from softdeskapi.batch import BatchView
+from softdeskapi.metrics import metrics_view
+from users.views import LogoutView
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path("api/token/logout/", LogoutView.as_view(), name="token_logout"),
+    path("api/batch/", BatchView.as_view(), name="batch"),
+    path("metrics", metrics_view, name="metrics"),
     path("", include("users.urls")),
     path("", include("projects_manager.urls")),
 ]
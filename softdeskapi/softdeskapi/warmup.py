@@ -0,0 +1,101 @@
+"""
+Warm-up of a worker at boot. Without it, the first requests served by a fresh worker
+pay for importing the views, populating the URL resolver, building serializer fields
+and connecting to the database. Called from wsgi.py and asgi.py when the
+WARMUP_ON_STARTUP setting is True.
+"""
+import logging
+import time
+
+from django.db import connections
+from django.urls import get_resolver, URLPattern, URLResolver
+
+logger = logging.getLogger(__name__)
+
+
+def iter_views(patterns):
+    """Yield the view callbacks of the URL patterns, recursively."""
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_views(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            yield pattern.callback
+
+
+def warm_up_urls():
+    """Import all url confs (and so all views) and populate the URL resolver."""
+    resolver = get_resolver()
+    # Accessing reverse_dict populates the resolver of the default language
+    resolver.reverse_dict
+    return list(iter_views(resolver.url_patterns))
+
+
+def warm_up_serializers(views):
+    """Build the fields of the serializers used by the actions of the DRF viewsets."""
+    serializer_classes = set()
+    for view in views:
+        # DRF sets cls, initkwargs and actions on the functions returned by as_view()
+        view_class = getattr(view, "cls", None)
+        for action in getattr(view, "actions", {}).values():
+            viewset = view_class(**view.initkwargs)
+            viewset.action = action
+            try:
+                serializer_classes.add(viewset.get_serializer_class())
+            except (AssertionError, AttributeError):
+                # Views without serializer, or depending on the request
+                continue
+    for serializer_class in serializer_classes:
+        serializer_class().fields
+    return len(serializer_classes)
+
+
+def warm_up_authentication():
+    """Import the authentication classes and the JWT token classes."""
+    from rest_framework.settings import api_settings as drf_settings
+    from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+    drf_settings.DEFAULT_AUTHENTICATION_CLASSES
+    jwt_settings.AUTH_TOKEN_CLASSES
+
+
+def warm_up_database():
+    """
+    Open the database connections and run a trivial query. The connections are kept
+    only if CONN_MAX_AGE allows persistent connections. Connections are per thread:
+    this only helps the thread that runs it, threaded workers (e.g. gunicorn
+    --threads) open a new connection in every other thread anyway. When the
+    application is preloaded before forking (e.g. gunicorn --preload), call this
+    after the fork instead, connections must not be shared between processes.
+    """
+    for connection in connections.all():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+
+def warm_up(database=True):
+    """Run all the warm-up steps and return the time spent in each, in seconds."""
+    timings = {}
+
+    start = time.perf_counter()
+    views = warm_up_urls()
+    timings["urls"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    warm_up_serializers(views)
+    timings["serializers"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    warm_up_authentication()
+    timings["authentication"] = time.perf_counter() - start
+
+    if database:
+        start = time.perf_counter()
+        warm_up_database()
+        timings["database"] = time.perf_counter() - start
+
+    logger.info(
+        "Worker warmed up in %.3fs (%s)",
+        sum(timings.values()),
+        ", ".join(f"{step} {seconds:.3f}s" for step, seconds in timings.items()),
+    )
+    return timings
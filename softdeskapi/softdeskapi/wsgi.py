@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
+from softdeskapi.warmup import warm_up
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "softdeskapi.settings")
 
 application = get_wsgi_application()
+
+if settings.WARMUP_ON_STARTUP:
+    warm_up()
@@ -0,0 +1,224 @@
+"""
+Background deletion and anonymization of users (RGPD). Deleting a prolific user
+in the request would lock the tables for everyone: here the user is deactivated
+right away, then his assignments and memberships are removed and his authorship
+is nulled (delete mode) by chunks, each chunk in its own short transaction, on
+every shard. Steps can be run again, so the jobs stopped with their process are
+resumed (see resume_stale).
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from projects_manager import changes, inbox, sharding, workload
+from projects_manager.models import Project, Contributor, Issue, Comment
+from softdeskapi import tasks
+from users import revocation
+from users.models import UserDeletionJob
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+Assignment = Issue.assignees.through
+
+# Models where the user is the author, in the order they are processed
+AUTHORED = [("projects", Project), ("issues", Issue), ("comments", Comment)]
+
+
+def get_chunk_size():
+    """Return the number of rows processed per transaction."""
+    return getattr(settings, "USER_DELETION_CHUNK_SIZE", 500)
+
+
+def get_stale_after():
+    """Return the seconds without progress after which a job is resumed."""
+    return getattr(settings, "USER_DELETION_STALE_AFTER", 600)
+
+
+def start(user, mode="delete"):
+    """
+    Deactivate the user, revoke his refresh tokens and schedule the deletion job
+    after commit. Return the job, an already pending or running job if there is one
+    (resumed if it is stale).
+    """
+    job = UserDeletionJob.objects.filter(
+        user_id=user.id, status__in=["pending", "running"]
+    ).first()
+    if job is not None:
+        if claim_stale(job.id):
+            tasks.submit_on_commit(run, job.id)
+        return job
+    user.is_active = False
+    user.save(update_fields=["is_active"])
+    revocation.revoke_user(user.id)
+    job = UserDeletionJob.objects.create(user_id=user.id, mode=mode)
+    tasks.submit_on_commit(run, job.id)
+    return job
+
+
+def get_stale_jobs():
+    """Pending or running jobs without progress for USER_DELETION_STALE_AFTER."""
+    stale_time = timezone.now() - datetime.timedelta(seconds=get_stale_after())
+    return UserDeletionJob.objects.filter(
+        status__in=["pending", "running"], updated_time__lt=stale_time
+    )
+
+
+def claim_stale(job_id):
+    """
+    Mark a stale job as resumed, return False if it isn't stale (or was claimed by
+    another process first).
+    """
+    return bool(get_stale_jobs().filter(id=job_id).update(updated_time=timezone.now()))
+
+
+def resume_stale():
+    """
+    Claim the jobs stopped with their process (e.g. by a restart) and return their
+    ids, to run them again.
+    """
+    return [
+        job_id
+        for job_id in get_stale_jobs().values_list("id", flat=True)
+        if claim_stale(job_id)
+    ]
+
+
+def run(job_id):
+    """Run a deletion job, step after step (from where it stopped if resumed)."""
+    job = UserDeletionJob.objects.get(id=job_id)
+    job.status = "running"
+    job.rows_total = job.rows_processed + count_rows(job)
+    job.save(update_fields=["status", "rows_total", "updated_time"])
+    try:
+        process(job)
+    except Exception as error:
+        logger.exception("Deletion job %s failed", job.id)
+        job.status = "failed"
+        job.error = str(error)
+    else:
+        job.status = "done"
+        job.step = ""
+    job.finished_time = timezone.now()
+    job.save(update_fields=["status", "step", "error", "finished_time", "updated_time"])
+
+
+def count_rows(job):
+    """Return the number of rows the job has to process (for progress tracking)."""
+    querysets = [
+        Assignment.objects.filter(user_id=job.user_id),
+        Contributor.objects.filter(user_id=job.user_id),
+    ]
+    if job.mode == "delete":
+        for _, model in AUTHORED:
+            querysets.append(model.objects.filter(author_id=job.user_id))
+    return sum(
+        shard_queryset.count()
+        for queryset in querysets
+        for shard_queryset in sharding.fan_out(queryset)
+    )
+
+
+def process(job):
+    """Remove assignments and memberships, then null authorship or anonymize."""
+    set_step(job, "assignments")
+    process_chunks(job, delete_chunk, Assignment)
+
+    set_step(job, "memberships")
+    process_chunks(job, delete_chunk, Contributor)
+
+    if job.mode == "delete":
+        for step, model in AUTHORED:
+            set_step(job, step)
+            process_chunks(job, null_author_chunk, model)
+        set_step(job, "user")
+        # Nothing references the user anymore, so this is now a quick delete
+        User.objects.filter(id=job.user_id).delete()
+    else:
+        set_step(job, "user")
+        anonymize(job.user_id)
+
+
+def process_chunks(job, process_chunk, model):
+    """Process chunks of rows of model on each shard until there are none left."""
+    for shard in sharding.get_shards():
+        with sharding.use_shard(shard):
+            while process_chunk(job, model):
+                pass
+
+
+def set_step(job, step):
+    """Save the current step of the job."""
+    job.step = step
+    job.save(update_fields=["step", "updated_time"])
+
+
+def add_progress(job, count):
+    """Save the number of rows processed so far."""
+    job.rows_processed += count
+    job.save(update_fields=["rows_processed", "updated_time"])
+
+
+def delete_chunk(job, model):
+    """Delete a chunk of rows of model linked to the user. Return the count."""
+    ids = list(
+        model.objects.filter(user_id=job.user_id).values_list("id", flat=True)[
+            : get_chunk_size()
+        ]
+    )
+    if not ids:
+        return 0
+    with transaction.atomic(using=sharding.get_current()), transaction.atomic():
+        if model is Assignment:
+            # Needed if the user is anonymized, else his workload is deleted with him
+            workload.schedule_assignments(sharding.get_current(), id__in=ids)
+            inbox.schedule_issues(
+                sharding.get_current(),
+                Assignment.objects.filter(id__in=ids).values_list(
+                    "issue_id", flat=True
+                ),
+            )
+        # Contributors deletions send post_delete, which keeps the change log and
+        # the counters of the projects up to date
+        model.objects.filter(id__in=ids).delete()
+    add_progress(job, len(ids))
+    return len(ids)
+
+
+def null_author_chunk(job, model):
+    """Set the author of a chunk of the user's objects to NULL. Return the count."""
+    ids = list(
+        model.objects.filter(author_id=job.user_id).values_list("id", flat=True)[
+            : get_chunk_size()
+        ]
+    )
+    if not ids:
+        return 0
+    with transaction.atomic(using=sharding.get_current()), transaction.atomic():
+        model.objects.filter(id__in=ids).update(author=None, version=F("version") + 1)
+        if model is Issue:
+            inbox.schedule_issues(sharding.get_current(), ids)
+        updated = model.objects.filter(id__in=ids)
+        if model is Comment:
+            updated = updated.select_related("issue")
+        changes.record_many(updated, "update")
+    add_progress(job, len(ids))
+    return len(ids)
+
+
+def anonymize(user_id):
+    """Replace the personal data of the user, his authorship is kept."""
+    user = User.objects.get(id=user_id)
+    user.username = f"deleted-user-{user.id}"
+    # birth_date is required, we keep a placeholder instead
+    user.birth_date = datetime.date(1900, 1, 1)
+    user.can_be_contacted = False
+    user.can_data_be_shared = False
+    user.set_unusable_password()
+    user.save()
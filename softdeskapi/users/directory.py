@@ -0,0 +1,98 @@
+"""
+User directory for assignee pickers: only the users sharing a project with the
+caller, searched by username prefix. The prefix is turned into a range on the
+username (unique, so indexed) and results are cached for a short time because
+autocomplete sends the same queries again and again. The cached results are
+invalidated when users or project memberships change (see users/signals.py).
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from projects_manager import sharding
+from projects_manager.models import Contributor
+from users.serializers import UserListSerializer
+
+User = get_user_model()
+
+MAX_LIMIT = 50
+
+GENERATION_KEY = "user-directory:generation"
+
+
+def get_cache_timeout():
+    """Return how long results are cached, in seconds."""
+    return getattr(settings, "USER_DIRECTORY_CACHE_TIMEOUT", 30)
+
+
+def get_generation():
+    """Return the generation of the cached results, part of their cache keys."""
+    return cache.get_or_set(GENERATION_KEY, time.time_ns(), None)
+
+
+def invalidate():
+    """Invalidate all the cached results, by starting a new generation."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        # Evicted, the new generation must not be the one of the old results
+        cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+def prefix_range(prefix):
+    """
+    Return the (lower, upper) bounds of the usernames starting with prefix, so the
+    index can be used with a range scan (LIKE is case insensitive on SQLite).
+    """
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def get_users(user):
+    """Active users sharing a project with the user (all of them for admins)."""
+    users = User.objects.filter(is_active=True)
+    if user.is_superuser or user.is_staff:
+        return users
+    projects = Contributor.objects.filter(user=user).values("project")
+    collaborators = Contributor.objects.filter(project__in=projects).values_list(
+        "user", flat=True
+    )
+    if sharding.is_enabled():
+        # Users are on the default database, not next to the projects
+        collaborators = {
+            user_id
+            for queryset in sharding.fan_out(collaborators)
+            for user_id in queryset
+        }
+    return users.filter(id__in=collaborators)
+
+
+def search(user, prefix="", after="", limit=20):
+    """
+    Return a page of the directory, ordered by username. `after` is the last
+    username of the previous page (keyset pagination).
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    staff = user.is_staff or user.is_superuser
+    params = f"{user.id}|{staff}|{prefix}|{after}|{limit}"
+    digest = hashlib.sha256(params.encode()).hexdigest()
+    key = f"user-directory:{get_generation()}:{digest}"
+    page = cache.get(key)
+    if page is not None:
+        return page
+
+    users = get_users(user)
+    if prefix:
+        lower, upper = prefix_range(prefix)
+        users = users.filter(username__gte=lower, username__lt=upper)
+    if after:
+        users = users.filter(username__gt=after)
+    users = list(users.order_by("username")[: limit + 1])
+    page = {
+        "results": UserListSerializer(users[:limit], many=True).data,
+        "next_after": users[limit - 1].username if len(users) > limit else None,
+    }
+    cache.set(key, page, get_cache_timeout())
+    return page
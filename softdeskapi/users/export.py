@@ -0,0 +1,255 @@
+"""
+Personal data export (RGPD). The export is a zip archive with one NDJSON file per
+entity type, generated on the fly while it is sent: rows are read with chunked
+iterators and compressed data is sent as soon as it is produced, so memory use
+doesn't depend on the size of the export.
+
+The archive is deterministic (rows ordered by id, fixed timestamps in the zip) so
+an interrupted download can be resumed with a Range request: the archive is
+generated again and the bytes already received are skipped. The size of the archive
+is needed for the Content-Range header: it is cached by ETag when an archive has
+been generated entirely, so it is computed at most once per version of the data.
+The ETag is computed from the exported rows themselves (see get_etag).
+"""
+import hashlib
+import json
+import re
+import zipfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max, Q, Sum
+from django.http import HttpResponse, StreamingHttpResponse
+
+from projects_manager import sharding
+from projects_manager.models import Project, Issue, Comment
+
+CHUNK_SIZE = 1000  # rows fetched per query
+FLUSH_SIZE = 64 * 1024  # bytes buffered before being sent
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+USER_FIELDS = [
+    "id",
+    "username",
+    "birth_date",
+    "can_be_contacted",
+    "can_data_be_shared",
+    "is_active",
+    "created_time",
+]
+PROJECT_FIELDS = ["id", "name", "description", "type", "author", "created_time"]
+ISSUE_FIELDS = [
+    "id",
+    "project",
+    "name",
+    "description",
+    "type",
+    "priority",
+    "status",
+    "author",
+    "created_time",
+]
+COMMENT_FIELDS = ["id", "uuid", "issue", "description", "author", "created_time"]
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class StreamBuffer:
+    """Write-only file object keeping what is written until it is collected."""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        # Without seek(), zipfile writes the archive in streaming mode
+        return self.position
+
+    def flush(self):
+        pass
+
+    def collect(self):
+        """Return the bytes written since the last call."""
+        data = b"".join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+def get_entities(user):
+    """Return the (file name, queryset) of the data exported for the user."""
+    return [
+        (
+            "projects.ndjson",
+            Project.objects.filter(Q(author=user) | Q(contributors=user))
+            .distinct()
+            .values(*PROJECT_FIELDS),
+        ),
+        ("issues.ndjson", Issue.objects.filter(author=user).values(*ISSUE_FIELDS)),
+        (
+            "assignments.ndjson",
+            Issue.objects.filter(assignees=user).values(*ISSUE_FIELDS),
+        ),
+        (
+            "comments.ndjson",
+            Comment.objects.filter(author=user).values(*COMMENT_FIELDS),
+        ),
+    ]
+
+
+def generate(user):
+    """Generate the bytes of the zip archive of the user's data."""
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        info = zipfile.ZipInfo("user.json", date_time=ZIP_DATE_TIME)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        profile = {field: getattr(user, field) for field in USER_FIELDS}
+        archive.writestr(info, json.dumps(profile, cls=DjangoJSONEncoder))
+        yield buffer.collect()
+
+        for name, queryset in get_entities(user):
+            info = zipfile.ZipInfo(name, date_time=ZIP_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(info, mode="w", force_zip64=True) as entry:
+                # Rows of every shard, merged by id
+                for row in sharding.iterate(queryset, chunk_size=CHUNK_SIZE):
+                    entry.write(json.dumps(row, cls=DjangoJSONEncoder).encode())
+                    entry.write(b"\n")
+                    if buffer.size >= FLUSH_SIZE:
+                        yield buffer.collect()
+            yield buffer.collect()
+    # Central directory, written when the archive is closed
+    yield buffer.collect()
+
+
+def get_state(queryset):
+    """
+    Return the number of rows, the last id and the sum of the versions of the rows
+    of a queryset on every shard: every update increments the version of a row, so
+    the state changes with any creation, update or deletion of the rows.
+    """
+    states = []
+    for shard_queryset in sharding.fan_out(queryset.order_by()):
+        state = shard_queryset.aggregate(
+            count=Count("id"), last=Max("id"), versions=Sum("version")
+        )
+        states.append(f"{state['count']}:{state['last']}:{state['versions']}")
+    return ",".join(states)
+
+
+def get_etag(user):
+    """
+    The archive changes when the user or the exported rows change (including the
+    rows of projects he has left since). Changes to other rows don't change the ETag.
+    """
+    profile = "|".join(str(getattr(user, field)) for field in USER_FIELDS)
+    states = "|".join(get_state(queryset) for _, queryset in get_entities(user))
+    digest = hashlib.sha256(f"{profile}|{states}".encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def get_size_cache_key(etag):
+    """Return the cache key of the size of an archive."""
+    return "user-export-size:" + etag.strip('"')
+
+
+def get_size_cache_timeout():
+    """Return how long the size of an archive is cached, in seconds."""
+    return getattr(settings, "USER_EXPORT_SIZE_CACHE_TIMEOUT", 24 * 60 * 60)
+
+
+def generate_and_measure(user, etag):
+    """Generate the archive, caching its size once it has been generated entirely."""
+    size = 0
+    for chunk in generate(user):
+        size += len(chunk)
+        yield chunk
+    cache.set(get_size_cache_key(etag), size, get_size_cache_timeout())
+
+
+def get_size(user, etag):
+    """Return the size of the archive, generated (once) if it is not cached."""
+    size = cache.get(get_size_cache_key(etag))
+    if size is None:
+        size = sum(len(chunk) for chunk in generate_and_measure(user, etag))
+    return size
+
+
+def parse_range(header, total):
+    """
+    Return the (start, end) bytes of a single range header, None to ignore it, or
+    raise ValueError if it can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if start == "":  # suffix range: the last bytes
+        start, end = max(total - int(end), 0), total - 1
+    else:
+        start = int(start)
+        end = min(int(end), total - 1) if end else total - 1
+    if start > end or start >= total:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def slice_stream(chunks, start, end):
+    """Yield only the bytes from start to end (included) of a stream of chunks."""
+    position = 0
+    for chunk in chunks:
+        chunk_end = position + len(chunk)
+        if chunk_end > start and position <= end:
+            yield chunk[max(start - position, 0) : end + 1 - position]
+        position = chunk_end
+        if position > end:
+            break
+
+
+def export_response(request, user):
+    """Return the streaming response of the export, or a part of it for a Range."""
+    etag = get_etag(user)
+    filename = f"softdesk-user-{user.id}.zip"
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    # A resumed download must continue the same archive
+    if range_header and (if_range is None or if_range == etag):
+        total = get_size(user, etag)
+        try:
+            byte_range = parse_range(range_header, total)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{total}"
+            return response
+        if byte_range is not None:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                slice_stream(generate(user), start, end),
+                status=206,
+                content_type="application/zip",
+            )
+            response["Content-Range"] = f"bytes {start}-{end}/{total}"
+            response["Content-Length"] = str(end - start + 1)
+            response["Accept-Ranges"] = "bytes"
+            response["ETag"] = etag
+            response["Content-Disposition"] = f'attachment; filename="{filename}"'
+            return response
+
+    response = StreamingHttpResponse(
+        generate_and_measure(user, etag), content_type="application/zip"
+    )
+    size = cache.get(get_size_cache_key(etag))
+    if size is not None:
+        response["Content-Length"] = str(size)
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
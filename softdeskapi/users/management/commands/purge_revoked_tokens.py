@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from users.revocation import purge_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the revocations of refresh tokens which have expired anyway. Run it "
+        "periodically (e.g. with cron) to keep the revocations table small."
+    )
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(f"{deleted} expired revocation(s) deleted")
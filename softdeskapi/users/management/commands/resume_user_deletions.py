@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from users import deletion
+from users.models import UserDeletionJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Resume the users deletions stopped with their process (pending or running "
+        "without progress for USER_DELETION_STALE_AFTER seconds). Run it after a "
+        "restart, or periodically."
+    )
+
+    def handle(self, *args, **options):
+        job_ids = deletion.resume_stale()
+        for job_id in job_ids:
+            deletion.run(job_id)
+            job = UserDeletionJob.objects.get(id=job_id)
+            self.stdout.write(f"Job {job.id} for user {job.user_id}: {job.status}")
+        self.stdout.write(f"{len(job_ids)} deletion(s) resumed")
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0002_user_is_active"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserDeletionJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("user_id", models.BigIntegerField(db_index=True)),
+                (
+                    "mode",
+                    models.CharField(
+                        choices=[("delete", "Delete"), ("anonymize", "Anonymize")],
+                        default="delete",
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                    ),
+                ),
+                ("step", models.CharField(blank=True, max_length=20)),
+                ("rows_total", models.PositiveIntegerField(default=0)),
+                ("rows_processed", models.PositiveIntegerField(default=0)),
+                ("error", models.TextField(blank=True)),
+                ("created_time", models.DateTimeField(auto_now_add=True)),
+                ("finished_time", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:59
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0003_userdeletionjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RevokedToken",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("jti", models.CharField(blank=True, db_index=True, max_length=255)),
+                ("user_id", models.BigIntegerField(db_index=True)),
+                (
+                    "revoked_time",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("expires_time", models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
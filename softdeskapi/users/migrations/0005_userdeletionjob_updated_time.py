@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 08:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0004_revokedtoken"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userdeletionjob",
+            name="updated_time",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -84,3 +84,56 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     def __str__(self):
         return self.username
+
+
+class UserDeletionJob(models.Model):
+    """
+    Background deletion (or anonymization) of a user. The user is deactivated right
+    away, then his data is processed by chunks (see users/deletion.py).
+    """
+
+    MODES = [
+        ("delete", "Delete"),
+        ("anonymize", "Anonymize"),
+    ]
+
+    STATUS = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+
+    # not a foreign key, the user doesn't exist anymore once deleted
+    user_id = models.BigIntegerField(db_index=True)
+    mode = models.CharField(max_length=10, choices=MODES, default="delete")
+    status = models.CharField(max_length=10, choices=STATUS, default="pending")
+    step = models.CharField(max_length=20, blank=True)
+    rows_total = models.PositiveIntegerField(default=0)
+    rows_processed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_time = models.DateTimeField(auto_now_add=True)
+    # last progress, a pending or running job without progress for a while was
+    # stopped with its process (see deletion.resume_stale)
+    updated_time = models.DateTimeField(auto_now=True)
+    finished_time = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.mode} user {self.user_id} ({self.status})"
+
+
+class RevokedToken(models.Model):
+    """
+    A revoked refresh token (jti), or all the refresh tokens of a user issued until
+    revoked_time (empty jti). Rows are useless once the tokens have expired (see
+    users/revocation.py).
+    """
+
+    jti = models.CharField(max_length=255, blank=True, db_index=True)
+    # not a foreign key, like deletion jobs
+    user_id = models.BigIntegerField(db_index=True)
+    revoked_time = models.DateTimeField(default=timezone.now)
+    expires_time = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"user {self.user_id} {self.jti or 'all tokens'}"
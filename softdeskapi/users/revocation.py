@@ -0,0 +1,163 @@
+"""
+Revocation of refresh tokens. Revoked tokens (by jti), and all the tokens of users
+who logged out everywhere or were deactivated (by user, until a revocation time),
+are stored in the RevokedToken table. Each process keeps a Bloom filter of these
+jtis and users, rebuilt periodically from the table: a refresh token matching
+neither (the common case) is accepted without a query, the table is only read on
+a match (revoked, or a false positive of the filter).
+Revocations made by other processes are seen after their next rebuild.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from users.models import RevokedToken
+
+DEFAULTS = {
+    "REBUILD_INTERVAL": 60,  # seconds
+    "FALSE_POSITIVE_RATE": 0.01,
+    "MIN_CAPACITY": 1024,
+}
+
+
+def get_setting(name):
+    """Return a TOKEN_REVOCATION setting."""
+    return getattr(settings, "TOKEN_REVOCATION", {}).get(name, DEFAULTS[name])
+
+
+class BloomFilter:
+    """Set of strings with false positives but no false negatives."""
+
+    def __init__(self, capacity, false_positive_rate):
+        self.size = math.ceil(
+            -capacity * math.log(false_positive_rate) / math.log(2) ** 2
+        )
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, key):
+        """Return the bits of a key (double hashing)."""
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        """Add a key to the set."""
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self.positions(key)
+        )
+
+
+def token_key(jti):
+    """Return the key of a revoked token in the filter."""
+    return f"jti:{jti}"
+
+
+def user_key(user_id):
+    """Return the key of a user whose tokens were revoked in the filter."""
+    return f"user:{user_id}"
+
+
+class RevocationFilter:
+    """The Bloom filter of the process, rebuilt from the table when too old."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.built_time = 0.0
+
+    def rebuild(self):
+        """Load the revocations not expired yet in a new filter."""
+        rows = RevokedToken.objects.filter(expires_time__gt=timezone.now())
+        keys = [
+            token_key(jti) if jti else user_key(user_id)
+            for jti, user_id in rows.values_list("jti", "user_id").iterator()
+        ]
+        bloom = BloomFilter(
+            # room for the revocations made until the next rebuild
+            max(2 * len(keys), get_setting("MIN_CAPACITY")),
+            get_setting("FALSE_POSITIVE_RATE"),
+        )
+        for key in keys:
+            bloom.add(key)
+        self.bloom = bloom
+        self.built_time = time.monotonic()
+
+    def get(self):
+        """Return the filter, rebuilt if it is older than REBUILD_INTERVAL."""
+        with self.lock:
+            age = time.monotonic() - self.built_time
+            if self.bloom is None or age > get_setting("REBUILD_INTERVAL"):
+                self.rebuild()
+            return self.bloom
+
+    def add(self, key):
+        """Add a revocation made by this process, without waiting for a rebuild."""
+        with self.lock:
+            if self.bloom is not None:
+                self.bloom.add(key)
+
+
+revocation_filter = RevocationFilter()
+
+
+def get_expiry(token):
+    """Return the expiration time of a token."""
+    return datetime.fromtimestamp(token["exp"], tz=dt_timezone.utc)
+
+
+def revoke_token(token):
+    """Revoke a refresh token."""
+    jti = token[jwt_settings.JTI_CLAIM]
+    RevokedToken.objects.create(
+        jti=jti,
+        user_id=token[jwt_settings.USER_ID_CLAIM],
+        expires_time=get_expiry(token),
+    )
+    transaction.on_commit(lambda: revocation_filter.add(token_key(jti)))
+
+
+def revoke_user(user_id):
+    """Revoke all the refresh tokens issued to a user until now."""
+    now = timezone.now()
+    RevokedToken.objects.create(
+        user_id=user_id,
+        revoked_time=now,
+        # every token issued until now has expired by then
+        expires_time=now + jwt_settings.REFRESH_TOKEN_LIFETIME,
+    )
+    transaction.on_commit(lambda: revocation_filter.add(user_key(user_id)))
+
+
+def is_revoked(token):
+    """Return True if a refresh token was revoked."""
+    jti = token[jwt_settings.JTI_CLAIM]
+    user_id = token.get(jwt_settings.USER_ID_CLAIM)
+    bloom = revocation_filter.get()
+    if token_key(jti) not in bloom and user_key(user_id) not in bloom:
+        return False
+    # iat is in seconds: a token issued in the second of a revocation is revoked
+    issued_time = datetime.fromtimestamp(token["iat"], tz=dt_timezone.utc)
+    return RevokedToken.objects.filter(
+        Q(jti=jti) | Q(jti="", user_id=user_id, revoked_time__gte=issued_time)
+    ).exists()
+
+
+def purge_expired():
+    """Delete the revocations of expired tokens, return how many were deleted."""
+    deleted, _ = RevokedToken.objects.filter(expires_time__lte=timezone.now()).delete()
+    return deleted
@@ -1,6 +1,15 @@
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import (
+    TokenRefreshSerializer as BaseTokenRefreshSerializer,
+)
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users import revocation
+from users.models import UserDeletionJob
 
 User = get_user_model()
 
@@ -61,7 +70,11 @@ class UserSerializer(serializers.ModelSerializer):
         password_confirmation = validated_data.pop("password_confirmation", None)
         if password and password_confirmation:
             instance.set_password(password)
-        return super().update(instance, validated_data)
+        deactivated = instance.is_active and validated_data.get("is_active") is False
+        instance = super().update(instance, validated_data)
+        if deactivated:
+            revocation.revoke_user(instance.id)
+        return instance
 
 
 class UserListSerializer(serializers.ModelSerializer):
@@ -70,3 +83,57 @@ class UserListSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ["id", "username"]
+
+
+class UserDeletionJobSerializer(serializers.ModelSerializer):
+    """Serializer for user deletion jobs."""
+
+    class Meta:
+        model = UserDeletionJob
+        fields = "__all__"
+
+
+class TokenRefreshSerializer(BaseTokenRefreshSerializer):
+    """Refresh serializer rejecting revoked refresh tokens (see users/revocation.py)."""
+
+    def validate(self, attrs):
+        """Check the revocations before returning a new access token."""
+        if revocation.is_revoked(self.token_class(attrs["refresh"])):
+            raise InvalidToken("Token is revoked", "token_revoked")
+        return super().validate(attrs)
+
+
+class LogoutSerializer(serializers.Serializer):
+    """
+    Revoke a refresh token of the user, or all of them if all is true (log out from
+    every device).
+    """
+
+    refresh = serializers.CharField(required=False)
+    all = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        """The refresh token is required, and must belong to the user, unless all."""
+        if data["all"]:
+            return data
+        if "refresh" not in data:
+            raise serializers.ValidationError(
+                "refresh must be provided, or all set to true"
+            )
+        try:
+            token = RefreshToken(data["refresh"])
+        except TokenError as error:
+            raise serializers.ValidationError({"refresh": str(error)})
+        # The claim is a string
+        user_id = str(self.context["request"].user.id)
+        if str(token.get(jwt_settings.USER_ID_CLAIM)) != user_id:
+            raise serializers.ValidationError({"refresh": "Token of another user"})
+        data["token"] = token
+        return data
+
+    def save(self):
+        """Revoke the token, or all the tokens of the user."""
+        if self.validated_data["all"]:
+            revocation.revoke_user(self.context["request"].user.id)
+        else:
+            revocation.revoke_token(self.validated_data["token"])
@@ -0,0 +1,26 @@
+"""Signal handlers of users, connected in UsersConfig.ready()."""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from projects_manager.models import Contributor
+from users import directory
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Contributor)
+@receiver(post_delete, sender=Contributor)
+def invalidate_directory(sender, using, **kwargs):
+    """Usernames, active users and memberships are all part of the directory."""
+    transaction.on_commit(directory.invalidate, using=using)
+
+
+@receiver(m2m_changed, sender=Contributor)
+def invalidate_directory_contributors(sender, action, using, **kwargs):
+    """project.contributors.add() and clear() send no post_save or post_delete."""
+    if action in ("post_add", "post_remove", "post_clear"):
+        transaction.on_commit(directory.invalidate, using=using)
@@ -1,3 +1,417 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from projects_manager.models import Project, Contributor, Issue, Comment
+from users import deletion, directory, revocation
+from users.models import RevokedToken, UserDeletionJob
+
+User = get_user_model()
+
+
+def create_user(username, **kwargs):
+    """Create an active user who can be contacted."""
+    return User.objects.create_user(
+        username, datetime.date(1990, 1, 1), True, True, "password", **kwargs
+    )
+
+
+@override_settings(USER_DELETION_CHUNK_SIZE=2)
+class DeletionTests(TestCase):
+    def setUp(self):
+        self.user = create_user("user")
+        self.other = create_user("other")
+        self.project = Project.objects.create(
+            name="Project", description="Description", type="backend", author=self.user
+        )
+        self.project.contributors.add(self.user, self.other)
+        self.issues = [
+            Issue.objects.create(
+                project=self.project,
+                author=self.user,
+                name=f"Issue {i}",
+                description="Description",
+                type="bug",
+                priority="low",
+                status="todo",
+            )
+            for i in range(3)
+        ]
+        for issue in self.issues:
+            issue.assignees.add(self.user, self.other)
+        self.comments = [
+            Comment.objects.create(
+                issue=self.issues[0], author=self.user, description="Comment"
+            )
+            for _ in range(5)
+        ]
+
+    def test_chunks(self):
+        job = UserDeletionJob.objects.create(user_id=self.user.id)
+
+        counts = []
+        while count := deletion.null_author_chunk(job, Comment):
+            counts.append(count)
+        self.assertEqual(counts, [2, 2, 1])
+        self.assertEqual(deletion.delete_chunk(job, deletion.Assignment), 2)
+        self.assertEqual(deletion.delete_chunk(job, deletion.Assignment), 1)
+        self.assertEqual(deletion.delete_chunk(job, deletion.Assignment), 0)
+
+        job.refresh_from_db()
+        self.assertEqual(job.rows_processed, 8)
+        self.assertFalse(Comment.objects.filter(author=self.user).exists())
+        self.assertEqual(
+            list(
+                deletion.Assignment.objects.values_list("user_id", flat=True).distinct()
+            ),
+            [self.other.id],
+        )
+
+    def test_delete(self):
+        job = deletion.start(self.user)
+        self.assertFalse(User.objects.get(id=self.user.id).is_active)
+        self.assertEqual(deletion.start(self.user), job)
+
+        deletion.run(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.step, job.error), ("done", "", ""))
+        # 3 assignments, 1 membership, 1 project, 3 issues and 5 comments
+        self.assertEqual((job.rows_total, job.rows_processed), (13, 13))
+        self.assertFalse(User.objects.filter(id=self.user.id).exists())
+        self.assertEqual(Comment.objects.filter(author=None).count(), 5)
+        self.assertEqual(Issue.objects.filter(author=None).count(), 3)
+        self.assertEqual(
+            list(Contributor.objects.values_list("user_id", flat=True)),
+            [self.other.id],
+        )
+        self.project.refresh_from_db()
+        self.assertIsNone(self.project.author)
+        self.assertEqual(self.project.contributors_count, 1)
+
+    def test_anonymize(self):
+        job = deletion.start(self.user, mode="anonymize")
+
+        deletion.run(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "done")
+        self.assertEqual((job.rows_total, job.rows_processed), (4, 4))
+        user = User.objects.get(id=self.user.id)
+        self.assertEqual(user.username, f"deleted-user-{user.id}")
+        self.assertFalse(user.has_usable_password())
+        self.assertEqual(Comment.objects.filter(author=user).count(), 5)
+        self.assertFalse(Contributor.objects.filter(user=user).exists())
+
+    def stop(self, job):
+        """Process part of a job, as if its process stopped a while ago."""
+        job.status = "running"
+        job.save()
+        deletion.set_step(job, "assignments")
+        deletion.delete_chunk(job, deletion.Assignment)
+        UserDeletionJob.objects.filter(id=job.id).update(
+            updated_time=timezone.now() - datetime.timedelta(hours=1)
+        )
+
+    @override_settings(BACKGROUND_TASKS={"EAGER": True})
+    def test_resume_stale_job(self):
+        job = deletion.start(self.user)
+        self.stop(job)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(deletion.start(self.user), job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "done")
+        self.assertEqual((job.rows_total, job.rows_processed), (13, 13))
+        self.assertFalse(User.objects.filter(id=self.user.id).exists())
+
+    def test_running_job_is_not_resumed(self):
+        job = deletion.start(self.user)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(deletion.start(self.user), job)
+
+        self.assertEqual(callbacks, [])
+        self.assertEqual(deletion.resume_stale(), [])
+
+    def test_resume_command(self):
+        job = deletion.start(self.user, mode="anonymize")
+        self.stop(job)
+        other_job = deletion.start(self.other)
+        output = io.StringIO()
+
+        call_command("resume_user_deletions", stdout=output)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "done")
+        self.assertEqual((job.rows_total, job.rows_processed), (4, 4))
+        other_job.refresh_from_db()
+        self.assertEqual(other_job.status, "pending")
+        self.assertIn("1 deletion(s) resumed", output.getvalue())
+        # Done, there is nothing left to resume
+        self.assertEqual(deletion.resume_stale(), [])
+
+
+class BloomFilterTests(TestCase):
+    def test_no_false_negatives(self):
+        bloom = revocation.BloomFilter(1000, 0.01)
+        keys = [f"jti:{i}" for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(f"user:{i}" in bloom for i in range(10000))
+        # 1% expected, with some margin
+        self.assertLess(false_positives, 200)
+
+    def test_empty(self):
+        bloom = revocation.BloomFilter(1024, 0.01)
+
+        self.assertNotIn("jti:1", bloom)
+        self.assertEqual(bloom.hashes, 7)
+
+
+class RevocationTests(TestCase):
+    def setUp(self):
+        self.user = create_user("user")
+        # A filter of its own, not shared with the other tests
+        patcher = mock.patch.object(
+            revocation, "revocation_filter", revocation.RevocationFilter()
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_revoke_token(self):
+        token = RefreshToken.for_user(self.user)
+        other = RefreshToken.for_user(self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            revocation.revoke_token(token)
+
+        self.assertTrue(revocation.is_revoked(token))
+        self.assertFalse(revocation.is_revoked(other))
+
+    def test_revoke_user(self):
+        before = RefreshToken.for_user(self.user)
+        other_user = RefreshToken.for_user(create_user("other"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            revocation.revoke_user(self.user.id)
+        after = RefreshToken.for_user(self.user)
+        after["iat"] += 1
+
+        self.assertTrue(revocation.is_revoked(before))
+        # Only the tokens issued before the revocation are revoked
+        self.assertFalse(revocation.is_revoked(after))
+        self.assertFalse(revocation.is_revoked(other_user))
+
+    def test_query_only_on_match(self):
+        revoked = RefreshToken.for_user(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            revocation.revoke_token(revoked)
+        revocation.revocation_filter.get()
+
+        with self.assertNumQueries(0):
+            self.assertFalse(revocation.is_revoked(RefreshToken.for_user(self.user)))
+        with self.assertNumQueries(1):
+            self.assertTrue(revocation.is_revoked(revoked))
+
+    def test_rebuild(self):
+        token = RefreshToken.for_user(self.user)
+        revocation.revocation_filter.get()
+        # Revoked by another process, seen after the next rebuild
+        RevokedToken.objects.create(
+            jti=token["jti"],
+            user_id=self.user.id,
+            expires_time=revocation.get_expiry(token),
+        )
+        self.assertFalse(revocation.is_revoked(token))
+
+        with override_settings(TOKEN_REVOCATION={"REBUILD_INTERVAL": 0}):
+            self.assertTrue(revocation.is_revoked(token))
+
+    def test_expired_revocations_are_not_loaded(self):
+        token = RefreshToken.for_user(self.user)
+        RevokedToken.objects.create(
+            jti=token["jti"],
+            user_id=self.user.id,
+            expires_time=timezone.now() - datetime.timedelta(seconds=1),
+        )
+
+        self.assertFalse(revocation.is_revoked(token))
+        self.assertEqual(revocation.purge_expired(), 1)
+
+    def test_refresh_and_logout(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        token = RefreshToken.for_user(self.user)
+
+        response = client.post("/api/token/logout/", {"refresh": str(token)})
+        self.assertEqual(response.status_code, 204)
+
+        response = client.post("/api/token/refresh/", {"refresh": str(token)})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data["code"], "token_revoked")
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_user("user")
+        self.other = create_user("other")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/users/{self.user.id}/export/"
+        self.project = Project.objects.create(
+            name="Project", description="Description", type="backend", author=self.other
+        )
+        self.project.contributors.add(self.user, self.other)
+        self.issue = Issue.objects.create(
+            project=self.project,
+            author=self.user,
+            name="Issue",
+            description="Description",
+            type="bug",
+            priority="low",
+            status="todo",
+        )
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        content = b"".join(response.streaming_content) if response.streaming else b""
+        return response, content
+
+    def test_export(self):
+        response, content = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Content-Length", response)
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            issues = archive.read("issues.ndjson").decode().splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in issues], [self.issue.id])
+        # The size is known once the archive has been generated
+        response, again = self.get()
+        self.assertEqual(again, content)
+        self.assertEqual(response["Content-Length"], str(len(content)))
+        self.assertEqual(response["ETag"], self.get()[0]["ETag"])
+
+    def test_range(self):
+        response, content = self.get()
+        etag = response["ETag"]
+
+        response, part = self.get(HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(part, content[10:20])
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{len(content)}")
+
+        response, part = self.get(HTTP_RANGE="bytes=-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(part, content[-5:])
+
+        # The archive changed, the whole new archive is sent
+        response, part = self.get(HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(part, content)
+
+        response, _ = self.get(HTTP_RANGE=f"bytes={len(content)}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(content)}")
+
+    def test_etag(self):
+        etag = self.get()[0]["ETag"]
+        Project.objects.create(
+            name="Other", description="Description", type="backend", author=self.other
+        )
+        self.assertEqual(self.get()[0]["ETag"], etag)
+
+        # The user left the project, his issue is still exported
+        self.project.contributors.remove(self.user)
+        left_etag = self.get()[0]["ETag"]
+        self.assertNotEqual(left_etag, etag)
+        self.issue.description = "Changed"
+        self.issue.save()
+        self.assertNotEqual(self.get()[0]["ETag"], left_etag)
+
+
+class DirectoryTests(TestCase):
+    url = "/api/users/directory/"
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user("user")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(
+            name="Project", description="Description", type="backend", author=self.user
+        )
+        self.collaborators = [create_user(name) for name in ("alice", "albert", "bob")]
+        self.project.contributors.add(self.user, *self.collaborators)
+        create_user("alfred")  # No common project
+
+    def get_usernames(self, client=None, **params):
+        response = (client or self.client).get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [user["username"] for user in response.data["results"]]
+
+    def test_collaborators_only(self):
+        self.assertEqual(self.get_usernames(), ["albert", "alice", "bob", "user"])
+
+        create_user("inactive", is_active=False)
+        admin = APIClient()
+        admin.force_authenticate(create_user("admin", is_staff=True))
+        self.assertEqual(
+            self.get_usernames(admin),
+            ["admin", "albert", "alfred", "alice", "bob", "user"],
+        )
+
+    def test_prefix_and_pages(self):
+        self.assertEqual(self.get_usernames(q="al"), ["albert", "alice"])
+        self.assertEqual(self.get_usernames(q="b"), ["bob"])
+        self.assertEqual(self.get_usernames(q="z"), [])
+
+        response = self.client.get(self.url, {"limit": 2})
+        self.assertEqual(response.data["next_after"], "alice")
+        self.assertEqual(self.get_usernames(after="alice", limit=2), ["bob", "user"])
+        response = self.client.get(self.url, {"limit": "invalid"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cached(self):
+        page = directory.search(self.user, prefix="al")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(directory.search(self.user, prefix="al"), page)
+
+    def test_invalidation(self):
+        self.assertEqual(self.get_usernames(q="al"), ["albert", "alice"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.project.contributors.add(User.objects.get(username="alfred"))
+        self.assertEqual(self.get_usernames(q="al"), ["albert", "alfred", "alice"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.project.contributors.remove(self.collaborators[0])
+        self.assertEqual(self.get_usernames(q="al"), ["albert", "alfred"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.collaborators[1].is_active = False
+            self.collaborators[1].save()
+        self.assertEqual(self.get_usernames(q="al"), ["alfred"])
+
+    def test_evicted_generation(self):
+        self.get_usernames()
+        cache.delete(directory.GENERATION_KEY)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.project.contributors.remove(*self.collaborators)
+        self.assertEqual(self.get_usernames(), ["user"])
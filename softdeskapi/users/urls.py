@@ -2,10 +2,11 @@
 from django.urls import path, include
 from rest_framework import routers
 
-from users.views import UserViewSet
+from users.views import UserViewSet, UserDeletionJobViewSet
 
 router = routers.SimpleRouter()
 router.register("users", UserViewSet, basename="users")
+router.register("user-deletions", UserDeletionJobViewSet, basename="user-deletions")
 
 urlpatterns = [
     path("api/", include(router.urls)),
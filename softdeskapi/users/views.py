@@ -1,9 +1,23 @@
 from django.contrib.auth import get_user_model
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
+from projects_manager.idempotency import idempotent
+from users import deletion, directory
+from users.export import export_response
+from users.models import UserDeletionJob
 from users.permissions import IsSelfOrAdmin, IsAdmin
-from users.serializers import UserSerializer, UserListSerializer
+from users.serializers import (
+    LogoutSerializer,
+    UserSerializer,
+    UserListSerializer,
+    UserDeletionJobSerializer,
+)
 
 
 class UserViewSet(ModelViewSet):
@@ -27,11 +41,12 @@ class UserViewSet(ModelViewSet):
 
     def get_permissions(self):
         """
-        Any authenticated user can see the list of users. Only admins can create users.
+        Any authenticated user can see the list of users and the directory. Only admins
+        can create users.
         Only the user himself (or admins) can see or update his details, or delete his
         account.
         """
-        if self.action == "list":
+        if self.action in ("list", "directory"):
             self.permission_classes = [IsAuthenticated]
         elif self.action == "create":
             self.permission_classes = [IsAdmin]
@@ -39,6 +54,11 @@ class UserViewSet(ModelViewSet):
             self.permission_classes = [IsSelfOrAdmin]
         return super().get_permissions()
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        """Handle POST request, replayed if the Idempotency-Key was already used."""
+        return super().create(request, *args, **kwargs)
+
     def update(self, request, *args, **kwargs):
         """Override to prevent non admin users to change is_staff field."""
         if not request.user.is_superuser and not request.user.is_staff:
@@ -50,3 +70,66 @@ class UserViewSet(ModelViewSet):
         if not request.user.is_superuser and not request.user.is_staff:
             request.data.pop("is_staff", None)
         return super().partial_update(request, *args, **kwargs)
+
+    @action(detail=False, methods=["get"])
+    def directory(self, request):
+        """
+        Users sharing a project with the user, ordered by username. Use ?q= to search
+        by username prefix and ?after= with the next_after value to get the next page.
+        """
+        try:
+            limit = int(request.query_params.get("limit", 20))
+        except ValueError:
+            raise ValidationError("limit must be an integer")
+        return Response(
+            directory.search(
+                request.user,
+                prefix=request.query_params.get("q", ""),
+                after=request.query_params.get("after", ""),
+                limit=limit,
+            )
+        )
+
+    @action(detail=True, methods=["get"])
+    def export(self, request, pk=None):
+        """
+        Export the user's data (profile, projects, issues, assignments and comments)
+        as a zip archive streamed while it is generated. Range requests are supported
+        to resume an interrupted download.
+        """
+        return export_response(request, self.get_object())
+
+    def destroy(self, request, *args, **kwargs):
+        """
+        The user is deactivated right away and his data is deleted in the background.
+        With ?mode=anonymize, his personal data is replaced instead and what he
+        created is kept. Return the deletion job to follow its progress.
+        """
+        mode = request.query_params.get("mode", "delete")
+        if mode not in dict(UserDeletionJob.MODES):
+            raise ValidationError("Valid modes are: 'delete', 'anonymize'")
+        job = deletion.start(self.get_object(), mode)
+        return Response(
+            UserDeletionJobSerializer(job).data, status=status.HTTP_202_ACCEPTED
+        )
+
+
+class UserDeletionJobViewSet(ReadOnlyModelViewSet):
+    """Progress of the users deletions, for admins."""
+
+    queryset = UserDeletionJob.objects.order_by("-id")
+    serializer_class = UserDeletionJobSerializer
+    permission_classes = [IsAdmin]
+
+
+class LogoutView(APIView):
+    """
+    Revoke the refresh token given, or all the refresh tokens of the user with
+    {"all": true}. Access tokens stay valid until they expire (a few minutes).
+    """
+
+    def post(self, request):
+        serializer = LogoutSerializer(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(status=status.HTTP_204_NO_CONTENT)